@@ -13,4 +13,19 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+if os.environ.get('DJANGO_WARM_UP'):
+    from core.warmup import warm_up
+
+    warm_up()
+
+from recipe.events import EVENTS_PATH, events_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Serve the recipe change events, and Django for everything else."""
+    if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        await events_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -48,10 +48,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.StatementTimeoutMiddleware',
+    'core.middleware.SlowQueryMiddleware',
+    'core.middleware.LoadSheddingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,13 +84,19 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Milliseconds after which Postgres cancels a statement of a request, so
+# no request holds a connection forever; 0 disables it. Set per request by
+# core.middleware.StatementTimeoutMiddleware, so migrations, commands and
+# jobs run without it.
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
-        'PASSWORD': os.environ.get('DB_PASS')
+        'PASSWORD': os.environ.get('DB_PASS'),
     }
 }
 
@@ -137,5 +147,58 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
-    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema'
-}
\ No newline at end of file
+    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Admits requests once authenticated, see core.concurrency.
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.concurrency.LoadSheddingThrottle',
+    ],
+}
+
+# Address of the memcached server sharing the recipe fragments between
+# the processes, such as memcached:11211. Leave unset to have each
+# process keep its own fragments in memory.
+MEMCACHED_LOCATION = os.environ.get('MEMCACHED_LOCATION')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # JSON of the listed recipes, see recipe.fragments.
+    'recipe_fragments': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': MEMCACHED_LOCATION,
+    } if MEMCACHED_LOCATION else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recipe-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
+# Directory where the rendered OpenAPI schema is cached between processes.
+# Leave unset to only cache it in memory.
+SCHEMA_CACHE_DIR = os.environ.get('SCHEMA_CACHE_DIR')
+# Queries slower than this many milliseconds are recorded by the slow
+# query log, see core.slow_queries. Leave unset to disable it.
+SLOW_QUERY_THRESHOLD = (float(os.environ['SLOW_QUERY_THRESHOLD'])
+                        if os.environ.get('SLOW_QUERY_THRESHOLD') else None)
+# Fraction of the slow queries recorded.
+SLOW_QUERY_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_SAMPLE_RATE', 1))
+# Also capture the plan of the slowest execution of each query.
+SLOW_QUERY_EXPLAIN = bool(os.environ.get('SLOW_QUERY_EXPLAIN'))
+
+# Directory of the similar recipes index, written by
+# `manage.py build_similar_index` and shared by the workers of the host.
+SIMILAR_INDEX_DIR = os.environ.get('SIMILAR_INDEX_DIR',
+                                   '/tmp/similar-recipes')
+
+# Days deleted recipes are kept for sync clients, before
+# `manage.py purge_recipe_tombstones` removes them.
+RECIPE_TOMBSTONE_RETENTION_DAYS = int(
+    os.environ.get('RECIPE_TOMBSTONE_RETENTION_DAYS', 30))
+
+# Requests each process serves at once, adapted to the database latency
+# between 1 and CONCURRENCY_LIMIT_MAX; the others are shed with a 503.
+# See core.concurrency. Leave unset to disable load shedding.
+CONCURRENCY_LIMIT = (int(os.environ['CONCURRENCY_LIMIT'])
+                     if os.environ.get('CONCURRENCY_LIMIT') else None)
+CONCURRENCY_LIMIT_MAX = int(os.environ.get('CONCURRENCY_LIMIT_MAX', 200))
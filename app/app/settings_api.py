@@ -0,0 +1,47 @@
+"""
+Django settings for API-only workers.
+
+The API authenticates with tokens, so these workers drop the session,
+CSRF, message and template machinery, the admin and drf_spectacular.
+They serve /api/user/ and /api/recipe/ only; the admin and the API
+schema stay on workers running app.settings. Run migrations with
+app.settings, which knows every app owning a table.
+
+Compare both profiles with `manage.py compare_settings`.
+"""
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'core',
+    'rest_framework',
+    'rest_framework.authtoken',
+    'user',
+    'recipe',
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'core.middleware.StatementTimeoutMiddleware',
+    'core.middleware.SlowQueryMiddleware',
+    'core.middleware.LoadSheddingMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'core.middleware.ProfilingMiddleware',
+]
+
+ROOT_URLCONF = 'app.urls_api'
+
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.TokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.concurrency.LoadSheddingThrottle',
+    ],
+}
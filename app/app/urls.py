@@ -15,13 +15,14 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import (SpectacularAPIView,
-                                   SpectacularSwaggerView)
+from drf_spectacular.views import SpectacularSwaggerView
+
+from core.schema import CachedSpectacularAPIView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/schema/',
-         SpectacularAPIView.as_view(),
+         CachedSpectacularAPIView.as_view(),
          name='api-schema'),
     path('api/docs/',
          SpectacularSwaggerView.as_view(url_name='api-schema'),
@@ -0,0 +1,7 @@
+"""API-only URL Configuration, used with app.settings_api."""
+from django.urls import path, include
+
+urlpatterns = [
+    path('api/user/', include('user.urls')),
+    path('api/recipe/', include('recipe.urls'))
+]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_wsgi_application()
+
+if os.environ.get('DJANGO_WARM_UP'):
+    from core.warmup import warm_up
+
+    warm_up()
@@ -1,17 +1,74 @@
 """
 Django admin page customization.
 """
+import io
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 
+from recipe import views as recipe_views
+
 from . import models
+from .deletion import request_deletion
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator which reads the row count of unfiltered querysets from
+    the Postgres planner statistics instead of running COUNT(*).
+    """
+    # Below this many rows an exact count is cheap enough.
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        """Return the estimated or exact number of objects."""
+        estimate = self._estimated_count()
+        if estimate is None or estimate < self.exact_count_threshold:
+            return super().count
+
+        return estimate
+
+    def _estimated_count(self):
+        """Return the planner row estimate, or None if unavailable."""
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where:
+            # Filtered querysets need an exact count.
+            return None
+
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [self.object_list.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+
+        # reltuples is negative (or zero) for tables never analyzed.
+        if row is None or row[0] <= 0:
+            return None
+
+        return int(row[0])
 
 
 class UserAdmin(BaseUserAdmin):
     """Adding customization to the admin page."""
     ordering = ['id']
     list_display = ['email', 'name']
+    search_fields = ['^email', '^name']
     fieldsets = (
         # 1st section : Field columns
         (None, {'fields': ('name', 'email', 'password')}),
@@ -30,12 +87,13 @@ class UserAdmin(BaseUserAdmin):
             _('Important Dates'), {
                 'fields': (
                     'last_login',
+                    'deletion_requested_at',
                 )
             }
         )
     )
 
-    readonly_fields = ['last_login']
+    readonly_fields = ['last_login', 'deletion_requested_at']
 
     # Add User Data in Admin Page
     add_fieldsets = (
@@ -52,6 +110,200 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+    def get_deleted_objects(self, objs, request):
+        """Count the recipes to delete instead of collecting them all."""
+        recipes = models.Recipe.all_objects.filter(user__in=objs).count()
+        perms_needed = set()
+        if recipes and not request.user.has_perm('core.delete_recipe'):
+            perms_needed.add(models.Recipe._meta.verbose_name)
+
+        model_count = {
+            models.User._meta.verbose_name_plural: len(objs),
+            models.Recipe._meta.verbose_name_plural: recipes,
+        }
+        return [str(obj) for obj in objs], model_count, perms_needed, []
+
+    def delete_model(self, request, obj):
+        """Deactivate the user and queue its deletion."""
+        request_deletion(models.User.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        """Deactivate the users and queue their deletion."""
+        request_deletion(queryset)
+
+
+class RecipeAdmin(admin.ModelAdmin):
+    """Admin page for recipes, usable on very large tables."""
+    ordering = ['-id']
+    list_display = ['title', 'user', 'time_taken', 'cost']
+    list_select_related = ['user']
+    # Prefix and exact matches are served by the indexes
+    # created in migration 0003_search_indexes.
+    search_fields = ['^title', '=user__email']
+    autocomplete_fields = ['user', 'tags', 'ingredients']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = ['version']
+
+    @admin.display(ordering='cost_cents')
+    def cost(self, obj):
+        return obj.cost
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        """Save the recipe like the API: increment the version of changed
+        recipes, update the statistics of the owner and publish it."""
+        if not change:
+            super().save_model(request, obj, form, change)
+            recipe_views.record_create(obj)
+            return
+
+        removed = models.Recipe.objects.filter(pk=obj.pk).values_list(
+            'cost_cents', 'time_taken').get()
+        version = obj.version
+        if form.has_changed():
+            obj.version += 1
+        super().save_model(request, obj, form, change)
+        recipe_views.record_update(obj, removed, version)
+
+    def delete_model(self, request, obj):
+        """Keep the recipe as a tombstone for the sync clients, like the
+        API."""
+        recipe_views.delete_recipe(obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        """Keep the recipes as tombstones for the sync clients, like the
+        API."""
+        for recipe in queryset.select_related('user'):
+            recipe_views.delete_recipe(recipe)
+
+
+class NameAdmin(admin.ModelAdmin):
+    """Admin page for the tags and ingredients of users."""
+    ordering = ['-id']
+    list_display = ['name', 'user']
+    list_select_related = ['user']
+    search_fields = ['^name', '=user__email']
+    autocomplete_fields = ['user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def _touch_recipes(self, objs):
+        """Increment the version of the recipes listing the objects,
+        whose serialized form changes with them, as a change of their
+        owner's recipes."""
+        field = next(field.name for field in models.Recipe._meta.many_to_many
+                     if field.related_model is self.model)
+        recipes = models.Recipe.all_objects.filter(**{f'{field}__in': objs})
+        with transaction.atomic():
+            for user_id in recipes.order_by().values_list(
+                    'user', flat=True).distinct():
+                recipes.filter(user=user_id).update(
+                    version=F('version') + 1, updated_at=timezone.now(),
+                    change_number=models.next_recipe_change(user_id))
+
+    def save_model(self, request, obj, form, change):
+        if change and 'name' in form.changed_data:
+            self._touch_recipes([obj])
+        super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        self._touch_recipes([obj])
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        self._touch_recipes(queryset)
+        super().delete_queryset(request, queryset)
+
+
+class JobAdmin(admin.ModelAdmin):
+    """Admin page for background jobs and their timings."""
+    ordering = ['-id']
+    list_display = ['name', 'status', 'attempts', 'run_at', 'wait_time',
+                    'run_time']
+    list_filter = ['status']
+    readonly_fields = ['attempts', 'last_error', 'created_at', 'started_at',
+                       'finished_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Admin page for the request profiles captured for staff users."""
+    ordering = ['-id']
+    list_display = ['method', 'path', 'status_code', 'duration', 'sql_count',
+                    'sql_time', 'user', 'created_at']
+    list_filter = ['method', 'status_code']
+    search_fields = ['^path']
+    fields = ['method', 'path', 'query_string', 'status_code', 'user',
+              'created_at', 'duration', 'sql_count', 'sql_time', 'download',
+              'summary', 'queries']
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        """Profiles are only captured by core.middleware."""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """Profiles are read-only."""
+        return False
+
+    def get_urls(self):
+        """Add the download view of the profiles."""
+        return [
+            path('<int:pk>/download/',
+                 self.admin_site.admin_view(self.download_view),
+                 name='core_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        """Return the profile as a file readable by pstats and snakeviz."""
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+
+        profile = get_object_or_404(models.RequestProfile, pk=pk)
+        response = HttpResponse(bytes(profile.stats),
+                                content_type='application/octet-stream')
+        response['Content-Disposition'] = (
+            f'attachment; filename="request-{profile.pk}.prof"')
+        return response
+
+    @admin.display(description='Profile')
+    def download(self, obj):
+        url = reverse('admin:core_requestprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">request-{}.prof</a>', url, obj.pk)
+
+    @admin.display(description='Slowest functions')
+    def summary(self, obj):
+        output = io.StringIO()
+        obj.get_stats(stream=output).sort_stats('cumulative').print_stats(40)
+        return format_html('<pre>{}</pre>', output.getvalue())
+
+
+class SlowQueryAdmin(admin.ModelAdmin):
+    """Admin page for the queries recorded by the slow query log."""
+    ordering = ['-total_time']
+    list_display = ['sql', 'count', 'total_time', 'mean_time', 'max_time',
+                    'last_seen']
+    search_fields = ['sql']
+    fields = ['fingerprint', 'sql', 'count', 'total_time', 'max_time',
+              'views', 'example', 'stack', 'plan', 'first_seen', 'last_seen']
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        """Queries are only recorded by core.slow_queries."""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """Recorded queries are read-only."""
+        return False
+
 
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Recipe)
+admin.site.register(models.Recipe, RecipeAdmin)
+admin.site.register(models.Tag, NameAdmin)
+admin.site.register(models.Ingredient, NameAdmin)
+admin.site.register(models.Job, JobAdmin)
+admin.site.register(models.RequestProfile, RequestProfileAdmin)
+admin.site.register(models.SlowQuery, SlowQueryAdmin)
@@ -0,0 +1,221 @@
+"""
+Adaptive concurrency limit and load shedding.
+
+With CONCURRENCY_LIMIT set, each process serves at most `limit` requests
+at once and sheds the others right away with a 503 and Retry-After,
+instead of queueing them until they time out. The limit follows the
+latency of the database queries, the resource saturating first: it
+grows by one per window of requests while the recent latency stays
+within LATENCY_TOLERANCE times its long-term average, and shrinks in
+proportion when it exceeds it, or by half when a query is cancelled by
+the statement timeout.
+
+Requests are admitted by priority, once their user is authenticated:
+LoadSheddingThrottle admits the API requests after DRF authenticated
+them, LoadSheddingMiddleware the other views. Authenticated reads may
+use the whole limit, other authenticated writes a share of it, and
+anonymous requests, bulk writes and views with a `load_priority` of LOW,
+such as the ones hashing passwords, the smallest share: they are shed
+first. Credentials are only trusted once verified, so sending an
+invalid token does not raise the priority of a request.
+
+The limit protects the processes serving requests in several threads,
+such as runserver, which docker-compose runs, or gunicorn with
+--threads. The workers of `manage.py serve` serve one request at a time,
+so there the limiter only sheds the requests cancelled by the statement
+timeout; their concurrency is the number of workers.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.http import JsonResponse
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+
+READ, WRITE, LOW = 0, 1, 2
+# Share of the limit each priority may use.
+PRIORITY_SHARES = {READ: 1.0, WRITE: 0.75, LOW: 0.5}
+# Request bodies larger than this many bytes are bulk writes.
+BULK_WRITE_SIZE = 64 * 1024
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+MIN_LIMIT = 1
+# Requests averaged by the recent and the long-term latency.
+SHORT_WINDOW = 10
+LONG_WINDOW = 1000
+# Ratio of the recent to the long-term latency tolerated.
+LATENCY_TOLERANCE = 2.0
+# Largest decrease of the limit, and seconds between decreases.
+BACKOFF = 0.5
+DECREASE_INTERVAL = 1.0
+# Seconds shed clients are asked to wait.
+RETRY_AFTER = 1
+
+# SQLSTATE of the statements cancelled by statement_timeout.
+QUERY_CANCELED = '57014'
+
+
+def is_statement_timeout(error):
+    """Tell whether the exception is a query cancelled by Postgres."""
+    return (isinstance(error, DatabaseError)
+            and getattr(error.__cause__, 'pgcode', None) == QUERY_CANCELED)
+
+
+def classify(request, view):
+    """Return the priority of a request to the view, once its user is
+    authenticated."""
+    priority = getattr(view, 'load_priority', None)
+    if priority is not None:
+        return priority
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return LOW
+    try:
+        if int(request.META.get('CONTENT_LENGTH') or 0) > BULK_WRITE_SIZE:
+            return LOW
+    except ValueError:
+        return LOW
+
+    return READ if request.method in SAFE_METHODS else WRITE
+
+
+def shed_response():
+    """Return the response to the requests over the limit."""
+    response = JsonResponse({'detail': Overloaded.default_detail},
+                            status=Overloaded.status_code)
+    response['Retry-After'] = str(RETRY_AFTER)
+    return response
+
+
+class Overloaded(APIException):
+    """The request is over the concurrency limit."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The server is overloaded, retry later.'
+    default_code = 'overloaded'
+    # Sent as Retry-After by the DRF exception handler.
+    wait = RETRY_AFTER
+
+
+def admit(request, view):
+    """Admit the request to the view, or tell it must be shed. Requests
+    not seen by LoadSheddingMiddleware are not limited."""
+    if limiter is None or getattr(request, 'concurrency_admitted', True):
+        return True
+    if not limiter.acquire(classify(request, view)):
+        return False
+
+    request.concurrency_admitted = True
+    return True
+
+
+class LoadSheddingThrottle(BaseThrottle):
+    """Admit the API requests once DRF authenticated them, shedding the
+    ones over the concurrency limit with Overloaded."""
+
+    def allow_request(self, request, view):
+        # DRF set the user it authenticated on the Django request, which
+        # the middleware releases the slot of.
+        if not admit(request._request, view):
+            raise Overloaded()
+        return True
+
+
+class LatencyTimer:
+    """Database execute wrapper measuring the queries of a request."""
+
+    def __init__(self):
+        self.time = 0.0
+        self.count = 0
+        self.timed_out = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except DatabaseError as error:
+            self.timed_out = self.timed_out or is_statement_timeout(error)
+            raise
+        finally:
+            self.time += time.perf_counter() - start
+            self.count += 1
+
+    @property
+    def latency(self):
+        """Return the mean duration of the queries, or None."""
+        return self.time / self.count if self.count else None
+
+
+class ConcurrencyLimiter:
+    """Concurrency limit of this process, shared by its threads."""
+
+    def __init__(self, limit, max_limit):
+        self.limit = float(limit)
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self.shed = 0
+        self.short_latency = None
+        self.long_latency = None
+        self.decreased_at = float('-inf')
+        self.lock = threading.Lock()
+
+    def acquire(self, priority):
+        """Admit a request of the priority, or tell it must be shed."""
+        with self.lock:
+            share = max(MIN_LIMIT, self.limit * PRIORITY_SHARES[priority])
+            if self.in_flight >= share:
+                self.shed += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency=None, timed_out=False):
+        """Adapt the limit to a request served with this mean query
+        latency, in seconds."""
+        with self.lock:
+            in_flight = self.in_flight
+            self.in_flight -= 1
+            if timed_out:
+                self._decrease(BACKOFF)
+            elif latency is not None:
+                self._update(latency, in_flight)
+
+    def _update(self, latency, in_flight):
+        if self.long_latency is None:
+            self.short_latency = self.long_latency = latency
+        self.short_latency += (latency - self.short_latency) / SHORT_WINDOW
+        self.long_latency += (latency - self.long_latency) / LONG_WINDOW
+        if self.short_latency <= 0:
+            return
+
+        gradient = LATENCY_TOLERANCE * self.long_latency / self.short_latency
+        if gradient < 1:
+            self._decrease(max(gradient, BACKOFF))
+        elif in_flight * 2 >= self.limit:
+            # Only grow a limit that is used, by one per window.
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _decrease(self, factor):
+        # The requests in flight all saw the same slowdown: decrease once.
+        now = time.monotonic()
+        if now - self.decreased_at >= DECREASE_INTERVAL:
+            self.decreased_at = now
+            self.limit = max(MIN_LIMIT, self.limit * factor)
+
+
+# Limiter of this process, set up by install() when a limit is set.
+limiter = None
+
+
+def install():
+    """Limit the concurrency of this process."""
+    global limiter
+    limit = getattr(settings, 'CONCURRENCY_LIMIT', None)
+    if limit is None or limiter is not None:
+        return
+
+    limiter = ConcurrencyLimiter(
+        limit, max(limit, settings.CONCURRENCY_LIMIT_MAX))
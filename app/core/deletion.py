@@ -0,0 +1,52 @@
+"""
+Deletion of users and their recipes in bounded transactions.
+
+Deleting a user through the ORM collects and deletes every recipe of the
+user in a single transaction. Accounts are instead deactivated at once
+and their recipes are deleted in batches, each in its own transaction,
+by a background job.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from core.jobs import enqueue
+from core.models import Recipe
+
+BATCH_SIZE = 1000
+
+
+@transaction.atomic
+def request_deletion(users):
+    """Deactivate the users and queue their deletion, or neither."""
+    user_ids = list(users.values_list('pk', flat=True))
+    users.update(is_active=False, deletion_requested_at=timezone.now())
+    Token.objects.filter(user__in=user_ids).delete()
+    for user_id in user_ids:
+        enqueue('core.tasks.delete_user', user_id)
+
+
+def delete_user(user, batch_size=BATCH_SIZE, progress=None):
+    """
+    Delete the recipes of the user in batches of `batch_size`, then the
+    user. `progress` is called with the number of recipes deleted so far
+    and the total after every batch. Return the number of recipes deleted.
+    """
+    recipes = Recipe.all_objects.filter(user=user)
+    total = recipes.count()
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(recipes.values_list('pk', flat=True)[:batch_size])
+            if ids:
+                Recipe.all_objects.filter(pk__in=ids).delete()
+        if not ids:
+            break
+
+        deleted += len(ids)
+        if progress is not None:
+            progress(deleted, total)
+
+    user.delete()
+    return deleted
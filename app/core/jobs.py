@@ -0,0 +1,161 @@
+"""
+Database backed background job queue.
+
+Jobs are rows of core.Job, claimed by `manage.py run_workers` processes
+with SELECT ... FOR UPDATE SKIP LOCKED so concurrent workers never run
+the same job. Job functions are registered with the `job` decorator in
+the `tasks` module of an installed app.
+"""
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core.models import Job
+
+logger = logging.getLogger(__name__)
+
+# Retry n waits RETRY_BASE_DELAY * 2 ** (n - 1), up to RETRY_MAX_DELAY.
+RETRY_BASE_DELAY = timedelta(seconds=10)
+RETRY_MAX_DELAY = timedelta(hours=1)
+# Finished jobs deleted per transaction by purge().
+PURGE_BATCH_SIZE = 1000
+
+registry = {}
+
+
+def job_name(func):
+    """Return the name of a job function, or the given dotted path."""
+    if isinstance(func, str):
+        return func
+
+    return f'{func.__module__}.{func.__name__}'
+
+
+def job(func):
+    """Register the function as a job, by its dotted path."""
+    registry[job_name(func)] = func
+    return func
+
+
+def discover():
+    """Import the tasks module of every installed app."""
+    autodiscover_modules('tasks')
+
+
+def enqueue(func, *args, run_at=None, max_attempts=5, **kwargs):
+    """
+    Queue a call of the job function, or of the job registered under the
+    given dotted path. Arguments must be JSON serializable. The job is
+    written in the current transaction, so it only runs if that commits.
+    """
+    return Job.objects.create(
+        name=job_name(func),
+        args=list(args),
+        kwargs=kwargs,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts,
+    )
+
+
+def enqueue_once(func, *args, **kwargs):
+    """Queue a call of the job unless one is already queued, e.g. to
+    schedule a periodic job once. Return the job, or None."""
+    if Job.objects.filter(name=job_name(func), status=Job.QUEUED).exists():
+        return None
+
+    return enqueue(func, *args, **kwargs)
+
+
+def claim():
+    """Mark the next due job as running and return it, or None."""
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            status=Job.QUEUED, run_at__lte=timezone.now(),
+        ).order_by('run_at').first()
+        if job is None:
+            return None
+
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.finished_at = None
+        job.save(update_fields=['status', 'attempts', 'started_at',
+                                'finished_at'])
+
+    return job
+
+
+def retry_delay(attempts):
+    """Return the backoff before the retry following `attempts` runs."""
+    exponent = min(attempts - 1, 16)
+    return min(RETRY_BASE_DELAY * 2 ** exponent, RETRY_MAX_DELAY)
+
+
+def execute(job):
+    """Run a claimed job and record its outcome and timing."""
+    start = time.monotonic()
+    try:
+        func = registry[job.name]
+        func(*job.args, **job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + retry_delay(job.attempts)
+        else:
+            job.status = Job.FAILED
+        logger.exception('Job %s (%s) failed on attempt %s.',
+                         job.pk, job.name, job.attempts)
+    else:
+        job.status = Job.DONE
+        job.last_error = ''
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'run_at', 'last_error',
+                            'finished_at'])
+    logger.info('Job %s (%s) %s in %.3fs.', job.pk, job.name, job.status,
+                time.monotonic() - start)
+
+    return job
+
+
+def run_pending(limit=None):
+    """Run due jobs until none are left, or `limit` jobs ran."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim()
+        if job is None:
+            break
+
+        execute(job)
+        count += 1
+
+    return count
+
+
+def requeue_stale(timeout):
+    """Queue again jobs left running for longer than `timeout`,
+    e.g. because their worker was killed."""
+    return Job.objects.filter(
+        status=Job.RUNNING, started_at__lt=timezone.now() - timeout,
+    ).update(status=Job.QUEUED, run_at=timezone.now())
+
+
+def purge(before, batch_size=PURGE_BATCH_SIZE):
+    """Delete the jobs done before the given time, in batches. Failed
+    jobs are kept for inspection. Return the number deleted."""
+    done = Job.objects.filter(status=Job.DONE, finished_at__lt=before)
+    purged = 0
+    while True:
+        with transaction.atomic():
+            ids = list(done.values_list('pk', flat=True)[:batch_size])
+            if ids:
+                Job.objects.filter(pk__in=ids).delete()
+        if not ids:
+            return purged
+        purged += len(ids)
@@ -0,0 +1,286 @@
+"""
+Django command to audit the query plans of every API route.
+"""
+import json
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from recipe.sync import encode_token
+
+AUDIT_PASSWORD = 'audit-password-123'
+
+# Namespaces whose routes are not part of the audited API.
+IGNORED_NAMESPACES = {'admin'}
+
+
+def recipe_payload(context):
+    """Return a valid recipe payload."""
+    return {'title': 'Audit recipe', 'time_taken': 10, 'cost': '4.50',
+            'tags': [{'name': 'Audit'}], 'ingredients': [{'name': 'Salt'}]}
+
+
+def recipe_id(context):
+    """Return the URL arguments of the audited recipe."""
+    return [context['recipe'].id]
+
+
+# (url name, method, url args, request data) for every audited request.
+SCENARIOS = [
+    ('api-schema', 'get', None, None),
+    ('api-docs', 'get', None, None),
+    ('user:create', 'post', None, lambda context: {
+        'email': f'audit-{uuid.uuid4().hex}@example.com',
+        'password': AUDIT_PASSWORD,
+        'name': 'Audit',
+    }),
+    ('user:token', 'post', None, lambda context: {
+        'email': context['audit_user'].email,
+        'password': AUDIT_PASSWORD,
+    }),
+    ('user:my_url', 'get', None, None),
+    ('user:my_url', 'patch', None, lambda context: {'name': 'Audited'}),
+    ('recipe:api-root', 'get', None, None),
+    ('recipe:recipe-list', 'get', None, None),
+    ('recipe:recipe-list', 'get', None,
+     lambda context: {'tags': context['tag'].id}),
+    ('recipe:recipe-list', 'post', None, recipe_payload),
+    ('recipe:recipe-detail', 'get', recipe_id, None),
+    ('recipe:recipe-detail', 'patch', recipe_id,
+     lambda context: {'title': 'Audited recipe'}),
+    ('recipe:recipe-detail', 'put', recipe_id, recipe_payload),
+    ('recipe:stats', 'get', None, None),
+    ('recipe:analytics', 'get', None, None),
+    ('recipe:recipe-changes', 'get', None, None),
+    ('recipe:recipe-changes', 'get', None, lambda context: {
+        'since': encode_token(context['recipe']),
+    }),
+    ('recipe:recipe-similar', 'get', recipe_id, None),
+    ('recipe:recipe-detail', 'delete', recipe_id, None),
+]
+
+
+def route_names(patterns=None, namespace=None):
+    """Return the names of every named route, with namespaces."""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            inner = pattern.namespace
+            if inner in IGNORED_NAMESPACES:
+                continue
+            if namespace and inner:
+                inner = f'{namespace}:{inner}'
+            names |= route_names(pattern.url_patterns, inner or namespace)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            prefix = f'{namespace}:' if namespace else ''
+            names.add(prefix + pattern.name)
+
+    return names
+
+
+def walk_plan(node):
+    """Yield the node and every node below it in an EXPLAIN plan."""
+    yield node
+    for child in node.get('Plans', []):
+        yield from walk_plan(child)
+
+
+def plan_issues(plan, seq_scan_rows=1000, row_estimate=10000,
+                misestimate_factor=10):
+    """Return the problems found in a JSON EXPLAIN ANALYZE plan."""
+    issues = []
+    for node in walk_plan(plan['Plan']):
+        relation = node.get('Relation Name')
+        loops = node.get('Actual Loops', 1) or 1
+        actual = node.get('Actual Rows', 0) * loops
+        estimate = node.get('Plan Rows', 0)
+
+        if node['Node Type'] == 'Seq Scan':
+            scanned = actual + node.get('Rows Removed by Filter', 0) * loops
+            if scanned >= seq_scan_rows:
+                issues.append({
+                    'type': 'seq_scan',
+                    'relation': relation,
+                    'rows_scanned': scanned,
+                })
+                if 'Filter' in node:
+                    issues.append({
+                        'type': 'missing_index',
+                        'relation': relation,
+                        'filter': node['Filter'],
+                    })
+
+        if estimate >= row_estimate:
+            issues.append({
+                'type': 'high_row_estimate',
+                'relation': relation,
+                'node': node['Node Type'],
+                'plan_rows': estimate,
+            })
+
+        low, high = sorted([max(estimate, 1), max(actual, 1)])
+        if high / low >= misestimate_factor and high >= seq_scan_rows:
+            issues.append({
+                'type': 'misestimate',
+                'relation': relation,
+                'node': node['Node Type'],
+                'plan_rows': estimate,
+                'actual_rows': actual,
+            })
+
+    return issues
+
+
+class Command(BaseCommand):
+    """Django command to EXPLAIN the queries of every API route."""
+    help = ('Exercise every API route, EXPLAIN (ANALYZE, BUFFERS) the '
+            'queries they run and report sequential scans, missing '
+            'indexes and high row estimates. All writes are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', dest='email',
+            help='Audit the recipe routes with the data of this user.',
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=20,
+            help='Recipes to create for the audit user (default: 20).',
+        )
+        parser.add_argument(
+            '--seq-scan-rows', type=int, default=1000,
+            help='Flag sequential scans reading at least this many rows.',
+        )
+        parser.add_argument(
+            '--row-estimate', type=int, default=10000,
+            help='Flag plan nodes estimated to return this many rows.',
+        )
+        parser.add_argument(
+            '--json', dest='json_path',
+            help='Write the machine-readable report to this file.',
+        )
+        parser.add_argument(
+            '--fail-on-issues', action='store_true',
+            help='Exit with an error when any issue is found.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if connection.vendor != 'postgresql':
+            raise CommandError('audit_queries requires PostgreSQL.')
+
+        with override_settings(ALLOWED_HOSTS=['*']), transaction.atomic():
+            report = self._audit(options)
+            transaction.set_rollback(True)
+
+        self._write_report(report)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+
+        issues = sum(len(query['issues'])
+                     for route in report['routes']
+                     for query in route['queries'])
+        if options['fail_on_issues'] and issues:
+            raise CommandError(f'{issues} query plan issue(s) found.')
+
+    def _audit(self, options):
+        """Run every scenario and EXPLAIN the queries it executed."""
+        audit_user = get_user_model().objects.create_user(
+            email=f'audit-{uuid.uuid4().hex}@example.com',
+            password=AUDIT_PASSWORD,
+        )
+        user = audit_user
+        if options['email']:
+            user = get_user_model().objects.filter(
+                email=options['email']).first()
+            if user is None:
+                raise CommandError(f'No user with email {options["email"]}.')
+
+        Recipe.objects.bulk_create([
+            Recipe(user=audit_user, title=f'Audit recipe {number}',
+                   time_taken=number % 120 + 1,
+                   cost_cents=number % 500 * 10)
+            for number in range(options['recipes'])
+        ])
+        recipe = Recipe.objects.filter(user=user).order_by('-id').first()
+        if recipe is None:
+            raise CommandError(f'User {user.email} has no recipes.')
+        tag = Tag.objects.create(user=user, name=f'audit-{uuid.uuid4().hex}')
+        recipe.tags.add(tag)
+        context = {'user': user, 'audit_user': audit_user, 'recipe': recipe,
+                   'tag': tag}
+
+        client = APIClient()
+        client.force_authenticate(user)
+        thresholds = {
+            'seq_scan_rows': options['seq_scan_rows'],
+            'row_estimate': options['row_estimate'],
+        }
+        routes = []
+        for name, method, url_args, data in SCENARIOS:
+            url = reverse(name, args=url_args(context) if url_args else None)
+            with CaptureQueriesContext(connection) as captured:
+                response = getattr(client, method)(
+                    url, data(context) if data else None, format='json')
+            routes.append({
+                'route': name,
+                'method': method.upper(),
+                'url': url,
+                'status': response.status_code,
+                'queries': [
+                    self._explain(query['sql'], thresholds)
+                    for query in captured.captured_queries
+                    if query['sql'].lstrip().upper().startswith('SELECT')
+                ],
+            })
+
+        audited = {name for name, *_ in SCENARIOS}
+        return {
+            'routes': routes,
+            'unaudited_routes': sorted(route_names() - audited),
+        }
+
+    @staticmethod
+    def _explain(sql, thresholds):
+        """Return the plan and the issues of a single query."""
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}')
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        return {
+            'sql': sql,
+            'execution_time_ms': plan[0].get('Execution Time'),
+            'issues': plan_issues(plan[0], **thresholds),
+            'plan': plan[0]['Plan'],
+        }
+
+    def _write_report(self, report):
+        """Write a human readable summary of the report."""
+        for route in report['routes']:
+            self.stdout.write(f'{route["method"]} {route["url"]} '
+                              f'({route["route"]}) -> {route["status"]}, '
+                              f'{len(route["queries"])} queries')
+            for query in route['queries']:
+                for issue in query['issues']:
+                    details = ', '.join(f'{key}={value}'
+                                        for key, value in issue.items()
+                                        if key != 'type')
+                    self.stdout.write(self.style.WARNING(
+                        f'  {issue["type"]}: {details}'))
+                    self.stdout.write(f'    {query["sql"]}')
+
+        for name in report['unaudited_routes']:
+            self.stdout.write(self.style.WARNING(f'Route {name} '
+                                                 'is not audited.'))
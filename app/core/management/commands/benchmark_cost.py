@@ -0,0 +1,113 @@
+"""
+Django command to compare recipe costs stored as numeric and as cents.
+"""
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from rest_framework import serializers
+
+from recipe.serializers import CentsField
+
+TABLE = 'benchmark_recipe_cost'
+INSERT_BATCH_SIZE = 5000
+
+# Columns storing the same costs, and the fields serializing them.
+COLUMNS = {
+    'numeric': ('cost', serializers.DecimalField(max_digits=5,
+                                                 decimal_places=2)),
+    'cents': ('cost_cents', CentsField()),
+}
+QUERIES = {
+    'list': 'SELECT {column} FROM {table}',
+    'sort': 'SELECT id FROM {table} ORDER BY {column}, id',
+    'aggregate': 'SELECT sum({column}), avg({column}), min({column}), '
+                 'max({column}) FROM {table}',
+}
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the storage of recipe costs."""
+    help = ('Time listing and serializing, sorting and aggregating recipe '
+            'costs stored as numeric and as integer cents, in a temporary '
+            'table.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=100000,
+            help='Rows of the benchmark table (default: 100000).',
+        )
+        parser.add_argument(
+            '--runs', type=int, default=5,
+            help='Runs per measurement; the best is kept (default: 5).',
+        )
+        parser.add_argument('--json', action='store_true',
+                            help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        with transaction.atomic():
+            self._create_table(options['rows'])
+            results = {
+                operation: {
+                    name: self._measure(operation, name, options['runs'])
+                    for name in COLUMNS
+                }
+                for operation in QUERIES
+            }
+            # Nothing is kept, not even the table.
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        if connection.vendor != 'postgresql':
+            self.stderr.write(f'{connection.vendor} does not store numeric '
+                              f'values as decimals; run on PostgreSQL for '
+                              f'meaningful results.')
+        self.stdout.write(f'{"operation":<12}{"numeric ms":>12}'
+                          f'{"cents ms":>12}{"speedup":>10}')
+        for operation, result in results.items():
+            self.stdout.write(
+                f'{operation:<12}{result["numeric"]:>12.1f}'
+                f'{result["cents"]:>12.1f}'
+                f'{result["numeric"] / max(result["cents"], 1e-9):>9.2f}x')
+
+    def _create_table(self, rows):
+        """Create the table with the same random costs in both columns."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {TABLE} (id integer PRIMARY KEY, '
+                f'cost numeric(5, 2) NOT NULL, cost_cents bigint NOT NULL)')
+            for start in range(0, rows, INSERT_BATCH_SIZE):
+                batch = []
+                end = min(rows, start + INSERT_BATCH_SIZE)
+                for number in range(start, end):
+                    cents = random.randrange(100000)
+                    batch.append((number, f'{cents // 100}.{cents % 100:02d}',
+                                  cents))
+                cursor.executemany(
+                    f'INSERT INTO {TABLE} (id, cost, cost_cents) '
+                    f'VALUES (%s, %s, %s)', batch)
+            cursor.execute(f'ANALYZE {TABLE}')
+
+    def _measure(self, operation, name, runs):
+        """Return the best duration of the operation, in milliseconds.
+        Listing includes the serialization of the costs."""
+        column, field = COLUMNS[name]
+        sql = QUERIES[operation].format(column=column, table=TABLE)
+        best = float('inf')
+        for _ in range(runs):
+            start = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+                rows = cursor.fetchall()
+            if operation == 'list':
+                [field.to_representation(value) for value, in rows]
+            best = min(best, time.perf_counter() - start)
+
+        return best * 1000
@@ -0,0 +1,35 @@
+"""
+Django command to prebuild the cached OpenAPI schema.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.schema import (CachedSpectacularAPIView,
+                         clear_documents,
+                         get_document,)
+
+
+class Command(BaseCommand):
+    """Django command to render the schema into SCHEMA_CACHE_DIR."""
+    help = ('Render the OpenAPI schema once into SCHEMA_CACHE_DIR, so '
+            'server processes serve it without generating it.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if not getattr(settings, 'SCHEMA_CACHE_DIR', None):
+            raise CommandError('SCHEMA_CACHE_DIR is not set.')
+
+        clear_documents()
+        formats = set()
+        for renderer_class in CachedSpectacularAPIView.renderer_classes:
+            renderer = renderer_class()
+            if renderer.format in formats:
+                continue
+
+            formats.add(renderer.format)
+            document = get_document(renderer)
+            self.stdout.write(f'Built {renderer.format} schema, '
+                              f'{len(document.body)} bytes '
+                              f'({len(document.gzipped)} gzipped).')
+
+        self.stdout.write(self.style.SUCCESS('Schema built.'))
@@ -0,0 +1,115 @@
+"""
+Django command to compare the overhead of settings profiles.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter per profile, so imports are not shared.
+MEASURE_SCRIPT = '''
+import json, sys, time
+
+start = time.perf_counter()
+import django
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.urls import get_resolver
+get_resolver()._populate()
+startup = time.perf_counter() - start
+
+from django.conf import settings
+from django.test import Client
+settings.ALLOWED_HOSTS = ['*']
+path, requests = sys.argv[1], int(sys.argv[2])
+client = Client()
+client.get(path)
+start = time.perf_counter()
+for _ in range(requests):
+    client.get(path)
+per_request = (time.perf_counter() - start) / requests
+
+rss = None
+with open('/proc/self/status') as status:
+    for line in status:
+        if line.startswith('VmRSS:'):
+            rss = int(line.split()[1])
+
+print(json.dumps({
+    'startup_ms': startup * 1000,
+    'request_us': per_request * 1000000,
+    'rss_kb': rss,
+    'modules': len(sys.modules),
+    'drf_spectacular': 'drf_spectacular' in sys.modules,
+}))
+'''
+
+
+class Command(BaseCommand):
+    """Django command to measure settings profiles side by side."""
+    help = ('Measure startup time, per-request overhead and memory of '
+            'each settings module, each in a fresh process.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'modules', nargs='*',
+            default=['app.settings', 'app.settings_api'],
+            help='Settings modules to compare '
+                 '(default: app.settings app.settings_api).',
+        )
+        parser.add_argument(
+            '--path', default='/api/user/token/',
+            help='Path requested to measure the request overhead. The '
+                 'default answers 405 to GET, without a database query.',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Requests per measurement (default: 500).',
+        )
+        parser.add_argument(
+            '--runs', type=int, default=3,
+            help='Processes per module; the best run is kept (default: 3).',
+        )
+        parser.add_argument('--json', action='store_true',
+                            help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        results = {
+            module: self._measure(module, options)
+            for module in options['modules']
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f'{"settings":<24}{"startup ms":>12}'
+                          f'{"request us":>12}{"RSS KiB":>10}'
+                          f'{"modules":>9}')
+        for module, result in results.items():
+            self.stdout.write(f'{module:<24}{result["startup_ms"]:>12.1f}'
+                              f'{result["request_us"]:>12.1f}'
+                              f'{result["rss_kb"]:>10}'
+                              f'{result["modules"]:>9}')
+
+    def _measure(self, module, options):
+        """Return the best of several measurements in fresh processes."""
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': module}
+        runs = []
+        for _ in range(options['runs']):
+            process = subprocess.run(
+                [sys.executable, '-c', MEASURE_SCRIPT, options['path'],
+                 str(options['requests'])],
+                cwd=settings.BASE_DIR, env=env, capture_output=True,
+                text=True,
+            )
+            if process.returncode:
+                raise CommandError(f'Measuring {module} failed:\n'
+                                   f'{process.stderr}')
+            runs.append(json.loads(process.stdout.splitlines()[-1]))
+
+        return {key: min(run[key] for run in runs) for key in runs[0]}
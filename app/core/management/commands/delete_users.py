@@ -0,0 +1,49 @@
+"""
+Django command to delete users and their recipes in batches.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.deletion import BATCH_SIZE, delete_user
+
+
+class Command(BaseCommand):
+    """Django command to delete users without one long transaction."""
+    help = ('Delete the given users, or with --pending every user whose '
+            'deletion was requested, with their recipes in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('emails', nargs='*',
+                            help='Emails of the users to delete.')
+        parser.add_argument(
+            '--pending', action='store_true',
+            help='Delete every user whose deletion was requested.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help=f'Recipes deleted per transaction (default: {BATCH_SIZE}).',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if not options['emails'] and not options['pending']:
+            raise CommandError('Give user emails or --pending.')
+
+        users = get_user_model().objects.order_by('id')
+        if options['pending']:
+            users = users.filter(deletion_requested_at__isnull=False)
+        else:
+            users = users.filter(email__in=options['emails'])
+
+        count = 0
+        for user in users:
+            self.stdout.write(f'Deleting {user.email}...')
+            delete_user(user, batch_size=options['batch_size'],
+                        progress=self._progress)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {count} user(s).'))
+
+    def _progress(self, deleted, total):
+        """Report the recipes deleted so far."""
+        self.stdout.write(f'  {deleted}/{total} recipes deleted')
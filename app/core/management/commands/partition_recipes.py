@@ -0,0 +1,267 @@
+"""
+Django command to move core_recipe to a table hash-partitioned by user.
+"""
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.management.commands.audit_queries import walk_plan
+
+TABLE = 'core_recipe'
+PARTITIONED = 'core_recipe_partitioned'
+UNPARTITIONED = 'core_recipe_unpartitioned'
+# Trigger and function copying the writes to core_recipe during the move.
+MIRROR = 'core_recipe_mirror'
+PARTITION_NAME = re.compile(r'^core_recipe_p\d+$')
+
+MIRROR_FUNCTION = '''
+CREATE FUNCTION {mirror}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        DELETE FROM {partitioned}
+        WHERE id = OLD.id AND user_id = OLD.user_id;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        INSERT INTO {partitioned} SELECT NEW.*
+        ON CONFLICT (id, user_id) DO UPDATE SET {updates};
+    END IF;
+    RETURN NULL;
+END
+$$
+'''
+
+
+def partitions_in_plan(plan):
+    """Return the recipe partitions read by a JSON EXPLAIN plan."""
+    return {
+        node['Relation Name'] for node in walk_plan(plan['Plan'])
+        if PARTITION_NAME.match(node.get('Relation Name', ''))
+    }
+
+
+def suffixed(name, suffix):
+    """Return the identifier with a suffix, within the Postgres limit."""
+    return name[:63 - len(suffix)] + suffix
+
+
+class Command(BaseCommand):
+    """Django command to partition the recipe table online."""
+    help = (
+        'Move core_recipe to a table hash-partitioned by user_id, online. '
+        'Run the steps in order: "prepare" creates the partitioned table '
+        'and a trigger mirroring every write, "copy" moves the existing '
+        'rows in batches, "verify" compares both tables, "swap" replaces '
+        'core_recipe by the partitioned table and "drop-old" deletes the '
+        'previous table. Do not run migrations during the move.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'step', choices=['prepare', 'copy', 'verify', 'swap', 'drop-old'],
+        )
+        parser.add_argument(
+            '--partitions', type=int, default=16,
+            help='Number of partitions created by "prepare" (default: 16).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Range of recipe IDs copied per transaction '
+                 '(default: 10000).',
+        )
+        parser.add_argument(
+            '--start-id', type=int,
+            help='Resume "copy" from this recipe ID.',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches, to limit the load.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if connection.vendor != 'postgresql':
+            raise CommandError('partition_recipes requires PostgreSQL.')
+
+        # Copying and comparing large tables outlasts DB_STATEMENT_TIMEOUT.
+        self._execute('SET statement_timeout = 0')
+        step = options['step'].replace('-', '_')
+        getattr(self, f'_{step}')(options)
+
+    def _execute(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall() if cursor.description else None
+
+    def _exists(self, table):
+        return bool(self._execute('SELECT to_regclass(%s)', [table])[0][0])
+
+    def _partitioned(self):
+        """Tell whether core_recipe is already partitioned."""
+        return self._execute(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass",
+            [TABLE])[0][0]
+
+    def _indexes(self, table):
+        """Return the name, definition and uniqueness of the indexes of
+        the table, except its primary key."""
+        return self._execute(
+            'SELECT i.relname, pg_get_indexdef(x.indexrelid), x.indisunique '
+            'FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid '
+            'WHERE x.indrelid = %s::regclass AND NOT x.indisprimary '
+            'ORDER BY i.relname', [table])
+
+    @transaction.atomic
+    def _prepare(self, options):
+        """Create the partitioned table, its indexes and the trigger."""
+        if self._partitioned():
+            raise CommandError(f'{TABLE} is already partitioned.')
+        if self._exists(PARTITIONED):
+            raise CommandError(f'{PARTITIONED} exists already.')
+
+        qn = connection.ops.quote_name
+        partitions = options['partitions']
+        # The primary key of a partitioned table includes the partition
+        # key. IDs stay unique, as they come from the same sequence.
+        self._execute(
+            f'CREATE TABLE {PARTITIONED} (LIKE {TABLE} INCLUDING DEFAULTS '
+            f'INCLUDING CONSTRAINTS) PARTITION BY HASH (user_id)')
+        self._execute(f'ALTER TABLE {PARTITIONED} ADD PRIMARY KEY '
+                      f'(id, user_id)')
+        self._execute(
+            f'ALTER TABLE {PARTITIONED} ADD CONSTRAINT '
+            f'{PARTITIONED}_user_id_fk FOREIGN KEY (user_id) '
+            f'REFERENCES core_user (id) DEFERRABLE INITIALLY DEFERRED')
+        for remainder in range(partitions):
+            self._execute(
+                f'CREATE TABLE {TABLE}_p{remainder} PARTITION OF '
+                f'{PARTITIONED} FOR VALUES WITH (MODULUS {partitions}, '
+                f'REMAINDER {remainder})')
+
+        for name, definition, unique in self._indexes(TABLE):
+            if unique:
+                self.stderr.write(f'Skipped unique index {name}: unique '
+                                  f'indexes must include user_id.')
+                continue
+            method = definition.split(' USING ', 1)[1]
+            self._execute(f'CREATE INDEX {qn(suffixed(name, "_p"))} '
+                          f'ON {PARTITIONED} USING {method}')
+
+        with connection.cursor() as cursor:
+            columns = [column.name for column in
+                       connection.introspection.get_table_description(
+                           cursor, TABLE)]
+        # The key of the conflicting row is the key of the new one.
+        updates = ', '.join(f'{qn(column)} = EXCLUDED.{qn(column)}'
+                            for column in columns
+                            if column not in ('id', 'user_id'))
+        self._execute(MIRROR_FUNCTION.format(
+            mirror=MIRROR, partitioned=PARTITIONED, updates=updates))
+        self._execute(
+            f'CREATE TRIGGER {MIRROR} AFTER INSERT OR UPDATE OR DELETE ON '
+            f'{TABLE} FOR EACH ROW EXECUTE FUNCTION {MIRROR}()')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {PARTITIONED} with {partitions} partitions. Writes '
+            f'to {TABLE} are mirrored; run "copy" next.'))
+
+    def _copy(self, options):
+        """Copy the existing rows, one range of IDs per transaction."""
+        if not self._exists(PARTITIONED):
+            raise CommandError('Run "prepare" first.')
+
+        low, high = self._execute(f'SELECT min(id), max(id) FROM {TABLE}')[0]
+        start = options['start_id'] or low or 0
+        high = high or 0
+        copied = 0
+        while start <= high:
+            end = start + options['batch_size'] - 1
+            # Locking the rows makes concurrent writes wait for the batch,
+            # so their mirrored changes apply on top of the copy.
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {PARTITIONED} SELECT * FROM ('
+                    f'SELECT * FROM {TABLE} WHERE id BETWEEN %s AND %s '
+                    f'FOR SHARE) AS batch ON CONFLICT DO NOTHING',
+                    [start, end])
+                copied += cursor.rowcount
+            self.stdout.write(f'Copied IDs {start} to {end}, '
+                              f'{copied} row(s) so far.')
+            start = end + 1
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self._execute(f'ANALYZE {PARTITIONED}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Copied {copied} row(s); run "verify" next.'))
+
+    def _differences(self):
+        """Return the number of rows differing between both tables."""
+        return self._execute(
+            f'SELECT count(*) FROM {TABLE} r FULL JOIN {PARTITIONED} p '
+            f'ON p.id = r.id AND p.user_id = r.user_id '
+            f'WHERE ROW(r.*) IS DISTINCT FROM ROW(p.*)')[0][0]
+
+    def _verify(self, options):
+        """Compare every row of both tables."""
+        if not self._exists(PARTITIONED):
+            raise CommandError('Run "prepare" first.')
+
+        differences = self._differences()
+        if differences:
+            raise CommandError(f'{differences} row(s) differ; run "copy" '
+                               f'again.')
+        self.stdout.write(self.style.SUCCESS(
+            f'{PARTITIONED} matches {TABLE}.'))
+
+    def _swap(self, options):
+        """Replace core_recipe by the partitioned table."""
+        self._verify(options)
+
+        qn = connection.ops.quote_name
+        with transaction.atomic():
+            self._execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+            self._execute(f'DROP TRIGGER {MIRROR} ON {TABLE}')
+            self._execute(f'DROP FUNCTION {MIRROR}()')
+
+            # Foreign keys can only reference unique keys including the
+            # partition key: the ORM deletes the many-to-many rows of
+            # recipes itself, without them.
+            foreign_keys = self._execute(
+                'SELECT conrelid::regclass::text, conname FROM pg_constraint '
+                "WHERE confrelid = %s::regclass AND contype = 'f'", [TABLE])
+            for table, name in foreign_keys:
+                self._execute(f'ALTER TABLE {qn(table)} '
+                              f'DROP CONSTRAINT {qn(name)}')
+                self.stdout.write(f'Dropped foreign key {name} of {table}.')
+
+            # Give the new table and indexes the names Django knows.
+            for name, _definition, _unique in self._indexes(TABLE):
+                self._execute(f'ALTER INDEX {qn(name)} RENAME TO '
+                              f'{qn(suffixed(name, "_old"))}')
+                if self._exists(suffixed(name, '_p')):
+                    self._execute(
+                        f'ALTER INDEX {qn(suffixed(name, "_p"))} '
+                        f'RENAME TO {qn(name)}')
+            sequence = self._execute(
+                'SELECT pg_get_serial_sequence(%s, %s)', [TABLE, 'id'])[0][0]
+            self._execute(f'ALTER TABLE {TABLE} RENAME CONSTRAINT '
+                          f'{TABLE}_pkey TO {UNPARTITIONED}_pkey')
+            self._execute(f'ALTER TABLE {TABLE} RENAME TO {UNPARTITIONED}')
+            self._execute(f'ALTER TABLE {PARTITIONED} RENAME CONSTRAINT '
+                          f'{PARTITIONED}_pkey TO {TABLE}_pkey')
+            self._execute(f'ALTER TABLE {PARTITIONED} RENAME TO {TABLE}')
+            self._execute(f'ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{TABLE} is partitioned. The previous table is kept as '
+            f'{UNPARTITIONED}; remove it with "drop-old".'))
+
+    def _drop_old(self, options):
+        """Drop the table replaced by "swap"."""
+        if not self._exists(UNPARTITIONED):
+            raise CommandError(f'{UNPARTITIONED} does not exist.')
+
+        self._execute(f'DROP TABLE {UNPARTITIONED}')
+        self.stdout.write(self.style.SUCCESS(f'Dropped {UNPARTITIONED}.'))
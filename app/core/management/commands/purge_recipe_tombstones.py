@@ -0,0 +1,49 @@
+"""
+Django command to delete the tombstones of deleted recipes.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.deletion import BATCH_SIZE
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    """Django command to purge old recipe tombstones in batches."""
+    help = ('Delete the recipes marked deleted for longer than the '
+            'retention, in batches. Sync clients with older tokens are '
+            'asked to sync everything again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            default=settings.RECIPE_TOMBSTONE_RETENTION_DAYS,
+            help='Days to keep the tombstones (default: '
+                 'RECIPE_TOMBSTONE_RETENTION_DAYS).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help=f'Recipes deleted per transaction (default: {BATCH_SIZE}).',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        tombstones = Recipe.all_objects.filter(deleted_at__lt=cutoff)
+        purged = 0
+        while True:
+            with transaction.atomic():
+                ids = list(tombstones.values_list(
+                    'pk', flat=True)[:options['batch_size']])
+                if ids:
+                    Recipe.all_objects.filter(pk__in=ids).delete()
+            if not ids:
+                break
+            purged += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {purged} recipe tombstone(s).'))
@@ -0,0 +1,73 @@
+"""
+Django command to rebuild or verify the per-user recipe statistics.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import tasks
+from core.jobs import enqueue
+from core.models import RecipeStats
+
+
+class Command(BaseCommand):
+    """Django command to rebuild the recipe statistics from scratch."""
+    help = ('Rebuild, or with --verify check, the per-user recipe '
+            'statistics. With --enqueue, out of date statistics are '
+            'rebuilt by the job workers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only report users whose statistics are out of date.',
+        )
+        parser.add_argument(
+            '--enqueue', action='store_true',
+            help='Queue a background rebuild of the statistics out of '
+                 'date instead of rebuilding them here.',
+        )
+        parser.add_argument(
+            '--user', dest='emails', action='append', default=[],
+            help='Email of a user to process. Can be given several times.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        users = get_user_model().objects.order_by('id')
+        if options['emails']:
+            users = users.filter(email__in=options['emails'])
+
+        stale = 0
+        for user in users.iterator():
+            with transaction.atomic():
+                current = RecipeStats.objects.select_for_update().filter(
+                    user=user).first() or RecipeStats(user=user)
+                expected = RecipeStats.objects.rebuild(user)
+                if self._matches(current, expected):
+                    continue
+
+                stale += 1
+                if options['verify']:
+                    self.stdout.write(f'Statistics of {user.email} '
+                                      'are out of date.')
+                if options['enqueue']:
+                    enqueue(tasks.rebuild_recipe_stats, user.pk)
+                elif not options['verify']:
+                    expected.save()
+
+        if options['enqueue']:
+            self.stdout.write(f'Queued the rebuild of {stale} user(s).')
+        if options['verify'] and stale:
+            raise CommandError(f'{stale} user(s) have stale statistics.')
+
+        if not options['enqueue']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Recipe statistics up to date, {stale} user(s) rebuilt.'))
+
+    @staticmethod
+    def _matches(current, expected):
+        """Return True if both statistics hold the same values."""
+        fields = ['recipe_count', 'total_cost', 'total_time_taken',
+                  'time_taken_counts']
+        return all(getattr(current, field) == getattr(expected, field)
+                   for field in fields)
@@ -0,0 +1,163 @@
+"""
+Django command to run background job workers.
+"""
+import os
+import signal
+import time
+import traceback
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from core import jobs
+
+# Seconds between two purges of the finished jobs by a worker.
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    """Django command to run the jobs queued in core.Job."""
+    help = 'Run N worker processes executing queued background jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of worker processes (default: 1).',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait when no job is due (default: 1).',
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once no job is due instead of waiting for more.',
+        )
+        parser.add_argument(
+            '--stale-timeout', type=int, default=3600,
+            help='Queue again jobs running for longer than this many '
+                 'seconds when starting (default: 3600).',
+        )
+        parser.add_argument(
+            '--retention-days', type=int, default=7,
+            help='Days done jobs are kept before idle workers delete them '
+                 '(default: 7).',
+        )
+        parser.add_argument(
+            '--graceful-timeout', type=float, default=30.0,
+            help='Seconds workers have to finish their job when stopping, '
+                 'before they are killed (default: 30).',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1.')
+
+        jobs.discover()
+        requeued = jobs.requeue_stale(
+            timedelta(seconds=options['stale_timeout']))
+        if requeued:
+            self.stdout.write(f'Queued {requeued} stale job(s) again.')
+
+        self._stopping = False
+        previous = {signum: signal.signal(signum, self._stop)
+                    for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            if options['workers'] == 1:
+                self._work(options)
+            else:
+                self._supervise(options)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+    def _stop(self, signum, frame):
+        """Finish the current job, then exit."""
+        self._stopping = True
+
+    def _work(self, options):
+        """Run due jobs until stopped, or until none is due in burst mode.
+        Purge the old done jobs when idle."""
+        count = 0
+        purged_at = float('-inf')
+        while not self._stopping:
+            job = jobs.claim()
+            if job is None:
+                if time.monotonic() - purged_at >= PURGE_INTERVAL:
+                    purged_at = time.monotonic()
+                    jobs.purge(timezone.now() - timedelta(
+                        days=options['retention_days']))
+                if options['burst']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            jobs.execute(job)
+            count += 1
+
+        self.stdout.write(f'Worker {os.getpid()} ran {count} job(s).')
+
+    def _spawn(self, options):
+        """Fork a worker process and return its pid."""
+        # Children must not share the database connections of the parent.
+        connections.close_all()
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                self._work(options)
+            except Exception:
+                self.stderr.write(traceback.format_exc())
+                status = 1
+            finally:
+                self.stdout.flush()
+                self.stderr.flush()
+                os._exit(status)
+
+        return pid
+
+    def _supervise(self, options):
+        """Run the workers, replacing those that exit unexpectedly, and
+        stop them when stopped."""
+        workers = {self._spawn(options) for _ in range(options['workers'])}
+        self.stdout.write(f'Started {len(workers)} workers.')
+
+        # Poll, as os.wait() is retried after the signal handlers run and
+        # would not notice a stop request.
+        while workers and not self._stopping:
+            self._reap(workers, options)
+            time.sleep(0.2)
+
+        self._stop_workers(workers, options['graceful_timeout'])
+        self.stdout.write(self.style.SUCCESS('All workers stopped.'))
+
+    def _reap(self, workers, options):
+        """Replace the workers that exited, unless in burst mode."""
+        for pid in list(workers):
+            if not os.waitpid(pid, os.WNOHANG)[0]:
+                continue
+
+            workers.discard(pid)
+            if not options['burst']:
+                workers.add(self._spawn(options))
+
+    def _stop_workers(self, workers, timeout):
+        """Let the workers finish their job, then kill the others. Their
+        jobs are queued again by requeue_stale."""
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + timeout
+        while workers and time.monotonic() < deadline:
+            for pid in list(workers):
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    workers.discard(pid)
+            time.sleep(0.1)
+
+        for pid in workers:
+            self.stderr.write(f'Killed worker {pid}.')
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        workers.clear()
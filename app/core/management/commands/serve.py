@@ -0,0 +1,343 @@
+"""
+Django command to serve the app with preforked worker processes.
+
+Each worker handles one connection at a time, built on the WSGI server of
+runserver: connections are closed after each response and after
+--timeout seconds without a complete request, so idle or slow clients
+only hold a worker that long. Run it behind a reverse proxy buffering
+requests and responses, such as nginx, which shields it from slow
+clients.
+"""
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers import basehttp
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+
+from core.warmup import warm_up
+
+# Set when the server is executed again by a reload; holds the file
+# descriptor of the listening socket, kept open across the exec.
+LISTEN_FD_ENV = 'SERVE_LISTEN_FD'
+# Set by a reload; holds the pids of the workers running the former code,
+# stopped once the new ones are started.
+FORMER_WORKERS_ENV = 'SERVE_FORMER_WORKERS'
+
+
+def memory_usage(pid):
+    """Return the resident, proportional, shared and private memory of a
+    process in KiB, read from /proc. Pss and private memory need
+    smaps_rollup (Linux 4.14+); only rss is known without it."""
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as smaps:
+            for line in smaps:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty',
+                           'Private_Clean', 'Private_Dirty'):
+                    usage[key] = int(value.split()[0])
+    except OSError:
+        pass
+
+    if usage:
+        return {
+            'rss': usage['Rss'],
+            'pss': usage['Pss'],
+            'shared': usage['Shared_Clean'] + usage['Shared_Dirty'],
+            'private': usage['Private_Clean'] + usage['Private_Dirty'],
+        }
+
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return {'rss': int(line.split()[1])}
+    except OSError:
+        pass
+
+    return {}
+
+
+class PreforkRequestHandler(basehttp.WSGIRequestHandler):
+    """Request handler closing the connections idle for the request
+    timeout of the server."""
+
+    def setup(self):
+        self.timeout = self.server.request_timeout
+        super().setup()
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        except socket.timeout:
+            self.close_connection = True
+
+
+class PreforkWSGIServer(basehttp.WSGIServer):
+    """WSGI server accepting connections on a socket shared by workers.
+    Not threaded, so connections are not kept alive."""
+
+    def __init__(self, sock, application, request_timeout=None):
+        super().__init__(sock.getsockname()[:2], PreforkRequestHandler,
+                         bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        host, port = sock.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+        self.set_app(application)
+        self.request_timeout = request_timeout
+        self.handled = 0
+
+    def get_request(self):
+        # The shared socket is non-blocking, so the workers that lose the
+        # race for a connection return to select() instead of blocking.
+        conn, address = self.socket.accept()
+        conn.setblocking(True)
+        return conn, address
+
+    def process_request(self, request, client_address):
+        self.handled += 1
+        super().process_request(request, client_address)
+
+
+class Command(BaseCommand):
+    """Django command to run a preforking WSGI server."""
+    help = ('Load and warm the app once, then fork worker processes that '
+            'share its memory copy-on-write. SIGHUP reloads the code '
+            'without downtime, SIGUSR1 reports the memory of each worker, '
+            'SIGTERM and SIGINT stop the server.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'addrport', nargs='?', default='0.0.0.0:8000',
+            help='Address and port to listen on (default: 0.0.0.0:8000).',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Number of worker processes (default: number of CPUs).',
+        )
+        parser.add_argument(
+            '--max-requests', type=int, default=0,
+            help='Replace a worker after this many requests, 0 for never '
+                 '(default: 0).',
+        )
+        parser.add_argument(
+            '--max-requests-jitter', type=int, default=0,
+            help='Add up to this many requests to --max-requests, per '
+                 'worker, so they are not all replaced at once.',
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=10.0,
+            help='Seconds a connection may stay idle before its request '
+                 'is read or while it is sent (default: 10).',
+        )
+        parser.add_argument(
+            '--graceful-timeout', type=float, default=30.0,
+            help='Seconds workers have to finish their requests when '
+                 'stopping or reloading (default: 30).',
+        )
+        parser.add_argument(
+            '--memory-interval', type=float, default=0,
+            help='Report the memory of each worker every this many '
+                 'seconds, 0 for only on SIGUSR1 (default: 0).',
+        )
+        parser.add_argument(
+            '--backlog', type=int, default=2048,
+            help='Size of the listen queue of the socket (default: 2048).',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1.')
+
+        sock = self._listen(options)
+        application = get_wsgi_application()
+        patterns, serializers = warm_up()
+        self.stdout.write(f'Warmed up {patterns} URL patterns and '
+                          f'{serializers} serializers.')
+
+        # Workers must not share the database connections of the parent.
+        connections.close_all()
+        # Move the preloaded objects out of the collected generations, so
+        # collections in the workers do not write to their pages.
+        gc.collect()
+        gc.freeze()
+
+        self._supervise(sock, application, options)
+
+    def _listen(self, options):
+        """Return the listening socket, inherited on a reload."""
+        fd = os.environ.pop(LISTEN_FD_ENV, None)
+        if fd is not None:
+            sock = socket.socket(fileno=int(fd))
+        else:
+            host, _, port = options['addrport'].rpartition(':')
+            if not port.isdigit():
+                raise CommandError(f'"{options["addrport"]}" is not a valid '
+                                   f'address and port.')
+            try:
+                sock = socket.create_server(
+                    (host.strip('[]') or '0.0.0.0', int(port)),
+                    family=socket.AF_INET6 if ':' in host else socket.AF_INET,
+                    backlog=options['backlog'],
+                )
+            except OSError as error:
+                raise CommandError(f'Cannot listen on '
+                                   f'{options["addrport"]}: {error}')
+
+        sock.setblocking(False)
+        host, port = sock.getsockname()[:2]
+        self.stdout.write(f'Listening on {host}:{port}, pid {os.getpid()}.')
+        return sock
+
+    def _work(self, sock, application, max_requests, timeout):
+        """Handle requests until stopped or max_requests are served."""
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+
+        server = PreforkWSGIServer(sock, application, timeout)
+        # Wake up regularly to notice a stop request.
+        server.timeout = 1.0
+        while not stopping and (not max_requests
+                                or server.handled < max_requests):
+            server.handle_request()
+
+    def _spawn(self, sock, application, options):
+        """Fork a worker process and return its pid."""
+        max_requests = options['max_requests']
+        if max_requests and options['max_requests_jitter']:
+            max_requests += random.randint(0, options['max_requests_jitter'])
+
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                self._work(sock, application, max_requests,
+                           options['timeout'])
+            except Exception:
+                self.stderr.write(traceback.format_exc())
+                status = 1
+            finally:
+                self.stdout.flush()
+                self.stderr.flush()
+                os._exit(status)
+
+        return pid
+
+    def _signal(self, signum, frame):
+        """Record the signal for the supervisor loop."""
+        self._signals.append(signum)
+
+    def _supervise(self, sock, application, options):
+        """Run the workers, replacing those that exit, until stopped."""
+        self._signals = []
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP,
+                       signal.SIGUSR1):
+            signal.signal(signum, self._signal)
+
+        former = os.environ.pop(FORMER_WORKERS_ENV, None)
+        workers = {self._spawn(sock, application, options)
+                   for _ in range(options['workers'])}
+        self.stdout.write(f'Started {len(workers)} workers.')
+        if former:
+            former = {int(pid) for pid in former.split(',')}
+            self._stop_workers(former, options['graceful_timeout'])
+            self.stdout.write('Stopped the former workers.')
+
+        next_report = options['memory_interval'] and (
+            time.monotonic() + options['memory_interval'])
+        while True:
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum == signal.SIGUSR1:
+                    self._report_memory(workers)
+                    continue
+
+                if signum == signal.SIGHUP:
+                    self._reload(sock, workers)
+                self._stop_workers(workers, options['graceful_timeout'])
+                self.stdout.write(self.style.SUCCESS('Server stopped.'))
+                return
+
+            self._reap(workers, sock, application, options)
+            if next_report and time.monotonic() >= next_report:
+                self._report_memory(workers)
+                next_report += options['memory_interval']
+            time.sleep(0.2)
+
+    def _reap(self, workers, sock, application, options):
+        """Replace the workers that exited."""
+        for pid in list(workers):
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if not done:
+                continue
+
+            workers.discard(pid)
+            workers.add(self._spawn(sock, application, options))
+            if os.waitstatus_to_exitcode(status):
+                self.stderr.write(f'Worker {pid} failed, replaced it.')
+
+    def _stop_workers(self, workers, timeout):
+        """Let the workers finish their requests, then kill the others."""
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + timeout
+        while workers and time.monotonic() < deadline:
+            for pid in list(workers):
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    workers.discard(pid)
+            time.sleep(0.1)
+
+        for pid in workers:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        workers.clear()
+
+    def _reload(self, sock, workers):
+        """Execute the server again, keeping the listening socket open.
+
+        The workers keep serving requests while the new code is loaded
+        and warmed up; they stay children of the server, which has the
+        same pid, and are stopped once the new workers are started.
+        """
+        self.stdout.write('Reloading.')
+        self.stdout.flush()
+        self.stderr.flush()
+        sock.set_inheritable(True)
+        os.environ[LISTEN_FD_ENV] = str(sock.fileno())
+        os.environ[FORMER_WORKERS_ENV] = ','.join(map(str, workers))
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def _report_memory(self, workers):
+        """Write the memory usage of the server and of each worker."""
+        self.stdout.write(f'{"pid":>8}{"RSS KiB":>10}{"PSS KiB":>10}'
+                          f'{"shared":>10}{"private":>10}')
+        for label, pid in [('master', os.getpid())] + [
+                ('worker', pid) for pid in sorted(workers)]:
+            usage = memory_usage(pid)
+            self.stdout.write(
+                f'{pid:>8}' + ''.join(
+                    f'{usage.get(key, "-"):>10}'
+                    for key in ('rss', 'pss', 'shared', 'private'))
+                + f'  {label}')
+        self.stdout.flush()
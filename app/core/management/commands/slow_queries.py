@@ -0,0 +1,99 @@
+"""
+Django command to report the queries recorded by the slow query log.
+"""
+import json
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from core.models import SlowQuery
+
+ORDERINGS = {
+    'total': '-total_time',
+    'max': '-max_time',
+    'count': '-count',
+    'mean': F('total_time') / F('count'),
+}
+
+
+class Command(BaseCommand):
+    """Django command to list the slowest queries by fingerprint."""
+    help = ('List the queries recorded by the slow query log '
+            '(SLOW_QUERY_THRESHOLD), aggregated by fingerprint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sort', choices=sorted(ORDERINGS), default='total',
+            help='Rank by total, mean or max time, or count '
+                 '(default: total).',
+        )
+        parser.add_argument(
+            '--limit', type=int, default=20,
+            help='Number of queries to list (default: 20).',
+        )
+        parser.add_argument(
+            '--view',
+            help='Only list the queries run by views whose name contains '
+                 'this text.',
+        )
+        parser.add_argument(
+            '--details', action='store_true',
+            help='Also show the slowest statement, its stack and plan.',
+        )
+        parser.add_argument('--json', action='store_true',
+                            help='Print the queries as JSON.')
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Delete the recorded queries instead of listing them.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if options['reset']:
+            deleted, _ = SlowQuery.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(
+                f'Deleted {deleted} slow quer{"y" if deleted == 1 else "ies"}.'
+            ))
+            return
+
+        ordering = ORDERINGS[options['sort']]
+        if not isinstance(ordering, str):
+            ordering = ordering.desc()
+        queries = [
+            query for query in SlowQuery.objects.order_by(ordering)
+            if not options['view'] or any(
+                options['view'] in view for view in query.views)
+        ][:options['limit']]
+
+        if options['json']:
+            self.stdout.write(json.dumps([{
+                'fingerprint': query.fingerprint,
+                'sql': query.sql,
+                'count': query.count,
+                'total_ms': query.total_time,
+                'mean_ms': query.mean_time,
+                'max_ms': query.max_time,
+                'views': query.views,
+                'example': query.example,
+                'stack': query.stack,
+                'plan': query.plan,
+                'last_seen': query.last_seen.isoformat(),
+            } for query in queries], indent=2))
+            return
+
+        self.stdout.write(f'{"count":>8}{"total ms":>12}{"mean ms":>10}'
+                          f'{"max ms":>10}  query')
+        for query in queries:
+            self.stdout.write(f'{query.count:>8}{query.total_time:>12.1f}'
+                              f'{query.mean_time:>10.1f}'
+                              f'{query.max_time:>10.1f}  {query.sql[:120]}')
+            if not options['details']:
+                continue
+
+            views = ', '.join(f'{view} ({count})' for view, count in sorted(
+                query.views.items(), key=lambda item: -item[1]))
+            self.stdout.write(f'    views: {views}')
+            self.stdout.write(f'    slowest: {query.example}')
+            self.stdout.write('    stack:\n' + query.stack)
+            if query.plan:
+                self.stdout.write('    plan:\n' + query.plan)
@@ -0,0 +1,184 @@
+"""
+Django command to profile the cold start of a server process.
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter started with -X importtime. The import
+# timings go to stderr, the phase timings are printed as JSON.
+PROFILE_SCRIPT = '''
+import json, sys, time
+
+path, warm = sys.argv[1], sys.argv[2] == '1'
+phases = {}
+ready = {}
+
+
+def timed(name, func):
+    start = time.perf_counter()
+    result = func()
+    phases[name] = (time.perf_counter() - start) * 1000
+    return result
+
+
+timed('import django.core.wsgi', lambda: __import__('django.core.wsgi'))
+
+from django.apps.config import AppConfig
+
+create = AppConfig.create.__func__
+
+
+def timed_create(cls, entry):
+    config = create(cls, entry)
+    config_ready = config.ready
+
+    def timed_ready():
+        start = time.perf_counter()
+        config_ready()
+        ready[config.label] = (time.perf_counter() - start) * 1000
+
+    config.ready = timed_ready
+    return config
+
+
+AppConfig.create = classmethod(timed_create)
+
+import django
+from django.conf import settings
+from django.urls import get_resolver
+
+timed('load settings', lambda: settings.INSTALLED_APPS)
+timed('django.setup()', django.setup)
+application = timed('WSGI handler', lambda: __import__(
+    'django.core.wsgi', fromlist=['x']).get_wsgi_application())
+timed('URL resolver', lambda: get_resolver()._populate())
+if warm:
+    from core.warmup import warm_up
+    timed('warm-up hook', warm_up)
+
+from django.test import Client
+settings.ALLOWED_HOSTS = ['*']
+client = Client()
+timed('first request', lambda: client.get(path))
+timed('second request', lambda: client.get(path))
+
+print(json.dumps({'phases': phases, 'ready': ready}))
+'''
+
+
+def parse_importtime(output):
+    """Return (self us, cumulative us, module, depth) of every import
+    listed by python -X importtime."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((int(self_us), int(cumulative_us), name.strip(),
+                        depth))
+
+    return imports
+
+
+def summarize_imports(imports, top):
+    """Return the import totals and the slowest modules and packages."""
+    packages = defaultdict(int)
+    for self_us, _cumulative, name, _depth in imports:
+        packages[name.split('.')[0]] += self_us
+
+    by_cumulative = sorted((entry for entry in imports if entry[3] == 0),
+                           key=lambda entry: -entry[1])
+    by_self = sorted(imports, key=lambda entry: -entry[0])
+    return {
+        'total_ms': sum(entry[0] for entry in imports) / 1000,
+        'modules': len(imports),
+        'top_level': [{'module': name, 'cumulative_ms': cumulative / 1000}
+                      for _self, cumulative, name, _ in by_cumulative[:top]],
+        'slowest_modules': [{'module': name, 'self_ms': self_us / 1000}
+                            for self_us, _, name, _ in by_self[:top]],
+        'packages': [
+            {'package': package, 'self_ms': self_us / 1000}
+            for package, self_us in sorted(packages.items(),
+                                           key=lambda item: -item[1])[:top]
+        ],
+    }
+
+
+class Command(BaseCommand):
+    """Django command to break down the startup time of the app."""
+    help = ('Profile a cold start in a fresh process: imports, settings, '
+            'django.setup(), each AppConfig.ready(), URL resolver and the '
+            'first requests.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default='/api/user/token/',
+            help='Path of the warm-up requests. The default answers 405 '
+                 'to GET, without a database query.',
+        )
+        parser.add_argument(
+            '--warm-up', action='store_true',
+            help='Run the core.warmup hook before the first request.',
+        )
+        parser.add_argument(
+            '--top', type=int, default=15,
+            help='Number of modules and packages to rank (default: 15).',
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the full report as JSON to this file.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROFILE_SCRIPT,
+             options['path'], '1' if options['warm_up'] else '0'],
+            cwd=settings.BASE_DIR, env=dict(os.environ), capture_output=True,
+            text=True,
+        )
+        if process.returncode:
+            raise CommandError(f'Profiling failed:\n{process.stderr}')
+
+        report = json.loads(process.stdout.splitlines()[-1])
+        report['settings'] = os.environ.get('DJANGO_SETTINGS_MODULE')
+        report['imports'] = summarize_imports(
+            parse_importtime(process.stderr), options['top'])
+
+        self._write_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+    def _write_report(self, report):
+        """Write the ranked human readable report."""
+        self.stdout.write(self.style.MIGRATE_HEADING('Phases'))
+        for name, ms in sorted(report['phases'].items(),
+                               key=lambda item: -item[1]):
+            self.stdout.write(f'  {ms:9.1f} ms  {name}')
+
+        self.stdout.write(self.style.MIGRATE_HEADING('AppConfig.ready()'))
+        for label, ms in sorted(report['ready'].items(),
+                                key=lambda item: -item[1]):
+            self.stdout.write(f'  {ms:9.1f} ms  {label}')
+
+        imports = report['imports']
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'Imports: {imports["modules"]} modules, '
+            f'{imports["total_ms"]:.1f} ms'))
+        for entry in imports['top_level']:
+            self.stdout.write(f'  {entry["cumulative_ms"]:9.1f} ms  '
+                              f'{entry["module"]}')
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Packages (self time)'))
+        for entry in imports['packages']:
+            self.stdout.write(f'  {entry["self_ms"]:9.1f} ms  '
+                              f'{entry["package"]}')
@@ -0,0 +1,230 @@
+"""
+Middleware of the project.
+"""
+import cProfile
+import marshal
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import APIException
+from rest_framework.views import APIView
+
+from core import concurrency, slow_queries
+from core.models import RequestProfile
+
+# Requests of staff users carrying this header are profiled.
+PROFILE_META_KEY = 'HTTP_X_PROFILE'
+# Slowest queries stored with a profile.
+MAX_STORED_QUERIES = 200
+
+# Whether a request runs under StatementTimeoutMiddleware.
+_in_request = ContextVar('in_request', default=False)
+
+
+def _staff_user(request):
+    """Return the staff user authenticated by the session or the token of
+    the request, or None."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user if user.is_staff else None
+
+    try:
+        result = TokenAuthentication().authenticate(request)
+    except APIException:
+        return None
+    if result is None or not result[0].is_staff:
+        return None
+
+    return result[0]
+
+
+class QueryTimer:
+    """Database execute wrapper recording the duration of each query."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'time': (time.perf_counter() - start) * 1000,
+                'many': many,
+            })
+
+
+class ProfilingMiddleware:
+    """Profile the requests of staff users sending an X-Profile header.
+
+    The whole view runs under cProfile, including authentication,
+    serialization and rendering, and every SQL query is timed. The
+    profile is stored as a RequestProfile, downloadable from the admin,
+    and its id returned in the X-Profile-Id response header. Other
+    requests only pay for one dictionary lookup.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if PROFILE_META_KEY not in request.META:
+            return self.get_response(request)
+
+        user = _staff_user(request)
+        if user is None:
+            return self.get_response(request)
+
+        return self._profile(request, user)
+
+    def _profile(self, request, user):
+        """Run the view under the profiler and store the profile."""
+        timer = QueryTimer()
+        profile = cProfile.Profile()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+            duration = (time.perf_counter() - start) * 1000
+
+        profile.create_stats()
+        queries = sorted(timer.queries, key=lambda query: -query['time'])
+        request_profile = RequestProfile.objects.create(
+            user=user,
+            method=request.method,
+            path=request.path,
+            query_string=request.META.get('QUERY_STRING', ''),
+            status_code=response.status_code,
+            duration=duration,
+            sql_count=len(queries),
+            sql_time=sum(query['time'] for query in queries),
+            queries=queries[:MAX_STORED_QUERIES],
+            stats=marshal.dumps(profile.stats),
+        )
+        response['X-Profile-Id'] = str(request_profile.pk)
+        return response
+
+
+class SlowQueryMiddleware:
+    """Attribute the slow queries to the view running them, and flush
+    the slow query log regularly. Unused without SLOW_QUERY_THRESHOLD."""
+
+    def __init__(self, get_response):
+        if slow_queries.log is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = slow_queries.current_view.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            slow_queries.current_view.reset(token)
+
+        if slow_queries.log.flush_due():
+            slow_queries.log.flush()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'cls', view_func)
+        slow_queries.current_view.set(
+            f'{view.__module__}.{view.__qualname__}')
+
+
+def _set_statement_timeout(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('SET statement_timeout = %s',
+                       [settings.DB_STATEMENT_TIMEOUT])
+
+
+@receiver(connection_created)
+def set_request_statement_timeout(sender, connection, **kwargs):
+    """Set the statement timeout of the connections opened by a request."""
+    if _in_request.get() and connection.vendor == 'postgresql':
+        _set_statement_timeout(connection)
+
+
+class StatementTimeoutMiddleware:
+    """Make Postgres cancel the statements of a request running longer
+    than DB_STATEMENT_TIMEOUT, and reset the timeout of the connections
+    after it, so migrations, commands and jobs sharing the settings run
+    without it. Connections are not opened for it. Unused when
+    DB_STATEMENT_TIMEOUT is 0."""
+
+    def __init__(self, get_response):
+        if not settings.DB_STATEMENT_TIMEOUT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        databases = [connection for connection in connections.all()
+                     if connection.vendor == 'postgresql']
+        for connection in databases:
+            # Kept open from a former request.
+            if connection.connection is not None:
+                _set_statement_timeout(connection)
+        token = _in_request.set(True)
+        try:
+            return self.get_response(request)
+        finally:
+            _in_request.reset(token)
+            for connection in databases:
+                if connection.connection is None:
+                    continue
+                try:
+                    with connection.cursor() as cursor:
+                        cursor.execute('RESET statement_timeout')
+                except DatabaseError:
+                    # Not reusable with the timeout of the request.
+                    connection.close()
+
+
+class LoadSheddingMiddleware:
+    """Shed the requests beyond the adaptive concurrency limit of the
+    process, and the ones cancelled by the statement timeout, with a 503
+    and Retry-After. API views are admitted by LoadSheddingThrottle. See
+    core.concurrency; unused without CONCURRENCY_LIMIT."""
+
+    def __init__(self, get_response):
+        if concurrency.limiter is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = concurrency.LatencyTimer()
+        request.concurrency_admitted = False
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                return self.get_response(request)
+        finally:
+            if request.concurrency_admitted:
+                concurrency.limiter.release(timer.latency, timer.timed_out)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'cls', view_func)
+        if isinstance(view, type) and issubclass(view, APIView):
+            # Admitted by LoadSheddingThrottle, once authenticated.
+            return None
+        if not concurrency.admit(request, view):
+            return concurrency.shed_response()
+
+    def process_exception(self, request, exception):
+        if concurrency.is_statement_timeout(exception):
+            return concurrency.shed_response()
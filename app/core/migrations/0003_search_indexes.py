@@ -0,0 +1,45 @@
+"""
+Indexes backing the admin prefix searches on recipes and users.
+
+The admin searches with case-insensitive lookups, which Django renders
+as UPPER(column::text) LIKE 'TERM%'. Postgres can only serve those from
+an expression index using the text_pattern_ops operator class, which is
+not expressible through models.Index on Django 3.2.
+"""
+from django.db import migrations
+
+INDEXES = [
+    ('core_recipe_title_upper_like', 'core_recipe', 'title'),
+    ('core_user_email_upper_like', 'core_user', 'email'),
+    ('core_user_name_upper_like', 'core_user', 'name'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for name, table, column in INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" '
+            f'(UPPER("{column}"::text) text_pattern_ops)'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for name, _table, _column in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_recipe'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-19 07:39
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_stats(apps, schema_editor):
+    Recipe = apps.get_model('core', 'Recipe')
+    RecipeStats = apps.get_model('core', 'RecipeStats')
+
+    stats = {}
+    totals = Recipe.objects.values('user').annotate(
+        recipe_count=models.Count('id'),
+        total_cost=models.Sum('cost'),
+        total_time_taken=models.Sum('time_taken'),
+    ).order_by()
+    for row in totals.iterator():
+        stats[row['user']] = RecipeStats(
+            user_id=row['user'],
+            recipe_count=row['recipe_count'],
+            total_cost=row['total_cost'],
+            total_time_taken=row['total_time_taken'],
+            time_taken_counts={},
+        )
+
+    histogram = Recipe.objects.values('user', 'time_taken').annotate(
+        count=models.Count('id'),
+    ).order_by()
+    for row in histogram.iterator():
+        counts = stats[row['user']].time_taken_counts
+        counts[str(row['time_taken'])] = row['count']
+
+    RecipeStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipe_stats', serialize=False, to='core.user')),
+                ('recipe_count', models.PositiveIntegerField(default=0)),
+                ('total_cost', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14)),
+                ('total_time_taken', models.BigIntegerField(default=0)),
+                ('time_taken_counts', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-19 07:58
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_requestprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40, unique=True)),
+                ('sql', models.TextField(help_text='Normalized statement.')),
+                ('example', models.TextField(help_text='Slowest statement, with values.')),
+                ('count', models.BigIntegerField(default=0)),
+                ('total_time', models.FloatField(default=0, help_text='Milliseconds.')),
+                ('max_time', models.FloatField(default=0, help_text='Milliseconds.')),
+                ('views', models.JSONField(default=dict)),
+                ('stack', models.TextField(blank=True)),
+                ('plan', models.TextField(blank=True)),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'slow queries',
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+"""
+First step of storing the recipe costs in cents: add the cost_cents
+column next to cost, and on Postgres a trigger keeping both in sync, so
+code writing either column works during the rollout. 0014 fills the
+existing rows in batches and 0015 drops cost.
+"""
+from django.db import migrations, models
+
+SYNC_FUNCTION = '''
+CREATE OR REPLACE FUNCTION core_recipe_sync_cost() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF NEW.cost_cents IS NULL OR (TG_OP = 'UPDATE'
+            AND NEW.cost IS DISTINCT FROM OLD.cost
+            AND NEW.cost_cents IS NOT DISTINCT FROM OLD.cost_cents) THEN
+        NEW.cost_cents := round(NEW.cost * 100);
+    ELSIF NEW.cost IS NULL OR (TG_OP = 'UPDATE'
+            AND NEW.cost_cents IS DISTINCT FROM OLD.cost_cents) THEN
+        NEW.cost := NEW.cost_cents / 100.0;
+    END IF;
+    RETURN NEW;
+END
+$$
+'''
+SYNC_TRIGGER = '''
+CREATE TRIGGER core_recipe_sync_cost BEFORE INSERT OR UPDATE ON core_recipe
+FOR EACH ROW EXECUTE FUNCTION core_recipe_sync_cost()
+'''
+
+
+def create_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(SYNC_FUNCTION)
+    schema_editor.execute(SYNC_TRIGGER)
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(
+        'DROP TRIGGER IF EXISTS core_recipe_sync_cost ON core_recipe')
+    schema_editor.execute('DROP FUNCTION IF EXISTS core_recipe_sync_cost()')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_recipe_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='cost_cents',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='cost',
+            field=models.DecimalField(decimal_places=2, max_digits=5,
+                                      null=True),
+        ),
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
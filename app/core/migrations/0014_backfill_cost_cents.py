@@ -0,0 +1,35 @@
+"""
+Fill cost_cents of the existing recipes, one range of IDs per
+transaction, so rows are only locked while their batch is written.
+"""
+from django.db import migrations, models
+from django.db.models.functions import Cast, Round
+
+BATCH_SIZE = 10000
+
+
+def backfill(apps, schema_editor):
+    Recipe = apps.get_model('core', 'Recipe')
+    bounds = Recipe.objects.aggregate(low=models.Min('id'),
+                                      high=models.Max('id'))
+    if bounds['low'] is None:
+        return
+
+    cents = Cast(Round(models.F('cost') * 100), models.BigIntegerField())
+    for start in range(bounds['low'], bounds['high'] + 1, BATCH_SIZE):
+        Recipe.objects.filter(
+            id__gte=start, id__lt=start + BATCH_SIZE, cost_cents__isnull=True,
+        ).update(cost_cents=cents)
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own.
+    atomic = False
+
+    dependencies = [
+        ('core', '0013_recipe_cost_cents'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
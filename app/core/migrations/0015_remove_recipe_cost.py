@@ -0,0 +1,71 @@
+"""
+Last step of storing the recipe costs in cents: make cost_cents required
+and drop cost. For a rollout without downtime, migrate to 0014 first and
+run this migration once no process runs code reading cost anymore.
+
+On Postgres, a validated CHECK constraint lets SET NOT NULL skip its
+scan of the table under an exclusive lock (Postgres 12+); validating it
+only blocks schema changes. The constraint is dropped once the column is
+NOT NULL, as the model state does not know about it, and added back
+before the column is made nullable again on reverse.
+"""
+from importlib import import_module
+
+from django.db import migrations, models
+
+CHECK = 'core_recipe_cost_cents_not_null'
+
+cost_cents = import_module('core.migrations.0013_recipe_cost_cents')
+
+
+def add_check(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(f'ALTER TABLE core_recipe ADD CONSTRAINT {CHECK} '
+                          f'CHECK (cost_cents IS NOT NULL) NOT VALID')
+    schema_editor.execute(f'ALTER TABLE core_recipe VALIDATE CONSTRAINT '
+                          f'{CHECK}')
+
+
+def drop_check(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(
+        f'ALTER TABLE core_recipe DROP CONSTRAINT IF EXISTS {CHECK}')
+
+
+def restore_cost(apps, schema_editor):
+    """Fill the restored cost column and sync it again."""
+    Recipe = apps.get_model('core', 'Recipe')
+    Recipe.objects.filter(cost__isnull=True).update(
+        cost=models.ExpressionWrapper(
+            models.F('cost_cents') / models.Value(100.0),
+            output_field=models.DecimalField(max_digits=5,
+                                             decimal_places=2)))
+    cost_cents.create_trigger(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+    # Validating the constraint must not hold the locks of what follows.
+    atomic = False
+
+    dependencies = [
+        ('core', '0014_backfill_cost_cents'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_check, drop_check),
+        migrations.AlterField(
+            model_name='recipe',
+            name='cost_cents',
+            field=models.BigIntegerField(),
+        ),
+        migrations.RunPython(drop_check, add_check),
+        migrations.RunPython(cost_cents.drop_trigger, restore_cost),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='cost',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_remove_recipe_cost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipestats',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -1,8 +1,16 @@
 """
 Database models.
 """
+import marshal
+import pstats
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.contrib.auth.models import (AbstractBaseUser,
                                         BaseUserManager,
                                         PermissionsMixin,)
@@ -37,11 +45,45 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Set when the account is deactivated pending deletion.
+    deletion_requested_at = models.DateTimeField(null=True, blank=True)
+    # Number of the last change of the recipes of the user, see
+    # next_recipe_change().
+    last_recipe_change = models.BigIntegerField(default=0, editable=False)
 
     USERNAME_FIELD = 'email'
     objects = UserManager()
 
 
+def next_recipe_change(user_id):
+    """
+    Return the number of a new change of the recipes of the user, to be
+    written in the current transaction. The counter of the user stays
+    locked until the transaction ends, so changes of the same user commit
+    in the order of their numbers.
+    """
+    users = User.objects.filter(pk=user_id)
+    users.update(last_recipe_change=F('last_recipe_change') + 1)
+    return users.values_list('last_recipe_change', flat=True).get()
+
+
+def to_cents(amount):
+    """Return a decimal amount as an integer number of cents."""
+    return int(Decimal(amount).scaleb(2).to_integral_value())
+
+
+def from_cents(cents):
+    """Return an integer number of cents as a decimal amount."""
+    return Decimal(cents).scaleb(-2)
+
+
+class RecipeManager(models.Manager):
+    """Manager for the recipes which are not deleted."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Recipe(models.Model):
     """Recipe model."""
     user = models.ForeignKey(
@@ -51,8 +93,331 @@ class Recipe(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     time_taken = models.IntegerField()
-    cost = models.DecimalField(max_digits=5, decimal_places=2)
+    # Integers are cheaper than numeric to aggregate, sort and load.
+    cost_cents = models.BigIntegerField()
     link = models.CharField(max_length=255, blank=True)
+    # Incremented on every write, for optimistic concurrency control.
+    version = models.PositiveIntegerField(default=1)
+    tags = models.ManyToManyField('Tag', blank=True)
+    ingredients = models.ManyToManyField('Ingredient', blank=True)
+    # Set on every write, including the conditional updates of the API.
+    updated_at = models.DateTimeField(auto_now=True)
+    # Number of the last change of the recipe among the changes of the
+    # recipes of its owner, for the changes feed of the sync clients.
+    # Every write takes the next one, see next_recipe_change().
+    change_number = models.BigIntegerField(default=0, editable=False)
+    # Deleted recipes are kept as tombstones for the sync clients until
+    # `manage.py purge_recipe_tombstones` removes them.
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = RecipeManager()
+    all_objects = models.Manager()
+
+    @property
+    def cost(self):
+        """Cost as a decimal amount."""
+        return None if self.cost_cents is None else from_cents(self.cost_cents)
+
+    @cost.setter
+    def cost(self, amount):
+        self.cost_cents = None if amount is None else to_cents(amount)
+
+    class Meta:
+        base_manager_name = 'all_objects'
+        indexes = [
+            # Serves the changes feed, in (change_number, id) order.
+            models.Index(fields=['user', 'change_number', 'id'],
+                         name='core_recipe_user_change'),
+            # Finds the recipes written since a build of the similar
+            # recipes index.
+            models.Index(fields=['user', 'updated_at', 'id'],
+                         name='core_recipe_user_updated'),
+            # Finds the tombstones to purge, only indexing those.
+            models.Index(fields=['deleted_at'], name='core_recipe_deleted_at',
+                         condition=models.Q(deleted_at__isnull=False)),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Save the recipe as the next change of the recipes of its
+        owner."""
+        with transaction.atomic(using=kwargs.get('using')):
+            self.change_number = next_recipe_change(self.user_id)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = [*update_fields, 'change_number']
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.title
+
+
+class Tag(models.Model):
+    """Tag for filtering recipes."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    name = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            # Also the index of the lookups by name of the serializers.
+            models.UniqueConstraint(fields=['user', 'name'],
+                                    name='core_tag_user_name'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class Ingredient(models.Model):
+    """Ingredient for recipes."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    name = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'],
+                                    name='core_ingredient_user_name'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeStatsManager(models.Manager):
+    """Manager for the per-user recipe statistics."""
+
+    def for_user(self, user):
+        """Return the statistics of the user, empty if none exist yet."""
+        try:
+            return self.get(user=user)
+        except self.model.DoesNotExist:
+            return self.model(user=user)
+
+    def apply(self, user, added=None, removed=None):
+        """
+        Fold a recipe change into the statistics of the user, after the
+        change has been written. `added` and `removed` are
+        (cost_cents, time_taken) pairs of the recipe values written and
+        replaced respectively.
+        """
+        if added == removed:
+            return
+
+        with transaction.atomic(using=self.db):
+            stats = self.select_for_update().filter(user=user).first()
+            if stats is None:
+                # Seed from the recipes, which already include the change.
+                # A concurrent first write of the user may insert first;
+                # its seed does not include this change, which is applied
+                # to it instead.
+                seed = self.rebuild(user)
+                try:
+                    with transaction.atomic(using=self.db):
+                        seed.save(force_insert=True)
+                    return
+                except IntegrityError:
+                    stats = self.select_for_update().get(user=user)
+
+            if removed is not None:
+                stats._add(*removed, sign=-1)
+            if added is not None:
+                stats._add(*added, sign=1)
+            stats.version += 1
+            stats.save()
+
+    def rebuild(self, user):
+        """Recompute the statistics of the user from their recipes, as
+        the version following the stored one."""
+        stats = self.model(user=user)
+        stats.version = 1 + (self.filter(user=user).values_list(
+            'version', flat=True).first() or 0)
+        recipes = Recipe.objects.filter(user=user)
+        for cost_cents, time_taken in recipes.values_list('cost_cents',
+                                                          'time_taken'):
+            stats._add(cost_cents, time_taken, sign=1)
+
+        return stats
+
+
+class RecipeStats(models.Model):
+    """Denormalized recipe statistics, maintained on every write."""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recipe_stats',
+    )
+    recipe_count = models.PositiveIntegerField(default=0)
+    total_cost = models.DecimalField(max_digits=14, decimal_places=2,
+                                     default=Decimal('0'))
+    total_time_taken = models.BigIntegerField(default=0)
+    # Number of recipes per time_taken value, keyed by the value.
+    time_taken_counts = models.JSONField(default=dict)
+    # Incremented on every change, to key caches derived from the recipe
+    # costs and times, such as the analytics.
+    version = models.PositiveBigIntegerField(default=0)
+
+    objects = RecipeStatsManager()
+
+    @property
+    def average_cost(self):
+        if not self.recipe_count:
+            return None
+
+        return (self.total_cost / self.recipe_count).quantize(Decimal('.01'))
+
+    @property
+    def median_time_taken(self):
+        if not self.recipe_count:
+            return None
+
+        # Zero based positions of the middle value(s).
+        low, high = (self.recipe_count - 1) // 2, self.recipe_count // 2
+        values = []
+        seen = 0
+        for time_taken in sorted(self.time_taken_counts, key=int):
+            seen += self.time_taken_counts[time_taken]
+            while len(values) < 2 and seen > (low, high)[len(values)]:
+                values.append(int(time_taken))
+            if len(values) == 2:
+                break
+
+        return sum(values) / 2
+
+    def _add(self, cost_cents, time_taken, sign):
+        """Add (sign=1) or remove (sign=-1) one recipe."""
+        self.recipe_count += sign
+        self.total_cost += sign * from_cents(cost_cents)
+        self.total_time_taken += sign * time_taken
+
+        key = str(time_taken)
+        count = self.time_taken_counts.get(key, 0) + sign
+        if count:
+            self.time_taken_counts[key] = count
+        else:
+            self.time_taken_counts.pop(key, None)
+
+    def __str__(self):
+        return f'Recipe statistics of {self.user}'
+
+
+class AnalyticsSnapshot(models.Model):
+    """Precomputed analytics document, refreshed periodically."""
+    name = models.CharField(max_length=50, unique=True)
+    data = models.JSONField()
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Job(models.Model):
+    """Background job, run by `manage.py run_workers`."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=255)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers only ever look for due queued jobs.
+            models.Index(fields=['run_at'], name='core_job_queued_run_at',
+                         condition=models.Q(status='queued')),
+        ]
+
+    @property
+    def wait_time(self):
+        """Time between the job being due and its last start."""
+        if self.started_at is None:
+            return None
+
+        return max(self.started_at - self.run_at, timedelta(0))
+
+    @property
+    def run_time(self):
+        """Duration of the last run."""
+        if self.started_at is None or self.finished_at is None:
+            return None
+
+        return self.finished_at - self.started_at
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+class RequestProfile(models.Model):
+    """Profile of one request, captured by core.middleware."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.SET_NULL, null=True,
+                             related_name='+')
+    method = models.CharField(max_length=10)
+    path = models.TextField()
+    query_string = models.TextField(blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration = models.FloatField(help_text='Milliseconds, while profiled.')
+    sql_count = models.PositiveIntegerField()
+    sql_time = models.FloatField(help_text='Milliseconds.')
+    queries = models.JSONField(default=list)
+    # Marshalled cProfile stats, in the format of pstats.dump_stats().
+    stats = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def get_stats(self, stream=None):
+        """Return the cProfile stats as pstats.Stats."""
+        profile = SimpleNamespace(stats=marshal.loads(bytes(self.stats)),
+                                  create_stats=lambda: None)
+        return pstats.Stats(profile, stream=stream)
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.created_at:%Y-%m-%d %H:%M})'
+
+
+class SlowQuery(models.Model):
+    """Queries over the slow query threshold, aggregated by fingerprint
+    by core.slow_queries."""
+    fingerprint = models.CharField(max_length=40, unique=True)
+    sql = models.TextField(help_text='Normalized statement.')
+    example = models.TextField(help_text='Slowest statement, with values.')
+    count = models.BigIntegerField(default=0)
+    total_time = models.FloatField(default=0, help_text='Milliseconds.')
+    max_time = models.FloatField(default=0, help_text='Milliseconds.')
+    views = models.JSONField(default=dict)
+    stack = models.TextField(blank=True)
+    plan = models.TextField(blank=True)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name_plural = 'slow queries'
+
+    @property
+    def mean_time(self):
+        """Mean duration in milliseconds."""
+        return self.total_time / self.count if self.count else 0
+
+    def __str__(self):
+        return self.sql[:80]
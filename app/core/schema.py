@@ -0,0 +1,118 @@
+"""
+Precomputed OpenAPI schema, served from memory.
+
+Generating the schema introspects every view and serializer, so it is
+done once per process and code version. The rendered documents are kept
+in memory with their gzipped bodies and ETags. With SCHEMA_CACHE_DIR
+set, they are also written to disk, keyed by a fingerprint of the
+project sources, so new processes reuse them until the code changes.
+`manage.py build_schema` prebuilds them.
+"""
+import gzip
+import hashlib
+from collections import namedtuple
+from contextlib import nullcontext
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import translation
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from drf_spectacular.views import SpectacularAPIView
+
+SchemaDocument = namedtuple('SchemaDocument', ['body', 'gzipped', 'etag'])
+
+# Rendered documents, keyed by (format, language).
+_documents = {}
+
+
+@lru_cache(maxsize=None)
+def source_fingerprint():
+    """Return a hash of the Python sources of the project."""
+    digest = hashlib.sha256()
+    base_dir = Path(settings.BASE_DIR)
+    for path in sorted(base_dir.rglob('*.py')):
+        digest.update(str(path.relative_to(base_dir)).encode())
+        digest.update(path.read_bytes())
+
+    return digest.hexdigest()[:16]
+
+
+def _cache_path(schema_format):
+    """Return the file caching the schema in this format, if enabled."""
+    cache_dir = getattr(settings, 'SCHEMA_CACHE_DIR', None)
+    if not cache_dir:
+        return None
+
+    return Path(cache_dir) / f'schema-{source_fingerprint()}.{schema_format}'
+
+
+def _document(body):
+    """Precompute the gzipped body and the ETag of a rendered schema."""
+    etag = '"{}"'.format(hashlib.sha256(body).hexdigest()[:32])
+    return SchemaDocument(body, gzip.compress(body, 9), etag)
+
+
+def render_schema(renderer, lang=None, urlconf=None):
+    """Generate the schema and render it with the renderer."""
+    generator = SpectacularAPIView.generator_class(urlconf=urlconf)
+    with translation.override(lang) if lang else nullcontext():
+        schema = generator.get_schema(request=None, public=True)
+
+    return renderer.render(schema, renderer_context={})
+
+
+def get_document(renderer, lang=None, urlconf=None):
+    """Return the schema document in the format of the renderer,
+    generating it at most once per process and code version. Languages
+    not in LANGUAGES get the default one, so the documents are bounded."""
+    if lang not in dict(settings.LANGUAGES):
+        lang = None
+    key = (renderer.format, lang)
+    document = _documents.get(key)
+    if document is not None:
+        return document
+
+    path = _cache_path(renderer.format) if lang is None else None
+    if path is not None and path.exists():
+        body = path.read_bytes()
+    else:
+        body = render_schema(renderer, lang=lang, urlconf=urlconf)
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(body)
+
+    document = _documents[key] = _document(body)
+    return document
+
+
+def clear_documents():
+    """Forget the documents generated by this process."""
+    _documents.clear()
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    """Serve the OpenAPI schema from memory, with ETag and gzip."""
+
+    def _get_schema_response(self, request):
+        renderer = request.accepted_renderer
+        lang = request.GET.get('lang') if settings.USE_I18N else None
+        document = get_document(renderer, lang=lang, urlconf=self.urlconf)
+
+        if document.etag in parse_etags(
+                request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = HttpResponse(document.gzipped,
+                                    content_type=renderer.media_type)
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(document.body,
+                                    content_type=renderer.media_type)
+
+        response['ETag'] = document.etag
+        patch_vary_headers(response, ['Accept', 'Accept-Encoding'])
+        return response
@@ -0,0 +1,235 @@
+"""
+Slow query log.
+
+With SLOW_QUERY_THRESHOLD set, an execute wrapper is installed on every
+database connection. A sample (SLOW_QUERY_SAMPLE_RATE) of the queries
+taking longer than the threshold is recorded with the view running it
+and the Python stack, and with SLOW_QUERY_EXPLAIN their plan. Records
+are aggregated in memory by fingerprint, the statement with its values
+replaced by placeholders, in a bounded table. core.middleware flushes
+them regularly to core.SlowQuery, read by `manage.py slow_queries` and
+the admin.
+"""
+import atexit
+import hashlib
+import random
+import re
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+# Fingerprints kept in memory between flushes, and in core.SlowQuery.
+MAX_FINGERPRINTS = 500
+MAX_STORED_FINGERPRINTS = 1000
+# Seconds between flushes to the database.
+FLUSH_INTERVAL = 30
+# Views kept per fingerprint, and frames per stack.
+MAX_VIEWS = 20
+STACK_DEPTH = 12
+
+# View handling the current request, set by core.middleware.
+current_view = ContextVar('slow_query_view', default=None)
+# Set while the log itself queries the database.
+_suspended = ContextVar('slow_query_suspended', default=False)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """Return the statement with its values replaced by placeholders,
+    and lists of values by a single placeholder."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    """Return the normalized statement and its hash."""
+    normalized = normalize(sql)
+    return normalized, hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def _stack():
+    """Return the calling frames outside of the database layer."""
+    frames = [
+        frame for frame in traceback.extract_stack()[:-3]
+        if '/django/db/' not in frame.filename
+        and frame.filename != __file__
+    ]
+    return ''.join(traceback.format_list(frames[-STACK_DEPTH:]))
+
+
+def _explain(connection, sql, params):
+    """Return the plan of a SELECT statement, or an empty string."""
+    if sql.lstrip()[:6].upper() != 'SELECT':
+        return ''
+
+    token = _suspended.set(True)
+    try:
+        # In a savepoint, so a failure does not abort the transaction.
+        with transaction.atomic(using=connection.alias), \
+                connection.cursor() as cursor:
+            cursor.execute(
+                f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return '\n'.join(' '.join(str(column) for column in row)
+                             for row in cursor.fetchall())
+    except Exception as error:
+        return f'EXPLAIN failed: {error}'
+    finally:
+        _suspended.reset(token)
+
+
+class SlowQueryLog:
+    """Slow queries of this process, aggregated by fingerprint."""
+
+    def __init__(self, threshold, sample_rate=1.0, explain=False):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.explain = explain
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute wrapper timing the query."""
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - start) * 1000
+        if (duration >= self.threshold and not _suspended.get()
+                and random.random() < self.sample_rate):
+            self.record(sql, params, many, duration, context['connection'])
+
+        return result
+
+    def install(self, connection):
+        """Add the execute wrapper to a database connection."""
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def record(self, sql, params, many, duration, connection):
+        """Aggregate one slow query."""
+        normalized, key = fingerprint(sql)
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                if len(self.entries) >= MAX_FINGERPRINTS:
+                    # Forget the fingerprint seen least recently.
+                    self.entries.popitem(last=False)
+                entry = {'sql': normalized, 'count': 0, 'total_time': 0.0,
+                         'max_time': 0.0, 'views': {}}
+            self.entries[key] = entry
+
+            entry['count'] += 1
+            entry['total_time'] += duration
+            view = current_view.get() or '-'
+            if view in entry['views'] or len(entry['views']) < MAX_VIEWS:
+                entry['views'][view] = entry['views'].get(view, 0) + 1
+            slowest = duration > entry['max_time']
+            if slowest:
+                entry['max_time'] = duration
+                entry['example'] = f'{sql} -- {params!r}'[:10000]
+                entry['stack'] = _stack()
+
+        # The plan of the slowest execution is captured outside the lock.
+        if slowest and self.explain and not many:
+            entry['plan'] = _explain(connection, sql, params)
+
+    def flush_due(self):
+        """Tell whether the entries should be written to the database."""
+        return (self.entries
+                and time.monotonic() - self.flushed_at >= FLUSH_INTERVAL)
+
+    def flush(self):
+        """Add the aggregated entries to core.SlowQuery, keeping at most
+        MAX_STORED_FINGERPRINTS rows."""
+        from core.models import SlowQuery
+
+        with self.lock:
+            entries, self.entries = self.entries, OrderedDict()
+            self.flushed_at = time.monotonic()
+        if not entries:
+            return 0
+
+        token = _suspended.set(True)
+        try:
+            try:
+                with transaction.atomic():
+                    self._save(SlowQuery, entries)
+            except IntegrityError:
+                # Another process stored a new fingerprint meanwhile.
+                with transaction.atomic():
+                    self._save(SlowQuery, entries)
+        finally:
+            _suspended.reset(token)
+
+        return len(entries)
+
+    def _save(self, model, entries):
+        """Merge the entries into the stored rows."""
+        now = timezone.now()
+        stored = model.objects.select_for_update().in_bulk(
+            list(entries), field_name='fingerprint')
+        for key, entry in entries.items():
+            row = stored.get(key)
+            if row is None:
+                row = model(fingerprint=key, sql=entry['sql'])
+            for view, count in entry['views'].items():
+                if view in row.views or len(row.views) < MAX_VIEWS:
+                    row.views[view] = row.views.get(view, 0) + count
+            if entry['max_time'] > row.max_time:
+                row.max_time = entry['max_time']
+                row.example = entry['example']
+                row.stack = entry['stack']
+                row.plan = entry.get('plan', row.plan)
+            row.count += entry['count']
+            row.total_time += entry['total_time']
+            row.last_seen = now
+            row.save()
+
+        stale = model.objects.order_by('-last_seen').values_list(
+            'pk', flat=True)[MAX_STORED_FINGERPRINTS:]
+        model.objects.filter(pk__in=list(stale)).delete()
+
+
+# Log of this process, set up by install() when a threshold is set.
+log = None
+
+
+def install():
+    """Record the slow queries of every connection of this process."""
+    global log
+    threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD', None)
+    if threshold is None or log is not None:
+        return
+
+    log = SlowQueryLog(threshold,
+                       sample_rate=settings.SLOW_QUERY_SAMPLE_RATE,
+                       explain=settings.SLOW_QUERY_EXPLAIN)
+    for connection in connections.all():
+        log.install(connection)
+    connection_created.connect(_connection_created)
+    atexit.register(_flush_at_exit)
+
+
+def _connection_created(sender, connection, **kwargs):
+    log.install(connection)
+
+
+def _flush_at_exit():
+    try:
+        log.flush()
+    except Exception:
+        pass
@@ -0,0 +1,31 @@
+"""
+Background jobs of the core app.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from core import deletion
+from core.jobs import job
+from core.models import RecipeStats
+
+
+@job
+def delete_user(user_id):
+    """Delete a user whose deletion was requested, with their recipes."""
+    user = get_user_model().objects.filter(
+        pk=user_id, deletion_requested_at__isnull=False).first()
+    if user is not None:
+        deletion.delete_user(user)
+
+
+@job
+def rebuild_recipe_stats(user_id):
+    """Recompute the recipe statistics of a user."""
+    user = get_user_model().objects.filter(pk=user_id).first()
+    if user is None:
+        return
+
+    with transaction.atomic():
+        # Lock the row so concurrent recipe writes wait for the rebuild.
+        RecipeStats.objects.select_for_update().filter(user=user).first()
+        RecipeStats.objects.rebuild(user).save()
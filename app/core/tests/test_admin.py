@@ -1,10 +1,15 @@
 """
 Tests for the Django admin administration
 """
+from decimal import Decimal
+
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from core import models
+from core.admin import EstimatedCountPaginator
+
 
 class AdminSiteTests(TestCase):
     """Tests for Django Admin."""
@@ -44,6 +49,25 @@ class AdminSiteTests(TestCase):
         # Assertions
         self.assertEqual(response.status_code, 200)
 
+    def test_delete_user_page_counts_recipes(self):
+        """Test the delete user page summarizes the recipes to delete."""
+        models.Recipe.objects.create(user=self.user, title='Sample recipe',
+                                     time_taken=5, cost=Decimal('5.50'))
+        url = reverse('admin:core_user_delete', args=[self.user.id])
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Sample recipe')
+
+    def test_delete_user_requests_deletion(self):
+        """Test deleting a user deactivates them for later deletion."""
+        url = reverse('admin:core_user_delete', args=[self.user.id])
+        self.client.post(url, {'post': 'yes'})
+
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deletion_requested_at)
+
     def test_add_user_page(self):
         """Test the add user page works."""
         url = reverse('admin:core_user_add')
@@ -51,3 +75,159 @@ class AdminSiteTests(TestCase):
 
         # Assertions
         self.assertEqual(response.status_code, 200)
+
+
+class RecipeAdminTests(TestCase):
+    """Tests for the recipe admin pages."""
+
+    def setUp(self):
+        """Create a superuser, a recipe owner and a recipe."""
+        self.client = Client()
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='testpass@123'
+        )
+        self.client.force_login(self.admin_user)
+
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass@123',
+            name='Test User'
+        )
+        self.recipe = models.Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_taken=5,
+            cost=Decimal('5.50'),
+        )
+
+    def test_recipe_list(self):
+        """Test that recipes are listed with their owner."""
+        url = reverse('admin:core_recipe_changelist')
+        response = self.client.get(url)
+
+        self.assertContains(response, self.recipe.title)
+        self.assertContains(response, self.user.email)
+
+    def test_recipe_search(self):
+        """Test searching recipes by title prefix and owner email."""
+        other = models.Recipe.objects.create(
+            user=self.admin_user,
+            title='Other dish',
+            time_taken=5,
+            cost=Decimal('1.00'),
+        )
+        url = reverse('admin:core_recipe_changelist')
+
+        response = self.client.get(url, {'q': 'sample'})
+        self.assertContains(response, self.recipe.title)
+        self.assertNotContains(response, other.title)
+
+        response = self.client.get(url, {'q': 'USER@example.com'})
+        self.assertContains(response, self.recipe.title)
+        self.assertNotContains(response, other.title)
+
+    def test_edit_recipe_page_uses_autocomplete(self):
+        """Test the recipe change page does not list every user."""
+        other_user = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass@123',
+        )
+        url = reverse('admin:core_recipe_change', args=[self.recipe.id])
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, other_user.email)
+
+    def test_paginator_counts_exactly_without_statistics(self):
+        """Test the paginator falls back to an exact count."""
+        paginator = EstimatedCountPaginator(
+            models.Recipe.objects.order_by('id'), 100
+        )
+
+        self.assertEqual(paginator.count, 1)
+
+    def test_job_list(self):
+        """Test that background jobs are listed."""
+        models.Job.objects.create(name='core.tasks.delete_user')
+        url = reverse('admin:core_job_changelist')
+        response = self.client.get(url)
+
+        self.assertContains(response, 'core.tasks.delete_user')
+
+    def test_rename_tag_increments_recipe_version(self):
+        """Test renaming a tag changes the version of its recipes."""
+        tag = models.Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe.tags.add(tag)
+        url = reverse('admin:core_tag_change', args=[tag.id])
+
+        response = self.client.post(url, {'user': self.user.id,
+                                          'name': 'Vegetarian'})
+
+        self.assertEqual(response.status_code, 302)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.version, 2)
+
+    def test_delete_tag_increments_recipe_version(self):
+        """Test deleting a tag changes the version of its recipes."""
+        tag = models.Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe.tags.add(tag)
+        url = reverse('admin:core_tag_delete', args=[tag.id])
+
+        self.client.post(url, {'post': 'yes'})
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.version, 2)
+        self.assertFalse(models.Tag.objects.exists())
+
+    def test_delete_recipe_keeps_tombstone(self):
+        """Test deleting a recipe keeps it as a change for the sync
+        clients."""
+        change_number = self.recipe.change_number
+        url = reverse('admin:core_recipe_delete', args=[self.recipe.id])
+
+        self.client.post(url, {'post': 'yes'})
+
+        recipe = models.Recipe.all_objects.get(pk=self.recipe.pk)
+        self.assertIsNotNone(recipe.deleted_at)
+        self.assertEqual(recipe.version, 2)
+        self.assertGreater(recipe.change_number, change_number)
+
+    def test_delete_selected_recipes_keeps_tombstones(self):
+        """Test the delete action keeps the recipes as tombstones."""
+        url = reverse('admin:core_recipe_changelist')
+
+        self.client.post(url, {'action': 'delete_selected', 'post': 'yes',
+                               '_selected_action': [self.recipe.id]})
+
+        self.assertFalse(models.Recipe.objects.exists())
+        self.assertIsNotNone(
+            models.Recipe.all_objects.get(pk=self.recipe.pk).deleted_at)
+
+    def test_edit_recipe_updates_stats(self):
+        """Test adding and changing recipes updates the statistics of
+        their owner."""
+        models.RecipeStats.objects.rebuild(self.user).save()
+        data = {'user': self.user.id, 'title': 'Other recipe',
+                'time_taken': 10, 'cost_cents': 250}
+
+        self.client.post(reverse('admin:core_recipe_add'), data)
+        self.client.post(
+            reverse('admin:core_recipe_change', args=[self.recipe.id]),
+            {**data, 'title': 'Sample recipe', 'cost_cents': 150})
+
+        stats = models.RecipeStats.objects.get(user=self.user)
+        self.assertEqual(stats.recipe_count, 2)
+        self.assertEqual(stats.total_cost, Decimal('4.00'))
+        self.assertEqual(stats.total_time_taken, 20)
+
+    def test_delete_recipe_updates_stats(self):
+        """Test deleting a recipe removes it from the statistics."""
+        models.RecipeStats.objects.rebuild(self.user).save()
+        url = reverse('admin:core_recipe_delete', args=[self.recipe.id])
+
+        self.client.post(url, {'post': 'yes'})
+
+        stats = models.RecipeStats.objects.get(user=self.user)
+        self.assertEqual(stats.recipe_count, 0)
@@ -1,13 +1,41 @@
 """
 Test custom Django manangement commands.
 """
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import skipIf, skipUnless
 from unittest.mock import patch
+from urllib.error import HTTPError
+from urllib.request import urlopen
 
 from psycopg2 import OperationalError as Psycopg2Error
 
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from core import jobs, warmup
+from core.management.commands import (audit_queries, partition_recipes,
+                                      serve, startup_profile)
+from core.models import Recipe, RecipeStats, Tag
+from recipe import serializers as recipe_serializers
 
 
 @patch("core.management.commands.wait_for_db.Command.check")
@@ -33,3 +61,461 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class RecipeStatsCommandTests(TestCase):
+    """Test the recipe_stats command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testPassword'
+        )
+        Recipe.objects.create(user=self.user, title='Sample recipe',
+                              time_taken=5, cost=Decimal('2.50'))
+
+    def test_verify_reports_stale_statistics(self):
+        """Test --verify fails without changing stale statistics."""
+        with self.assertRaises(CommandError):
+            call_command('recipe_stats', verify=True, stdout=StringIO())
+
+        self.assertFalse(RecipeStats.objects.exists())
+
+    def test_rebuild_statistics(self):
+        """Test the command rebuilds statistics which then verify."""
+        call_command('recipe_stats', stdout=StringIO())
+
+        stats = RecipeStats.objects.get(user=self.user)
+        self.assertEqual(stats.recipe_count, 1)
+        self.assertEqual(stats.total_cost, Decimal('2.50'))
+        call_command('recipe_stats', verify=True, stdout=StringIO())
+
+    def test_enqueue_rebuild(self):
+        """Test --enqueue leaves the rebuild to a background job."""
+        call_command('recipe_stats', enqueue=True, stdout=StringIO())
+        self.assertFalse(RecipeStats.objects.exists())
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(
+            RecipeStats.objects.get(user=self.user).recipe_count, 1)
+        call_command('recipe_stats', verify=True, stdout=StringIO())
+
+
+class AuditQueriesCommandTests(TestCase):
+    """Test the audit_queries command."""
+
+    def test_every_route_is_audited(self):
+        """Test the audit scenarios cover every API route."""
+        audited = {name for name, *_ in audit_queries.SCENARIOS}
+
+        self.assertEqual(audit_queries.route_names() - audited, set())
+
+    def test_scenario_requests(self):
+        """Test the URL and data of every scenario can be built."""
+        user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123')
+        recipe = Recipe.objects.create(user=user, title='Sample recipe',
+                                       time_taken=5, cost=Decimal('5.50'))
+        tag = Tag.objects.create(user=user, name='Vegan')
+        context = {'user': user, 'audit_user': user, 'recipe': recipe,
+                   'tag': tag}
+
+        for name, method, url_args, data in audit_queries.SCENARIOS:
+            with self.subTest(name=name, method=method):
+                reverse(name, args=url_args(context) if url_args else None)
+                if data:
+                    self.assertIsInstance(data(context), dict)
+
+    def test_plan_issues(self):
+        """Test sequential scans and bad estimates are flagged."""
+        plan = {'Plan': {
+            'Node Type': 'Sort',
+            'Plan Rows': 50000,
+            'Actual Rows': 3,
+            'Actual Loops': 1,
+            'Plans': [{
+                'Node Type': 'Seq Scan',
+                'Relation Name': 'core_recipe',
+                'Filter': '(user_id = 1)',
+                'Plan Rows': 50000,
+                'Actual Rows': 3,
+                'Actual Loops': 1,
+                'Rows Removed by Filter': 200000,
+            }],
+        }}
+
+        issues = audit_queries.plan_issues(plan)
+
+        types = [(issue['type'], issue['relation']) for issue in issues]
+        self.assertIn(('seq_scan', 'core_recipe'), types)
+        self.assertIn(('missing_index', 'core_recipe'), types)
+        self.assertIn(('high_row_estimate', 'core_recipe'), types)
+        self.assertIn(('misestimate', 'core_recipe'), types)
+
+    def test_index_scan_has_no_issues(self):
+        """Test a small index scan is not flagged."""
+        plan = {'Plan': {
+            'Node Type': 'Index Scan',
+            'Relation Name': 'core_recipe',
+            'Plan Rows': 1,
+            'Actual Rows': 1,
+            'Actual Loops': 1,
+        }}
+
+        self.assertEqual(audit_queries.plan_issues(plan), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requires PostgreSQL.')
+    def test_audit_writes_json_report(self):
+        """Test the audit runs every route and rolls back its writes."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            call_command('audit_queries', json_path=path, stdout=StringIO())
+            with open(path) as report_file:
+                report = json.load(report_file)
+
+        self.assertEqual(len(report['routes']),
+                         len(audit_queries.SCENARIOS))
+        self.assertEqual(report['unaudited_routes'], [])
+        self.assertFalse(Recipe.objects.exists())
+
+
+class PartitionRecipesCommandTests(TestCase):
+    """Test the partition_recipes command."""
+
+    def test_partitions_in_plan(self):
+        """Test listing the partitions read by a plan."""
+        plan = {'Plan': {'Node Type': 'Append', 'Plans': [
+            {'Node Type': 'Index Scan', 'Relation Name': 'core_recipe_p3'},
+            {'Node Type': 'Seq Scan', 'Relation Name': 'core_recipe_tags'},
+        ]}}
+
+        self.assertEqual(partition_recipes.partitions_in_plan(plan),
+                         {'core_recipe_p3'})
+
+    @skipIf(connection.vendor == 'postgresql', 'Runs on other databases.')
+    def test_requires_postgresql(self):
+        """Test the command refuses to run on other databases."""
+        with self.assertRaises(CommandError):
+            call_command('partition_recipes', 'prepare', stdout=StringIO())
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requires PostgreSQL.')
+    def test_viewset_queries_prune_to_one_partition(self):
+        """Test the rows are moved online, and every recipe query of the
+        API reads a single partition afterwards."""
+        user = get_user_model().objects.create_user('test@example.com',
+                                                    'testPassword')
+        other = get_user_model().objects.create_user('other@example.com',
+                                                     'testPassword')
+        tag = Tag.objects.create(user=user, name='Vegan')
+        for owner in [user, other] * 5:
+            Recipe.objects.create(user=owner, title='Recipe', time_taken=5,
+                                  cost=Decimal('1.00')).tags.add(tag)
+        out = StringIO()
+
+        call_command('partition_recipes', 'prepare', partitions=4,
+                     stdout=out)
+        # Written while the rows are copied, through the mirror trigger.
+        Recipe.objects.create(user=other, title='Mirrored', time_taken=5,
+                              cost=Decimal('1.00'))
+        Recipe.objects.filter(user=user).update(time_taken=7)
+        call_command('partition_recipes', 'copy', batch_size=3, stdout=out)
+        call_command('partition_recipes', 'swap', stdout=out)
+
+        self.assertEqual(Recipe.objects.count(), 11)
+        self.assertEqual(Recipe.objects.filter(time_taken=7).count(), 5)
+        client = APIClient()
+        client.force_authenticate(user)
+        recipe = Recipe.objects.filter(user=user).first()
+        detail = reverse('recipe:recipe-detail', args=[recipe.id])
+        payload = {'title': 'New', 'time_taken': 8, 'cost': '2.00',
+                   'tags': [{'name': 'Quick'}]}
+        requests = [
+            ('get', reverse('recipe:recipe-list'), None),
+            ('get', reverse('recipe:recipe-list'), {'tags': tag.id}),
+            ('post', reverse('recipe:recipe-list'), payload),
+            ('get', detail, None),
+            ('patch', detail, {'title': 'Patched'}),
+            ('put', detail, payload),
+            ('delete', detail, None),
+        ]
+        for method, url, data in requests:
+            with CaptureQueriesContext(connection) as captured:
+                response = getattr(client, method)(url, data, format='json')
+            self.assertLess(response.status_code, 300)
+
+            for query in captured.captured_queries:
+                sql = query['sql']
+                if ('"core_recipe"' not in sql
+                        or sql.startswith(('INSERT', 'SAVEPOINT'))):
+                    continue
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                    plan = cursor.fetchone()[0][0]
+                self.assertEqual(
+                    len(partition_recipes.partitions_in_plan(plan)), 1,
+                    f'{method.upper()} {url}: {sql}')
+
+
+class DeleteUsersCommandTests(TestCase):
+    """Test the delete_users command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testPassword'
+        )
+        Recipe.objects.bulk_create([
+            Recipe(user=self.user, title='Sample recipe', time_taken=5,
+                   cost=Decimal('2.50'))
+            for _ in range(5)
+        ])
+
+    def test_delete_user_in_batches(self):
+        """Test the recipes are deleted in batches before the user."""
+        out = StringIO()
+        call_command('delete_users', 'test@example.com', batch_size=2,
+                     stdout=out)
+
+        self.assertIn('2/5', out.getvalue())
+        self.assertIn('5/5', out.getvalue())
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists())
+
+    def test_delete_pending_users(self):
+        """Test --pending only deletes users who requested deletion."""
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testPassword'
+        )
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            deletion_requested_at=timezone.now())
+
+        call_command('delete_users', pending=True, stdout=StringIO())
+
+        users = get_user_model().objects.all()
+        self.assertEqual(list(users), [other])
+
+    def test_delete_user_with_tombstones(self):
+        """Test the deleted recipes of the user are deleted too."""
+        Recipe.objects.update(deleted_at=timezone.now())
+
+        call_command('delete_users', 'test@example.com', stdout=StringIO())
+
+        self.assertFalse(Recipe.all_objects.exists())
+
+
+class PurgeRecipeTombstonesCommandTests(TestCase):
+    """Test the purge_recipe_tombstones command."""
+
+    def test_purge_old_tombstones(self):
+        """Test only tombstones older than the retention are deleted."""
+        user = get_user_model().objects.create_user('test@example.com',
+                                                    'testPassword')
+        old, recent, live = [
+            Recipe.objects.create(user=user, title='Sample recipe',
+                                  time_taken=5, cost=Decimal('2.50'))
+            for _ in range(3)
+        ]
+        Recipe.objects.filter(pk=old.pk).update(
+            deleted_at=timezone.now() - timedelta(days=40))
+        Recipe.objects.filter(pk=recent.pk).update(
+            deleted_at=timezone.now() - timedelta(days=1))
+
+        out = StringIO()
+        call_command('purge_recipe_tombstones', days=30, batch_size=1,
+                     stdout=out)
+
+        self.assertIn('Purged 1', out.getvalue())
+        self.assertEqual(
+            set(Recipe.all_objects.values_list('pk', flat=True)),
+            {recent.pk, live.pk})
+
+
+class BenchmarkCostCommandTests(TestCase):
+    """Test the benchmark_cost command."""
+
+    def test_benchmark_cost(self):
+        """Test both cost columns are timed, in a temporary table."""
+        out = StringIO()
+        call_command('benchmark_cost', rows=50, runs=1, json=True,
+                     stdout=out)
+
+        results = json.loads(out.getvalue())
+        self.assertEqual(set(results), {'list', 'sort', 'aggregate'})
+        for result in results.values():
+            self.assertEqual(set(result), {'numeric', 'cents'})
+        self.assertNotIn('benchmark_recipe_cost',
+                         connection.introspection.table_names())
+
+
+class CompareSettingsCommandTests(SimpleTestCase):
+    """Test the compare_settings command."""
+
+    def test_measure_settings_profiles(self):
+        """Test each settings module is measured in its own process."""
+        out = StringIO()
+        call_command('compare_settings', 'app.settings', 'app.settings_api',
+                     runs=1, requests=5, json=True, stdout=out)
+
+        results = json.loads(out.getvalue())
+        self.assertEqual(set(results), {'app.settings', 'app.settings_api'})
+        for result in results.values():
+            self.assertGreater(result['startup_ms'], 0)
+            self.assertGreater(result['request_us'], 0)
+        self.assertLess(results['app.settings_api']['modules'],
+                        results['app.settings']['modules'])
+        self.assertTrue(results['app.settings']['drf_spectacular'])
+        self.assertFalse(results['app.settings_api']['drf_spectacular'])
+
+
+class StartupProfileCommandTests(SimpleTestCase):
+    """Test the startup_profile command."""
+
+    def test_parse_importtime(self):
+        """Test parsing the output of python -X importtime."""
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   django.utils\n'
+            'import time:       300 |        420 | django\n'
+            'import time:        50 |         50 | json\n'
+        )
+
+        imports = startup_profile.parse_importtime(output)
+        summary = startup_profile.summarize_imports(imports, top=5)
+
+        self.assertEqual(imports[0], (120, 120, 'django.utils', 1))
+        self.assertEqual(imports[1], (300, 420, 'django', 0))
+        self.assertEqual(summary['modules'], 3)
+        self.assertEqual(summary['packages'][0],
+                         {'package': 'django', 'self_ms': 0.42})
+
+    def test_startup_profile_report(self):
+        """Test the report covers every startup phase and app."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'startup.json')
+            call_command('startup_profile', warm_up=True, output=path,
+                         stdout=StringIO())
+            with open(path) as report_file:
+                report = json.load(report_file)
+
+        self.assertIn('django.setup()', report['phases'])
+        self.assertIn('warm-up hook', report['phases'])
+        self.assertIn('first request', report['phases'])
+        self.assertIn('core', report['ready'])
+        self.assertGreater(report['imports']['modules'], 0)
+
+
+class WarmUpTests(SimpleTestCase):
+    """Test the warm-up hook."""
+
+    def test_action_serializers_warmed(self):
+        """Test the serializers chosen per action are warmed."""
+        classes = warmup._serializer_classes(get_resolver().url_patterns)
+
+        self.assertIn(recipe_serializers.RecipeSerializer, classes)
+        self.assertIn(recipe_serializers.RecipeDetailSerializer, classes)
+        self.assertIn(recipe_serializers.SimilarRecipeSerializer, classes)
+        self.assertEqual(warmup.warm_up()[1], len(classes))
+
+
+class ServeCommandTests(SimpleTestCase):
+    """Test the serve command."""
+
+    def test_memory_usage(self):
+        """Test reading the memory usage of a process."""
+        usage = serve.memory_usage(os.getpid())
+
+        self.assertGreater(usage['rss'], 0)
+        self.assertEqual(serve.memory_usage(-1), {})
+
+    def test_serve_with_workers(self):
+        """Test workers answer requests and are replaced after
+        --max-requests, and the server stops on SIGTERM."""
+        process = subprocess.Popen(
+            [sys.executable, '-u', 'manage.py', 'serve', '127.0.0.1:0',
+             '--workers', '2', '--max-requests', '1'],
+            cwd=settings.BASE_DIR, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, text=True,
+        )
+        try:
+            port = int(process.stdout.readline().split(':')[1].split(',')[0])
+            while 'Started' not in process.stdout.readline():
+                pass
+
+            for _ in range(4):
+                with self.assertRaises(HTTPError) as context:
+                    urlopen(f'http://127.0.0.1:{port}/api/user/token/',
+                            timeout=10)
+                self.assertEqual(context.exception.code, 405)
+                context.exception.close()
+        finally:
+            process.terminate()
+            output, _ = process.communicate(timeout=40)
+
+        self.assertEqual(process.returncode, 0)
+        self.assertIn('Server stopped.', output)
+
+    def test_serve_reload(self):
+        """Test SIGHUP reloads the server on the same socket, the former
+        workers serving requests until the new ones are started."""
+        url_path = '/api/user/token/'
+        process = subprocess.Popen(
+            [sys.executable, '-u', 'manage.py', 'serve', '127.0.0.1:0',
+             '--workers', '1'],
+            cwd=settings.BASE_DIR, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, text=True,
+        )
+        try:
+            port = int(process.stdout.readline().split(':')[1].split(',')[0])
+            while 'Started' not in process.stdout.readline():
+                pass
+
+            process.send_signal(signal.SIGHUP)
+            lines = [process.stdout.readline().strip()]
+            with self.assertRaises(HTTPError) as context:
+                urlopen(f'http://127.0.0.1:{port}{url_path}', timeout=10)
+            self.assertEqual(context.exception.code, 405)
+            context.exception.close()
+            while 'former' not in lines[-1]:
+                lines.append(process.stdout.readline().strip())
+
+            with self.assertRaises(HTTPError) as context:
+                urlopen(f'http://127.0.0.1:{port}{url_path}', timeout=10)
+            self.assertEqual(context.exception.code, 405)
+            context.exception.close()
+        finally:
+            process.terminate()
+            process.communicate(timeout=40)
+
+        self.assertEqual(lines[0], 'Reloading.')
+        self.assertIn(f'Listening on 127.0.0.1:{port}, pid {process.pid}.',
+                      lines)
+        self.assertEqual(lines[-2:], ['Started 1 workers.',
+                                      'Stopped the former workers.'])
+
+    def test_serve_closes_idle_connections(self):
+        """Test a connection sending no request does not hold the worker
+        longer than --timeout."""
+        process = subprocess.Popen(
+            [sys.executable, '-u', 'manage.py', 'serve', '127.0.0.1:0',
+             '--workers', '1', '--timeout', '1'],
+            cwd=settings.BASE_DIR, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, text=True,
+        )
+        try:
+            port = int(process.stdout.readline().split(':')[1].split(',')[0])
+            while 'Started' not in process.stdout.readline():
+                pass
+
+            with socket.create_connection(('127.0.0.1', port)) as idle:
+                idle.settimeout(10)
+                with self.assertRaises(HTTPError) as context:
+                    urlopen(f'http://127.0.0.1:{port}/api/user/token/',
+                            timeout=10)
+                self.assertEqual(context.exception.code, 405)
+                context.exception.close()
+                self.assertEqual(idle.recv(1), b'')
+        finally:
+            process.terminate()
+            process.communicate(timeout=40)
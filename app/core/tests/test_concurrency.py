@@ -0,0 +1,239 @@
+"""
+Tests for the adaptive concurrency limit.
+"""
+import threading
+from unittest.mock import patch
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import OperationalError
+from django.test import (LiveServerTestCase, RequestFactory, SimpleTestCase,
+                         TestCase)
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import concurrency, schema
+from core.middleware import LoadSheddingMiddleware
+from user.views import CreateTokenView
+
+RECIPES_URL = reverse('recipe:recipe-list')
+SCHEMA_URL = reverse('api-schema')
+
+
+def statement_timeout():
+    """Return the error raised for a query cancelled by Postgres."""
+    error = OperationalError('canceling statement due to statement timeout')
+    error.__cause__ = type('QueryCanceled', (Exception,),
+                           {'pgcode': concurrency.QUERY_CANCELED})()
+    return error
+
+
+class ConcurrencyLimiterTests(SimpleTestCase):
+    """Test adapting the limit."""
+
+    def test_shed_over_limit(self):
+        """Test requests over the limit are shed."""
+        limiter = concurrency.ConcurrencyLimiter(2, 10)
+
+        self.assertTrue(limiter.acquire(concurrency.READ))
+        self.assertTrue(limiter.acquire(concurrency.READ))
+        self.assertFalse(limiter.acquire(concurrency.READ))
+        limiter.release()
+        self.assertTrue(limiter.acquire(concurrency.READ))
+        self.assertEqual(limiter.shed, 1)
+
+    def test_low_priority_shed_first(self):
+        """Test low priority requests only use a share of the limit."""
+        limiter = concurrency.ConcurrencyLimiter(4, 10)
+
+        self.assertTrue(limiter.acquire(concurrency.LOW))
+        self.assertTrue(limiter.acquire(concurrency.LOW))
+        self.assertFalse(limiter.acquire(concurrency.LOW))
+        self.assertTrue(limiter.acquire(concurrency.WRITE))
+        self.assertFalse(limiter.acquire(concurrency.WRITE))
+        self.assertTrue(limiter.acquire(concurrency.READ))
+        self.assertFalse(limiter.acquire(concurrency.READ))
+
+    def test_grow_while_latency_is_stable(self):
+        """Test a used limit grows while the latency is stable."""
+        limiter = concurrency.ConcurrencyLimiter(2, 3)
+        limiter.acquire(concurrency.READ)
+
+        for _ in range(20):
+            limiter.acquire(concurrency.READ)
+            limiter.release(0.01)
+
+        self.assertEqual(limiter.limit, 3)
+
+    def test_unused_limit_does_not_grow(self):
+        """Test the limit does not grow while mostly unused."""
+        limiter = concurrency.ConcurrencyLimiter(4, 10)
+
+        for _ in range(20):
+            limiter.acquire(concurrency.READ)
+            limiter.release(0.01)
+
+        self.assertEqual(limiter.limit, 4)
+
+    def test_shrink_when_latency_rises(self):
+        """Test the limit shrinks when the latency rises."""
+        limiter = concurrency.ConcurrencyLimiter(10, 10)
+        for _ in range(10):
+            limiter.acquire(concurrency.READ)
+            limiter.release(0.01)
+
+        for _ in range(10):
+            limiter.acquire(concurrency.READ)
+            limiter.release(0.1)
+
+        self.assertLess(limiter.limit, 10)
+        self.assertGreaterEqual(limiter.limit, 10 * concurrency.BACKOFF)
+
+    def test_back_off_on_statement_timeout(self):
+        """Test a cancelled query halves the limit."""
+        limiter = concurrency.ConcurrencyLimiter(10, 10)
+
+        limiter.acquire(concurrency.READ)
+        limiter.release(timed_out=True)
+
+        self.assertEqual(limiter.limit, 5)
+
+    def test_classify(self):
+        """Test the priority of requests, from their verified user."""
+        factory = RequestFactory()
+        user = get_user_model()(email='user@example.com')
+
+        def request(method, *args, user=user, **kwargs):
+            request = getattr(factory, method)('/', *args, **kwargs)
+            request.user = user
+            return request
+
+        self.assertEqual(concurrency.classify(request('get'), None),
+                         concurrency.READ)
+        self.assertEqual(concurrency.classify(request('post'), None),
+                         concurrency.WRITE)
+        self.assertEqual(concurrency.classify(
+            request('get', user=AnonymousUser(),
+                    HTTP_AUTHORIZATION='Token unverified'), None),
+            concurrency.LOW)
+        self.assertEqual(concurrency.classify(
+            request('post', {'title': 'x' * 70000}), None), concurrency.LOW)
+        self.assertEqual(concurrency.classify(
+            request('post'), CreateTokenView), concurrency.LOW)
+
+    def test_timer_detects_statement_timeout(self):
+        """Test the timer flags queries cancelled by the timeout."""
+        timer = concurrency.LatencyTimer()
+
+        def execute(sql, params, many, context):
+            raise statement_timeout()
+
+        with self.assertRaises(OperationalError):
+            timer(execute, 'SELECT 1', None, False, {})
+
+        self.assertTrue(timer.timed_out)
+        self.assertEqual(timer.count, 1)
+
+
+class LoadSheddingMiddlewareTests(TestCase):
+    """Test shedding requests."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass@123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_shed_request_over_limit(self):
+        """Test requests over the limit get a 503 with Retry-After."""
+        limiter = concurrency.ConcurrencyLimiter(1, 1)
+        limiter.in_flight = 1
+        with patch('core.concurrency.limiter', limiter):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res['Retry-After'], str(concurrency.RETRY_AFTER))
+
+    def test_unverified_credentials_low_priority(self):
+        """Test an invalid token does not raise the priority of an
+        anonymous request."""
+        limiter = concurrency.ConcurrencyLimiter(4, 4)
+        limiter.in_flight = 2
+        anonymous = APIClient()
+        with patch('core.concurrency.limiter', limiter):
+            shed = anonymous.get(SCHEMA_URL,
+                                 HTTP_AUTHORIZATION='Token unverified')
+            admitted = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(shed.status_code, 503)
+        self.assertEqual(admitted.status_code, 200)
+        self.assertEqual(limiter.in_flight, 2)
+
+    def test_release_after_request(self):
+        """Test admitted requests release their slot and adapt it."""
+        limiter = concurrency.ConcurrencyLimiter(1, 1)
+        with patch('core.concurrency.limiter', limiter):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertIsNotNone(limiter.long_latency)
+
+    def test_statement_timeout_is_shed(self):
+        """Test a request cancelled by the statement timeout gets a 503."""
+        middleware = LoadSheddingMiddleware.__new__(LoadSheddingMiddleware)
+        request = RequestFactory().get(RECIPES_URL)
+
+        res = middleware.process_exception(request, statement_timeout())
+
+        self.assertEqual(res.status_code, 503)
+        self.assertIsNone(middleware.process_exception(
+            request, ValueError()))
+
+
+class ThreadedServerTests(LiveServerTestCase):
+    """Test shedding the requests of a threaded server."""
+
+    @classmethod
+    def setUpClass(cls):
+        # The middleware is only installed with a limiter.
+        cls.limiter = concurrency.limiter = concurrency.ConcurrencyLimiter(
+            1, 1)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        concurrency.limiter = None
+
+    def test_concurrent_request_shed(self):
+        """Test a request arriving while the limit is used is shed, and
+        the blocked one still served."""
+        started, release = threading.Event(), threading.Event()
+        get_document = schema.get_document
+
+        def slow_document(*args, **kwargs):
+            started.set()
+            release.wait(10)
+            return get_document(*args, **kwargs)
+
+        responses = []
+        url = f'{self.live_server_url}{SCHEMA_URL}'
+        with patch('core.schema.get_document', slow_document):
+            blocked = threading.Thread(
+                target=lambda: responses.append(urlopen(url, timeout=10)))
+            blocked.start()
+            self.assertTrue(started.wait(10))
+            with self.assertRaises(HTTPError) as context:
+                urlopen(url, timeout=10)
+            release.set()
+            blocked.join(10)
+
+        self.assertEqual(context.exception.code, 503)
+        context.exception.close()
+        self.assertEqual(responses[0].status, 200)
+        responses[0].close()
+        self.assertEqual(self.limiter.in_flight, 0)
@@ -0,0 +1,196 @@
+"""
+Tests for the background job queue.
+"""
+import os
+import signal
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from core import jobs
+from core.management.commands.run_workers import Command as RunWorkers
+from core.deletion import request_deletion
+from core.models import AnalyticsSnapshot, Job, Recipe
+
+calls = []
+
+
+@jobs.job
+def record_call(value):
+    """Job recording its argument."""
+    calls.append(value)
+
+
+@jobs.job
+def fail():
+    """Job that always fails."""
+    raise RuntimeError('Job failed.')
+
+
+class JobQueueTests(TestCase):
+    """Test queueing and running jobs."""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_run_queued_job(self):
+        """Test a queued job runs once and records its timing."""
+        job = jobs.enqueue(record_call, 'value')
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(jobs.run_pending(), 0)
+
+        job.refresh_from_db()
+        self.assertEqual(calls, ['value'])
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.wait_time)
+        self.assertIsNotNone(job.run_time)
+
+    def test_scheduled_job_waits_until_due(self):
+        """Test a job scheduled in the future is not run early."""
+        jobs.enqueue(record_call, 'later',
+                     run_at=timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(jobs.run_pending(), 0)
+        self.assertEqual(calls, [])
+
+    def test_failed_job_retried_with_backoff(self):
+        """Test a failing job is retried later, then marked failed."""
+        job = jobs.enqueue(fail, max_attempts=2)
+
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('Job failed.', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_retry_delay_is_capped(self):
+        """Test the retry delay doubles up to its maximum."""
+        self.assertEqual(jobs.retry_delay(1), jobs.RETRY_BASE_DELAY)
+        self.assertEqual(jobs.retry_delay(2), jobs.RETRY_BASE_DELAY * 2)
+        self.assertEqual(jobs.retry_delay(50), jobs.RETRY_MAX_DELAY)
+
+    def test_requeue_stale_jobs(self):
+        """Test jobs left running by a dead worker are queued again."""
+        job = jobs.enqueue(record_call, 'value')
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING,
+            started_at=timezone.now() - timedelta(hours=2))
+
+        self.assertEqual(jobs.requeue_stale(timedelta(hours=1)), 1)
+        self.assertEqual(jobs.run_pending(), 1)
+
+    def test_enqueue_once(self):
+        """Test a job already queued is not queued again."""
+        first = jobs.enqueue_once(record_call, 'value')
+
+        self.assertIsNone(jobs.enqueue_once(record_call, 'other'))
+        jobs.run_pending()
+        self.assertIsNotNone(jobs.enqueue_once(record_call, 'value'))
+        self.assertEqual(calls, ['value'])
+        self.assertEqual(Job.objects.get(pk=first.pk).status, Job.DONE)
+
+    def test_purge_done_jobs(self):
+        """Test old done jobs are deleted, recent and failed ones kept."""
+        old = jobs.enqueue(record_call, 'old')
+        recent = jobs.enqueue(record_call, 'recent')
+        failed = jobs.enqueue(fail, max_attempts=1)
+        jobs.run_pending()
+        Job.objects.filter(pk__in=[old.pk, failed.pk]).update(
+            finished_at=timezone.now() - timedelta(days=8))
+
+        self.assertEqual(
+            jobs.purge(timezone.now() - timedelta(days=7), batch_size=1), 1)
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)),
+                         {recent.pk, failed.pk})
+
+    def test_periodic_analytics_refresh(self):
+        """Test the queued analytics refresh schedules the next one."""
+        call_command('refresh_recipe_analytics', every=60, stdout=StringIO())
+        call_command('refresh_recipe_analytics', every=60, stdout=StringIO())
+        self.assertEqual(Job.objects.count(), 1)
+
+        call_command('run_workers', burst=True, stdout=StringIO())
+
+        self.assertTrue(AnalyticsSnapshot.objects.exists())
+        queued = Job.objects.get(status=Job.QUEUED)
+        self.assertEqual(queued.name, 'recipe.tasks.refresh_global_analytics')
+        self.assertEqual(queued.kwargs, {'every': 60})
+        self.assertGreater(queued.run_at, timezone.now())
+
+    def test_run_workers_restores_signal_handlers(self):
+        """Test run_workers puts back the signal handlers it replaced."""
+        handlers = {signum: signal.getsignal(signum)
+                    for signum in (signal.SIGTERM, signal.SIGINT)}
+
+        call_command('run_workers', burst=True, stdout=StringIO())
+
+        self.assertEqual({signum: signal.getsignal(signum)
+                          for signum in handlers}, handlers)
+
+    def test_run_workers_stops_workers(self):
+        """Test the workers stop when only the supervisor is sent
+        SIGTERM."""
+        def work(command, options):
+            # Exits on its own after a while if never told to stop.
+            deadline = time.monotonic() + 30
+            while not command._stopping and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+        stderr = StringIO()
+        timer = threading.Timer(0.5, os.kill, (os.getpid(), signal.SIGTERM))
+        started = time.monotonic()
+        with patch.object(RunWorkers, '_work', work):
+            timer.start()
+            call_command('run_workers', workers=2, graceful_timeout=10,
+                         stdout=StringIO(), stderr=stderr)
+
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertEqual(stderr.getvalue(), '')
+
+    def test_request_deletion_atomic(self):
+        """Test users stay active when their deletion cannot be
+        queued."""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testPassword'
+        )
+
+        with patch('core.deletion.enqueue', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            request_deletion(get_user_model().objects.filter(pk=user.pk))
+
+        user.refresh_from_db()
+        self.assertTrue(user.is_active)
+        self.assertIsNone(user.deletion_requested_at)
+
+    def test_run_workers_burst(self):
+        """Test run_workers runs the queued user deletion and exits."""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testPassword'
+        )
+        Recipe.objects.create(user=user, title='Sample recipe',
+                              time_taken=5, cost=Decimal('2.50'))
+        request_deletion(get_user_model().objects.filter(pk=user.pk))
+
+        call_command('run_workers', burst=True, stdout=StringIO())
+
+        self.assertFalse(get_user_model().objects.exists())
+        self.assertFalse(Recipe.objects.exists())
+        self.assertEqual(Job.objects.get().status, Job.DONE)
@@ -0,0 +1,124 @@
+"""
+Tests for the middleware.
+"""
+import marshal
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.middleware import (StatementTimeoutMiddleware,
+                             set_request_statement_timeout)
+from core.models import Recipe, RequestProfile
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """Test profiling requests on demand."""
+
+    def setUp(self):
+        # Serialize the listed recipe under the profiler.
+        caches['recipe_fragments'].clear()
+        self.staff = get_user_model().objects.create_user(
+            email='staff@example.com', password='testpass@123',
+            is_staff=True)
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass@123')
+        Recipe.objects.create(user=self.staff, title='Sample recipe',
+                              time_taken=5, cost=Decimal('5.50'))
+        self.client = APIClient()
+
+    def _get(self, user, **headers):
+        token = Token.objects.create(user=user)
+        return self.client.get(RECIPES_URL,
+                               HTTP_AUTHORIZATION=f'Token {token.key}',
+                               **headers)
+
+    def test_profile_staff_request(self):
+        """Test a staff request with the header is profiled and stored."""
+        res = self._get(self.staff, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res.status_code, 200)
+        profile = RequestProfile.objects.get(pk=res['X-Profile-Id'])
+        self.assertEqual(profile.user, self.staff)
+        self.assertEqual(profile.path, RECIPES_URL)
+        self.assertEqual(profile.status_code, 200)
+        self.assertGreater(profile.sql_count, 0)
+        self.assertTrue(any('core_recipe' in query['sql']
+                            for query in profile.queries))
+        functions = {name for _file, _line, name in
+                     marshal.loads(bytes(profile.stats))}
+        self.assertIn('to_representation', functions)
+
+    def test_no_profile_without_header(self):
+        """Test staff requests without the header are not profiled."""
+        res = self._get(self.staff)
+
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_no_profile_for_other_users(self):
+        """Test the header is ignored for users who are not staff."""
+        res = self._get(self.user, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_download_profile_from_admin(self):
+        """Test the admin shows and serves the stored profile."""
+        res = self._get(self.staff, HTTP_X_PROFILE='1')
+        admin = get_user_model().objects.create_superuser(
+            email='admin@example.com', password='testpass@123')
+        self.client.force_login(admin)
+
+        change = self.client.get(reverse('admin:core_requestprofile_change',
+                                         args=[res['X-Profile-Id']]))
+        download = self.client.get(
+            reverse('admin:core_requestprofile_download',
+                    args=[res['X-Profile-Id']]))
+
+        self.assertContains(change, 'to_representation')
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('attachment', download['Content-Disposition'])
+        self.assertTrue(marshal.loads(download.content))
+
+
+class StatementTimeoutMiddlewareTests(SimpleTestCase):
+    """Test the statement timeout of requests."""
+
+    def test_timeout_set_for_request(self):
+        """Test the timeout is set on the Postgres connections open or
+        opened during the request only."""
+        opened, idle = MagicMock(vendor='postgresql'), MagicMock(
+            vendor='postgresql', connection=None)
+        statements = []
+        for connection in (opened, idle):
+            connection.cursor.return_value.__enter__.return_value.execute \
+                .side_effect = lambda sql, *args: statements.append(sql)
+
+        def view(request):
+            statements.append('view')
+            idle.connection = object()
+            set_request_statement_timeout(None, idle)
+            return HttpResponse()
+
+        with patch('core.middleware.connections.all',
+                   return_value=[opened, idle]), \
+                self.settings(DB_STATEMENT_TIMEOUT=5000):
+            StatementTimeoutMiddleware(view)(RequestFactory().get('/'))
+            set_request_statement_timeout(None, opened)
+
+        self.assertEqual(statements, [
+            'SET statement_timeout = %s', 'view',
+            'SET statement_timeout = %s', 'RESET statement_timeout',
+            'RESET statement_timeout',
+        ])
@@ -5,6 +5,7 @@ from django.test import TestCase
 from django.contrib.auth import get_user_model
 
 from decimal import Decimal
+from unittest.mock import patch
 
 from core import models
 
@@ -68,3 +69,108 @@ class ModelTests(TestCase):
         )
 
         self.assertEqual(str(recipe), recipe.title)
+
+    def test_recipe_cost_in_cents(self):
+        """Test the recipe cost is stored as an integer of cents."""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testPassword'
+        )
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='Sample recipe name',
+            time_taken=5,
+            cost=Decimal('0.29'),
+        )
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.cost_cents, 29)
+        self.assertEqual(recipe.cost, Decimal('0.29'))
+
+    def test_recipe_stats_rebuild(self):
+        """Test rebuilding recipe statistics from the recipes."""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testPassword'
+        )
+        for time_taken in [5, 5, 40]:
+            models.Recipe.objects.create(
+                user=user,
+                title='Sample recipe name',
+                time_taken=time_taken,
+                cost=Decimal('1.50'),
+            )
+
+        stats = models.RecipeStats.objects.rebuild(user)
+
+        self.assertEqual(stats.recipe_count, 3)
+        self.assertEqual(stats.average_cost, Decimal('1.50'))
+        self.assertEqual(stats.total_time_taken, 50)
+        self.assertEqual(stats.median_time_taken, 5)
+        self.assertEqual(stats.time_taken_counts, {'5': 2, '40': 1})
+
+    def test_recipe_change_numbers(self):
+        """Test every write of a recipe takes the next change number of
+        the recipes of its owner."""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testPassword'
+        )
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testPassword'
+        )
+        recipe = models.Recipe.objects.create(
+            user=user, title='Sample recipe name', time_taken=5,
+            cost=Decimal('1.50'))
+        models.Recipe.objects.create(
+            user=other, title='Sample recipe name', time_taken=5,
+            cost=Decimal('1.50'))
+        self.assertEqual(recipe.change_number, 1)
+
+        recipe.title = 'New title'
+        recipe.save(update_fields=['title'])
+        recipe.refresh_from_db()
+
+        self.assertEqual(recipe.change_number, 2)
+        self.assertEqual(models.next_recipe_change(user.id), 3)
+        self.assertEqual(models.next_recipe_change(other.id), 2)
+
+    def test_recipe_stats_version_incremented(self):
+        """Test every change and rebuild of the statistics increments
+        their version."""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testPassword'
+        )
+        models.RecipeStats.objects.apply(user, added=(150, 5))
+        models.RecipeStats.objects.apply(user, added=(200, 10))
+        self.assertEqual(models.RecipeStats.objects.get(user=user).version, 2)
+
+        models.RecipeStats.objects.rebuild(user).save()
+
+        self.assertEqual(models.RecipeStats.objects.get(user=user).version, 3)
+
+    def test_recipe_stats_seeded_concurrently(self):
+        """Test a change is applied to the statistics seeded by a
+        concurrent first write of the user."""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testPassword'
+        )
+        rebuild = models.RecipeStats.objects.rebuild
+
+        def concurrent_rebuild(user):
+            # The other write commits its seed first.
+            models.RecipeStats.objects.create(
+                user=user, recipe_count=1, total_cost=Decimal('1.50'),
+                total_time_taken=5, time_taken_counts={'5': 1})
+            return rebuild(user)
+
+        with patch.object(models.RecipeStats.objects, 'rebuild',
+                          concurrent_rebuild):
+            models.RecipeStats.objects.apply(user, added=(200, 10))
+
+        stats = models.RecipeStats.objects.get(user=user)
+        self.assertEqual(stats.recipe_count, 2)
+        self.assertEqual(stats.total_cost, Decimal('3.50'))
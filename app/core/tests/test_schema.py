@@ -0,0 +1,89 @@
+"""
+Tests for the cached OpenAPI schema.
+"""
+import gzip
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from core import schema
+
+SCHEMA_URL = reverse('api-schema')
+
+
+class CachedSchemaTests(SimpleTestCase):
+    """Test serving the schema from memory."""
+
+    def setUp(self):
+        schema.clear_documents()
+
+    def test_schema_generated_once(self):
+        """Test the schema is generated on the first request only."""
+        with patch('core.schema.render_schema',
+                   wraps=schema.render_schema) as render:
+            first = self.client.get(SCHEMA_URL)
+            second = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.content, second.content)
+        self.assertIn(b'openapi', first.content)
+
+    def test_schema_not_modified(self):
+        """Test a matching If-None-Match returns 304."""
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        response = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_schema_gzipped(self):
+        """Test the precompressed body is sent when gzip is accepted."""
+        plain = self.client.get(SCHEMA_URL)
+
+        response = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_schema_json_format(self):
+        """Test the schema is rendered in the negotiated format."""
+        response = self.client.get(SCHEMA_URL,
+                                   HTTP_ACCEPT='application/json')
+
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertTrue(response.content.startswith(b'{'))
+
+    def test_schema_unknown_language_not_cached(self):
+        """Test an unknown language is served the default document."""
+        default = self.client.get(SCHEMA_URL)
+
+        with patch('core.schema.render_schema') as render:
+            response = self.client.get(SCHEMA_URL, {'lang': 'xx-unknown'})
+
+        render.assert_not_called()
+        self.assertEqual(response.content, default.content)
+        self.assertEqual(len(schema._documents), 1)
+
+    def test_build_schema_writes_cache(self):
+        """Test build_schema renders the schema to the cache directory."""
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                override_settings(SCHEMA_CACHE_DIR=cache_dir):
+            call_command('build_schema', stdout=StringIO())
+            schema.clear_documents()
+
+            with patch('core.schema.render_schema') as render:
+                response = self.client.get(SCHEMA_URL)
+
+            files = sorted(path.suffix for path in Path(cache_dir).iterdir())
+
+        self.assertEqual(files, ['.json', '.yaml'])
+        render.assert_not_called()
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,109 @@
+"""
+Tests for the slow query log.
+"""
+import json
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import slow_queries
+from core.models import Recipe, SlowQuery
+
+
+class FingerprintTests(SimpleTestCase):
+    """Test normalizing statements."""
+
+    def test_values_are_replaced(self):
+        """Test literals, parameters and lists of values are replaced."""
+        normalized, key = slow_queries.fingerprint(
+            "SELECT * FROM t WHERE a = 'x''y' AND b = 12\n"
+            "  AND c IN (%s, %s, %s) AND d = %s")
+        other, other_key = slow_queries.fingerprint(
+            "SELECT * FROM t WHERE a = 'z' AND b = 7 "
+            "AND c IN (%s) AND d = %s")
+
+        self.assertEqual(normalized, 'SELECT * FROM t WHERE a = ? AND b = ? '
+                                     'AND c IN (...) AND d = ?')
+        self.assertEqual(key, other_key)
+
+
+class SlowQueryLogTests(TestCase):
+    """Test recording and storing slow queries."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass@123')
+        self.log = slow_queries.SlowQueryLog(threshold=0, explain=True)
+
+    def test_queries_aggregated_by_fingerprint(self):
+        """Test executions of one query are aggregated with their plan
+        and the calling code."""
+        with connection.execute_wrapper(self.log):
+            list(Recipe.objects.filter(user=self.user))
+            list(Recipe.objects.filter(user_id=self.user.id + 1))
+
+        entry = next(entry for entry in self.log.entries.values()
+                     if 'core_recipe' in entry['sql'])
+        self.assertEqual(entry['count'], 2)
+        self.assertEqual(entry['views'], {'-': 2})
+        self.assertIn('test_slow_queries.py', entry['stack'])
+        self.assertTrue(entry['plan'])
+        self.assertNotIn('EXPLAIN failed', entry['plan'])
+
+    def test_under_threshold_not_recorded(self):
+        """Test fast queries are not recorded."""
+        self.log.threshold = 10000
+        with connection.execute_wrapper(self.log):
+            list(Recipe.objects.all())
+
+        self.assertFalse(self.log.entries)
+
+    @patch('core.slow_queries.MAX_FINGERPRINTS', 2)
+    def test_entries_bounded(self):
+        """Test the fingerprint seen least recently is forgotten."""
+        with connection.execute_wrapper(self.log):
+            Recipe.objects.count()
+            Recipe.objects.exists()
+            list(Recipe.objects.all())
+
+        self.assertEqual(len(self.log.entries), 2)
+        self.assertFalse(any('COUNT' in entry['sql']
+                             for entry in self.log.entries.values()))
+
+    def test_flush_merges_stored_queries(self):
+        """Test flushing adds the entries to the stored queries."""
+        for _ in range(2):
+            with connection.execute_wrapper(self.log):
+                Recipe.objects.count()
+            self.log.flush()
+
+        query = SlowQuery.objects.get(sql__contains='COUNT')
+        self.assertEqual(query.count, 2)
+        self.assertFalse(self.log.entries)
+
+    def test_views_recorded_by_middleware(self):
+        """Test queries are attributed to the views running them, and
+        reported by the slow_queries command."""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with patch('core.slow_queries.log', self.log), \
+                connection.execute_wrapper(self.log):
+            client.get(reverse('recipe:recipe-list'))
+        self.log.flush()
+
+        out = StringIO()
+        call_command('slow_queries', view='RecipeViewSet', json=True,
+                     stdout=out)
+
+        queries = json.loads(out.getvalue())
+        self.assertEqual(len(queries), 1)
+        self.assertIn('core_recipe', queries[0]['sql'])
+        self.assertEqual(queries[0]['views'],
+                         {'recipe.views.RecipeViewSet': 1})
@@ -0,0 +1,77 @@
+"""
+Warm-up of a process before it accepts traffic.
+
+Django builds much of its state lazily, on the first request that needs
+it: URL pattern regexes, the reverse lookup tables and the model _meta
+caches. warm_up() builds them upfront. DRF builds serializer fields per
+serializer instance, so those cannot be kept; the serializers of every
+routed action are built once, which imports the modules they use.
+Set DJANGO_WARM_UP=1 to run it when app.wsgi or app.asgi is loaded.
+"""
+from django.apps import apps
+from django.urls import URLResolver, get_resolver
+
+
+def _compile_patterns(patterns):
+    """Compile the regex of every URL pattern and build the reverse
+    lookup tables of every included URLconf, recursively."""
+    count = 0
+    for pattern in patterns:
+        pattern.pattern.regex
+        count += 1
+        if isinstance(pattern, URLResolver):
+            pattern.reverse_dict
+            count += _compile_patterns(pattern.url_patterns)
+
+    return count
+
+
+def _action_serializer_class(callback, action):
+    """Return the serializer class of a view action, or None if the view
+    chooses it from the request."""
+    view = callback.cls(**getattr(callback, 'initkwargs', {}))
+    view.action = action
+    try:
+        return view.get_serializer_class()
+    except (AttributeError, AssertionError):
+        return None
+
+
+def _serializer_classes(patterns):
+    """Return the serializer classes of the view actions routed by the
+    patterns."""
+    classes = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            classes |= _serializer_classes(pattern.url_patterns)
+            continue
+
+        callback = pattern.callback
+        view_class = getattr(callback, 'cls', None)
+        if not hasattr(view_class, 'get_serializer_class'):
+            classes.add(getattr(view_class, 'serializer_class', None))
+            continue
+        actions = getattr(callback, 'actions', None) or {None: None}
+        classes |= {_action_serializer_class(callback, action)
+                    for action in actions.values()}
+
+    return classes - {None}
+
+
+def warm_up():
+    """Build the URL and model state lazily built by the first requests,
+    and the serializers of the routed actions once. Return the number of
+    URL patterns and serializers warmed."""
+    resolver = get_resolver()
+    resolver.reverse_dict
+    patterns = _compile_patterns(resolver.url_patterns)
+
+    for model in apps.get_models():
+        model._meta.get_fields()
+        model._meta.fields_map
+
+    serializers = _serializer_classes(resolver.url_patterns)
+    for serializer_class in serializers:
+        serializer_class().fields
+
+    return patterns, len(serializers)
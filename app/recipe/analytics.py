@@ -0,0 +1,116 @@
+"""
+Vectorized cost and time analytics over recipes.
+"""
+from itertools import islice
+
+import numpy as np
+
+from django.core.cache import cache
+
+from core.models import AnalyticsSnapshot, Recipe, RecipeStats
+
+# Rows fetched per round trip while streaming the columns.
+CHUNK_SIZE = 5000
+HISTOGRAM_BINS = 10
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+# Keyed by the version of the statistics of the user, which every write
+# of a recipe cost or time increments, so writes served by any process
+# invalidate it.
+USER_CACHE_KEY = 'recipe-analytics:user:{}:{}'
+USER_CACHE_TIMEOUT = 24 * 60 * 60
+GLOBAL_CACHE_KEY = 'recipe-analytics:global'
+GLOBAL_CACHE_TIMEOUT = 60
+GLOBAL_SNAPSHOT = 'recipe-analytics'
+
+
+def load_columns(queryset):
+    """
+    Return the cost and time_taken columns of the queryset as two
+    float arrays, streamed from the database in chunks.
+    """
+    rows = queryset.order_by().values_list(
+        'cost_cents', 'time_taken').iterator(chunk_size=CHUNK_SIZE)
+    chunks = []
+    while True:
+        chunk = list(islice(rows, CHUNK_SIZE))
+        if not chunk:
+            break
+        chunks.append(np.array(chunk, dtype=np.float64))
+
+    if not chunks:
+        return np.empty(0), np.empty(0)
+
+    columns = np.concatenate(chunks)
+    return columns[:, 0] / 100, columns[:, 1]
+
+
+def summarize(values):
+    """Return summary statistics, quantiles and a histogram."""
+    if not values.size:
+        return {'count': 0, 'min': None, 'max': None, 'mean': None,
+                'std': None, 'quantiles': None, 'histogram': None}
+
+    counts, edges = np.histogram(values, bins=HISTOGRAM_BINS)
+    quantiles = np.quantile(values, QUANTILES)
+    return {
+        'count': int(values.size),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'quantiles': {
+            f'p{round(q * 100)}': float(value)
+            for q, value in zip(QUANTILES, quantiles)
+        },
+        'histogram': {
+            'edges': edges.tolist(),
+            'counts': counts.tolist(),
+        },
+    }
+
+
+def analyze(queryset):
+    """Return cost and time_taken analytics of the recipes."""
+    cost, time_taken = load_columns(queryset)
+    return {
+        'cost': summarize(cost),
+        'time_taken': summarize(time_taken),
+    }
+
+
+def user_analytics(user):
+    """Return the cached analytics of the user's recipes."""
+    version = RecipeStats.objects.filter(user=user).values_list(
+        'version', flat=True).first()
+    key = USER_CACHE_KEY.format(user.pk, version or 0)
+    data = cache.get(key)
+    if data is None:
+        data = analyze(Recipe.objects.filter(user=user))
+        cache.set(key, data, USER_CACHE_TIMEOUT)
+
+    return data
+
+
+def global_analytics():
+    """Return the latest global snapshot, or None if never refreshed."""
+    snapshot = cache.get(GLOBAL_CACHE_KEY)
+    if snapshot is None:
+        snapshot = AnalyticsSnapshot.objects.filter(
+            name=GLOBAL_SNAPSHOT).first()
+        if snapshot is None:
+            return None
+        cache.set(GLOBAL_CACHE_KEY, snapshot, GLOBAL_CACHE_TIMEOUT)
+
+    return {'refreshed_at': snapshot.refreshed_at, **snapshot.data}
+
+
+def refresh_global_analytics():
+    """Recompute the global snapshot over every recipe."""
+    snapshot, _ = AnalyticsSnapshot.objects.update_or_create(
+        name=GLOBAL_SNAPSHOT,
+        defaults={'data': analyze(Recipe.objects.all())},
+    )
+    cache.set(GLOBAL_CACHE_KEY, snapshot, GLOBAL_CACHE_TIMEOUT)
+
+    return snapshot
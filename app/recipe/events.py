@@ -0,0 +1,256 @@
+"""
+Live recipe change events, over server-sent events.
+
+RecipeViewSet publishes a NOTIFY on the recipe_changes channel for every
+write; Postgres delivers it when the transaction commits. Each ASGI
+worker process holds one connection LISTENing on the channel, watched
+by its event loop, and fans the notifications out to the subscribers of
+the owner of the recipe. Idle subscribers are suspended coroutines: they
+hold no database connection and only wake up for their events and a
+heartbeat. app.asgi routes EVENTS_PATH to events_application, served
+by an ASGI server, e.g.
+
+    uvicorn app.asgi:application
+
+docker-compose runs it as the `events` service, on port 8001; the WSGI
+servers answer 404 on EVENTS_PATH. In production, route EVENTS_PATH to
+the ASGI servers from the reverse proxy, without buffering.
+
+Events only carry the recipe ID and version. Clients fetch the changes
+with the changes feed. A `resync` event tells them events may have been
+lost, after a listener reconnection or when they read too slowly.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+
+from django.db import close_old_connections, connections, transaction
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'recipe_changes'
+EVENTS_PATH = '/api/recipe/events/'
+# Seconds between heartbeats keeping idle streams open through proxies.
+HEARTBEAT_INTERVAL = 15
+# Seconds before connecting the listener again after losing it.
+RECONNECT_DELAY = 1
+# Events queued per subscriber before it is asked to resync.
+QUEUE_SIZE = 100
+
+
+def publish(recipe, event):
+    """Publish a change of the recipe once the transaction commits."""
+    payload = json.dumps({
+        'user': recipe.user_id,
+        'event': event,
+        'id': recipe.id,
+        'version': recipe.version,
+    })
+    connection = connections['default']
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+    else:
+        # Without LISTEN/NOTIFY, only subscribers of this process get it.
+        transaction.on_commit(lambda: hub.dispatch_threadsafe(payload))
+
+
+class ChangeHub:
+    """Fan out the notifications of one listener connection to the
+    subscribers of this process, by user."""
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.loop = None
+        self.listener = None
+        self.listening = None
+
+    @asynccontextmanager
+    async def subscribe(self, user_id):
+        """Yield a queue receiving the change events of the user."""
+        self.loop = asyncio.get_running_loop()
+        await self._ensure_listening()
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self.subscribers[user_id].add(queue)
+        try:
+            yield queue
+        finally:
+            self.subscribers[user_id].discard(queue)
+            if not self.subscribers[user_id]:
+                del self.subscribers[user_id]
+
+    def dispatch(self, payload):
+        """Queue a notification for the subscribers of its user."""
+        event = json.loads(payload)
+        for queue in self.subscribers.get(event.pop('user'), ()):
+            self._put(queue, event)
+
+    def dispatch_threadsafe(self, payload):
+        """Dispatch from another thread, such as a sync view."""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.dispatch, payload)
+
+    def resync(self):
+        """Tell every subscriber that events may have been lost."""
+        for queues in self.subscribers.values():
+            for queue in queues:
+                self._put(queue, {'event': 'resync'})
+
+    def _put(self, queue, event):
+        if queue.full():
+            # Replace the backlog of a slow reader by a single resync.
+            while not queue.empty():
+                queue.get_nowait()
+            event = {'event': 'resync'}
+        queue.put_nowait(event)
+
+    async def _ensure_listening(self):
+        if connections['default'].vendor != 'postgresql':
+            return
+        if self.listening is None or (self.listening.done()
+                                      and self.listening.exception()):
+            self.listening = asyncio.ensure_future(self._listen())
+        await asyncio.shield(self.listening)
+
+    async def _listen(self):
+        """Open the listener connection and watch it from the loop."""
+        self.listener = await self.loop.run_in_executor(None, self._connect)
+        self.loop.add_reader(self.listener.fileno(), self._on_readable)
+
+    def _connect(self):
+        import psycopg2
+
+        params = connections['default'].get_connection_params()
+        listener = psycopg2.connect(**params)
+        listener.autocommit = True
+        with listener.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+        return listener
+
+    def _on_readable(self):
+        try:
+            self.listener.poll()
+        except Exception:
+            logger.exception('Lost the recipe change listener.')
+            self._reconnect()
+            return
+
+        while self.listener.notifies:
+            self.dispatch(self.listener.notifies.pop(0).payload)
+
+    def _reconnect(self):
+        self.loop.remove_reader(self.listener.fileno())
+        try:
+            self.listener.close()
+        except Exception:
+            pass
+        self.listener = None
+        self.listening = None
+        self.resync()
+        self.loop.call_later(RECONNECT_DELAY, self._restart)
+
+    def _restart(self):
+        if self.subscribers and self.listening is None:
+            self.listening = asyncio.ensure_future(self._listen())
+            self.listening.add_done_callback(self._listen_done)
+
+    def _listen_done(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error('Cannot connect the recipe change listener: %s',
+                         future.exception())
+            self.listening = None
+            self.loop.call_later(RECONNECT_DELAY, self._restart)
+
+
+# Hub of this process.
+hub = ChangeHub()
+
+
+def authenticate(authorization):
+    """Return the user of the token in the Authorization header."""
+    try:
+        parts = authorization.split()
+        if len(parts) != 2 or parts[0].lower() != b'token':
+            return None
+        user, _token = TokenAuthentication().authenticate_credentials(
+            parts[1].decode())
+        return user
+    except (AuthenticationFailed, UnicodeError):
+        return None
+    finally:
+        close_old_connections()
+
+
+def format_event(event):
+    """Return the event in the server-sent events format."""
+    return (f'event: {event["event"]}\n'
+            f'data: {json.dumps(event)}\n\n').encode()
+
+
+async def _send_response(send, status, body=b''):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def events_application(scope, receive, send):
+    """Stream the recipe change events of the authenticated user."""
+    if scope['method'] != 'GET':
+        await _send_response(send, 405, b'Method not allowed.')
+        return
+
+    headers = dict(scope['headers'])
+    user = await sync_to_async(authenticate)(
+        headers.get(b'authorization', b''))
+    if user is None:
+        await _send_response(send, 401, b'Invalid token.')
+        return
+
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        async with hub.subscribe(user.pk) as queue:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            await send({'type': 'http.response.body',
+                        'body': b'retry: 5000\n\n', 'more_body': True})
+            await _stream(queue, disconnected, send)
+    finally:
+        disconnected.cancel()
+
+
+async def _stream(queue, disconnected, send):
+    """Send the queued events, and heartbeats while idle, until the
+    client disconnects."""
+    while not disconnected.done():
+        get = asyncio.ensure_future(queue.get())
+        done, _ = await asyncio.wait({get, disconnected},
+                                     timeout=HEARTBEAT_INTERVAL,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if get in done:
+            body = format_event(get.result())
+        else:
+            get.cancel()
+            if disconnected.done():
+                break
+            body = b': heartbeat\n\n'
+        await send({'type': 'http.response.body', 'body': body,
+                    'more_body': True})
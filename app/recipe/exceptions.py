@@ -0,0 +1,35 @@
+"""
+Exceptions for the Recipe API.
+"""
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class PreconditionFailed(APIException):
+    """The If-Match header does not match the current recipe version."""
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = _('The recipe does not match the If-Match version.')
+    default_code = 'precondition_failed'
+
+
+class EditConflict(APIException):
+    """The recipe was changed by another request while being updated."""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = _('The recipe was modified by another request.')
+    default_code = 'conflict'
+
+
+class SyncTokenExpired(APIException):
+    """The changes since the sync token may include purged tombstones."""
+    status_code = status.HTTP_410_GONE
+    default_detail = _('The sync token has expired, sync all recipes again.')
+    default_code = 'sync_token_expired'
+
+
+class SimilarIndexUnavailable(APIException):
+    """The similar recipes index has not been built yet."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Similar recipes are not available yet.')
+    default_code = 'similar_index_unavailable'
@@ -0,0 +1,89 @@
+"""
+Cache of the serialized recipes of the list.
+
+Each recipe of a list is rendered once per version: its JSON is cached as
+bytes under its id and version, which every write increments, so
+fragments never need to be deleted. Listing recipes only reads their ids
+and versions, fetches the fragments in one round trip, renders the
+missing ones, and joins the bytes into the response body, identical to
+the one JSONRenderer would render from the whole list.
+
+Fragments are shared by every process through memcached when
+MEMCACHED_LOCATION is set. Otherwise each process renders and keeps its
+own, so a recipe is rendered once per process.
+"""
+import json
+
+from django.core.cache import caches
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+CACHE_ALIAS = 'recipe_fragments'
+# Increment when the serialized recipes change shape.
+FRAGMENT_FORMAT = 1
+FRAGMENT_TIMEOUT = 7 * 24 * 60 * 60
+
+
+def fragment_key(recipe_id, version):
+    """Return the cache key of a recipe version."""
+    return f'recipe-fragment:{FRAGMENT_FORMAT}:{recipe_id}:{version}'
+
+
+def render_list(queryset, serializer_class, context=None):
+    """
+    Return the JSON list of the recipes of the queryset, serialized by
+    the serializer class, assembled from the cached fragments.
+    """
+    cache = caches[CACHE_ALIAS]
+    keys = {fragment_key(recipe_id, version): recipe_id for recipe_id, version
+            in queryset.values_list('id', 'version')}
+    cached = cache.get_many(keys)
+    fragments = {keys[key]: fragment for key, fragment in cached.items()}
+    missing = [recipe_id for recipe_id in keys.values()
+               if recipe_id not in fragments]
+    if missing:
+        renderer = JSONRenderer()
+        rendered = {}
+        # Recipes written since their version was read are rendered at
+        # their new version, deleted ones are left out.
+        for recipe in queryset.filter(pk__in=missing):
+            fragments[recipe.id] = renderer.render(
+                serializer_class(recipe, context=context).data)
+            rendered[fragment_key(recipe.id, recipe.version)] = (
+                fragments[recipe.id])
+        cache.set_many(rendered, FRAGMENT_TIMEOUT)
+
+    return b'[' + b','.join(fragments[recipe_id] for recipe_id in keys.values()
+                            if recipe_id in fragments) + b']'
+
+
+class RenderedJSONResponse(Response):
+    """
+    Response holding a body already rendered as compact JSON. Other
+    renderers, such as the browsable API, and `data` decode it on demand.
+    """
+
+    def __init__(self, content, **kwargs):
+        super().__init__(**kwargs)
+        self.content_json = content
+
+    @property
+    def data(self):
+        if self._data is None and self.content_json is not None:
+            self._data = json.loads(self.content_json)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def rendered_content(self):
+        renderer = self.accepted_renderer
+        if type(renderer) is JSONRenderer and not renderer.get_indent(
+                self.accepted_media_type, self.renderer_context):
+            self['Content-Type'] = renderer.media_type
+            return self.content_json
+
+        return super().rendered_content
@@ -0,0 +1,26 @@
+"""
+Django command to build the similar recipes index.
+"""
+from django.core.management.base import BaseCommand
+
+from recipe.similar import build_index
+
+
+class Command(BaseCommand):
+    """Django command to write the TF-IDF vectors of the recipes.
+    Meant to be run periodically, e.g. from cron."""
+    help = ('Build the similar recipes index into SIMILAR_INDEX_DIR, only '
+            'vectorizing the recipes changed since the previous build.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Count the words of every recipe, not only of the '
+                 'recipes changed since the previous build.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        path, vectorized = build_index(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {path}, {vectorized} recipe(s) vectorized.'))
@@ -0,0 +1,40 @@
+"""
+Django command to refresh the global recipe analytics snapshot.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.jobs import enqueue_once
+from recipe import tasks
+from recipe.analytics import refresh_global_analytics
+
+
+class Command(BaseCommand):
+    """Django command to recompute the global analytics snapshot.
+    Meant to be run periodically, e.g. from cron, or once with --every
+    to have the job workers refresh it."""
+    help = 'Recompute the global recipe cost and time analytics.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=int,
+            help='Instead of refreshing now, queue a background job '
+                 'refreshing the analytics every this many seconds, '
+                 'unless one is already queued.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if options['every'] is not None:
+            if options['every'] < 1:
+                raise CommandError('--every must be at least 1.')
+            job = enqueue_once(tasks.refresh_global_analytics,
+                               every=options['every'])
+            self.stdout.write(self.style.SUCCESS(
+                'Queued the periodic analytics refresh.' if job else
+                'The periodic analytics refresh is already queued.'))
+            return
+
+        snapshot = refresh_global_analytics()
+        count = snapshot.data['cost']['count']
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed recipe analytics over {count} recipe(s).'))
@@ -0,0 +1,48 @@
+"""
+OpenAPI annotations of the recipe views.
+
+Kept out of recipe.views, so the API-only workers, which do not install
+drf_spectacular, do not import it. Applied by RecipeConfig.ready() when
+drf_spectacular is installed.
+"""
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import (OpenApiParameter, extend_schema,
+                                   extend_schema_view)
+
+from recipe import similar
+from recipe.views import RecipeViewSet
+
+extend_schema_view(
+    list=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'tags', OpenApiTypes.STR,
+                description='Comma separated list of tag IDs to filter.',
+            ),
+            OpenApiParameter(
+                'ingredients', OpenApiTypes.STR,
+                description='Comma separated list of ingredient IDs to '
+                            'filter.',
+            ),
+        ]
+    ),
+    changes=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'since', OpenApiTypes.STR,
+                description='Sync token returned by the previous call. '
+                            'Omit it to list every recipe.',
+            ),
+        ]
+    ),
+    similar=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'limit', OpenApiTypes.INT,
+                description=f'Number of recipes to return, at most '
+                            f'{similar.MAX_LIMIT} (default: '
+                            f'{similar.DEFAULT_LIMIT}).',
+            ),
+        ]
+    ),
+)(RecipeViewSet)
@@ -1,18 +1,151 @@
 """
 Serializers for Recipe API.
 """
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from core.models import (Ingredient, Recipe, RecipeStats, Tag, from_cents,
+                         next_recipe_change, to_cents)
+from recipe.exceptions import EditConflict, PreconditionFailed
+
+
+class TagSerializer(serializers.ModelSerializer):
+    """Serializer for tags."""
+
+    class Meta:
+        model = Tag
+        fields = ['id', 'name']
+        read_only_fields = ['id']
+
+
+class IngredientSerializer(serializers.ModelSerializer):
+    """Serializer for ingredients."""
+
+    class Meta:
+        model = Ingredient
+        fields = ['id', 'name']
+        read_only_fields = ['id']
+
+
+def get_or_create_named(model, user, items):
+    """Return the objects of the user named by the items, creating the
+    missing ones in bulk, in the order of the items."""
+    names = list(dict.fromkeys(item['name'] for item in items))
+    objects = model.objects.filter(user=user, name__in=names)
+    existing = {obj.name: obj for obj in objects}
+    missing = [name for name in names if name not in existing]
+    if missing:
+        model.objects.bulk_create(
+            [model(user=user, name=name) for name in missing],
+            ignore_conflicts=True,
+        )
+        # Primary keys are not returned when ignoring conflicts.
+        existing.update((obj.name, obj) for obj in model.objects.filter(
+            user=user, name__in=missing))
+
+    return [existing[name] for name in names]
+
+
+class CentsField(serializers.DecimalField):
+    """Decimal amount stored as an integer number of cents."""
 
-from core.models import Recipe
+    def __init__(self, **kwargs):
+        super().__init__(max_digits=kwargs.pop('max_digits', 5),
+                         decimal_places=2, **kwargs)
+
+    def to_internal_value(self, data):
+        return to_cents(super().to_internal_value(data))
+
+    def to_representation(self, value):
+        if not getattr(self, 'coerce_to_string',
+                       api_settings.COERCE_DECIMAL_TO_STRING):
+            return from_cents(value)
+
+        # Formatted from the integer, same as the quantized decimal.
+        units, cents = divmod(abs(value), 100)
+        return f'{"-" if value < 0 else ""}{units}.{cents:02d}'
 
 
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializer for Recipe API."""
+    cost = CentsField(source='cost_cents')
+    tags = TagSerializer(many=True, required=False)
+    ingredients = IngredientSerializer(many=True, required=False)
+
+    # Related objects written with get_or_create_named, by name.
+    related_fields = {'tags': Tag, 'ingredients': Ingredient}
 
     class Meta:
         model = Recipe
-        fields = ['id', 'title', 'time_taken', 'cost', 'link']
-        read_only_fields = ['id']
+        fields = ['id', 'title', 'time_taken', 'cost', 'link', 'version',
+                  'tags', 'ingredients']
+        read_only_fields = ['id', 'version']
+
+    def _pop_related(self, validated_data):
+        """Remove the related objects from the validated data."""
+        return {field: validated_data.pop(field)
+                for field in self.related_fields if field in validated_data}
+
+    def _set_related(self, recipe, related):
+        """Replace the related objects of the recipe."""
+        for field, items in related.items():
+            getattr(recipe, field).set(get_or_create_named(
+                self.related_fields[field], recipe.user, items))
+
+    def create(self, validated_data):
+        """Create a recipe with its tags and ingredients."""
+        related = self._pop_related(validated_data)
+        recipe = super().create(validated_data)
+        self._set_related(recipe, related)
+
+        return recipe
+
+    def update(self, instance, validated_data):
+        """
+        Write only the changed fields, with a single UPDATE conditional
+        on the recipe version. The version expected by the client is
+        given as `if_match` in the serializer context.
+        """
+        expected = self.context.get('if_match')
+        if expected is not None and expected != instance.version:
+            raise PreconditionFailed()
+
+        related = {
+            field: items
+            for field, items in self._pop_related(validated_data).items()
+            if {item['name'] for item in items} != {
+                obj.name for obj in getattr(instance, field).all()}
+        }
+        changed = {field: value for field, value in validated_data.items()
+                   if getattr(instance, field) != value}
+        if not changed and not related:
+            return instance
+
+        # The owner lets Postgres prune to one partition when core_recipe
+        # is partitioned by user, see `manage.py partition_recipes`.
+        # QuerySet.update() does not set auto_now fields.
+        changed['updated_at'] = timezone.now()
+        with transaction.atomic():
+            changed['change_number'] = next_recipe_change(instance.user_id)
+            updated = Recipe.objects.filter(
+                pk=instance.pk, user=instance.user_id,
+                version=instance.version,
+            ).update(version=F('version') + 1, **changed)
+        if not updated:
+            if expected is not None:
+                raise PreconditionFailed()
+            raise EditConflict()
+
+        for field, value in changed.items():
+            setattr(instance, field, value)
+        instance.version += 1
+        self._set_related(instance, related)
+
+        return instance
 
 
 class RecipeDetailSerializer(RecipeSerializer):
@@ -20,3 +153,44 @@ class RecipeDetailSerializer(RecipeSerializer):
 
     class Meta(RecipeSerializer.Meta):
         fields = RecipeSerializer.Meta.fields + ['description']
+
+
+class SimilarRecipeSerializer(RecipeSerializer):
+    """Serializer for a recipe similar to another one."""
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['score']
+
+
+class RecipeChangesSerializer(serializers.Serializer):
+    """Serializer for a page of the recipe changes feed."""
+    changes = RecipeDetailSerializer(many=True, read_only=True)
+    deleted = serializers.ListField(child=serializers.IntegerField(),
+                                    read_only=True)
+    next_token = serializers.CharField(read_only=True, allow_null=True)
+    has_more = serializers.BooleanField(read_only=True)
+
+
+class RecipeStatsSerializer(serializers.ModelSerializer):
+    """Serializer for the recipe statistics of a user."""
+    average_cost = serializers.DecimalField(max_digits=14, decimal_places=2,
+                                            read_only=True)
+    median_time_taken = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = RecipeStats
+        fields = ['recipe_count', 'average_cost', 'total_time_taken',
+                  'median_time_taken']
+        read_only_fields = fields
+
+
+class RecipeAnalyticsSerializer(serializers.Serializer):
+    """Serializer for the cost and time analytics of recipes."""
+
+    def get_fields(self):
+        """Declare the fields here, as `global` is a Python keyword."""
+        return {
+            'user': serializers.DictField(read_only=True),
+            'global': serializers.DictField(read_only=True, allow_null=True),
+        }
@@ -0,0 +1,288 @@
+"""
+Similar recipes, by TF-IDF cosine similarity of their title and
+description.
+
+`manage.py build_similar_index` writes the L2-normalized TF-IDF vectors
+of every recipe as a sparse CSR matrix of NumPy arrays, with words
+hashed into N_FEATURES columns, rows sorted by (user, id). Workers
+memory-map the arrays, so they share one copy through the page cache,
+and score a recipe against the rows of its owner with a few vectorized
+operations.
+
+Builds go to a new directory, published by replacing the `current`
+symlink of SIMILAR_INDEX_DIR; workers load the new build at their next
+query. The build it replaced is kept until the next publish, for the
+workers that resolved the symlink just before.
+Builds store the word counts of the rows next to their weights, so the
+next build only counts the words of the recipes changed since, and
+recomputes the document frequencies and the weights of every row from
+the counts.
+Recipes written since the build, read from the (user, updated_at, id)
+index, are vectorized on the fly and replace their rows, so results
+follow the changes between builds.
+"""
+import json
+import os
+import re
+import shutil
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import Recipe
+from recipe.exceptions import SimilarIndexUnavailable
+
+N_FEATURES = 2 ** 18
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Rows read per round trip while building.
+CHUNK_SIZE = 2000
+# Margin of the build time, for the writes still committing at the build
+# and the clock differences between the servers.
+SETTLE_TIME = timedelta(seconds=2)
+
+ARRAYS = ['ids', 'users', 'versions', 'indptr', 'indices', 'data', 'idf',
+          'counts']
+TOKEN = re.compile(r'[a-z0-9]{2,}')
+
+# Index of this process, reloaded when the current build changes.
+_loaded = None
+
+
+def features(title, description):
+    """Return the sorted hashed words of a recipe and their counts."""
+    counts = Counter(
+        zlib.crc32(token.encode()) % N_FEATURES
+        for token in TOKEN.findall(f'{title} {description}'.lower()))
+    indices = np.fromiter(sorted(counts), dtype=np.int32, count=len(counts))
+    return indices, np.array([counts[i] for i in indices], dtype=np.float32)
+
+
+def weigh(indices, counts, idf):
+    """Return the L2-normalized TF-IDF weights of the features."""
+    data = (1 + np.log(counts)) * idf[indices]
+    norm = np.linalg.norm(data)
+    return indices, (data / norm if norm else data).astype(np.float32)
+
+
+def vectorize(title, description, idf):
+    """Return the TF-IDF vector of a recipe, as (indices, data)."""
+    return weigh(*features(title, description), idf)
+
+
+def densify(vector):
+    """Return a vector as a dense array."""
+    dense = np.zeros(N_FEATURES, dtype=np.float32)
+    dense[vector[0]] = vector[1]
+    return dense
+
+
+class SimilarIndex:
+    """Memory-mapped TF-IDF vectors of the recipes, by (user, id)."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as meta:
+            self.meta = json.load(meta)
+        self.built_at = datetime.fromisoformat(self.meta['built_at'])
+        for name in ARRAYS:
+            filename = os.path.join(path, f'{name}.npy')
+            # Builds written before the counts were stored have none.
+            setattr(self, name, np.load(filename, mmap_mode='r')
+                    if name != 'counts' or os.path.exists(filename) else None)
+
+    def user_rows(self, user_id):
+        """Return the first and last + 1 rows of the user."""
+        return (int(np.searchsorted(self.users, user_id, 'left')),
+                int(np.searchsorted(self.users, user_id, 'right')))
+
+    def row(self, position):
+        """Return the vector of a row, as (indices, data)."""
+        start, end = self.indptr[position], self.indptr[position + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def scores(self, dense, start, end):
+        """Return the cosine similarity of a dense vector to the rows."""
+        low, high = self.indptr[start], self.indptr[end]
+        products = self.data[low:high] * dense[self.indices[low:high]]
+        rows = np.repeat(np.arange(end - start),
+                         np.diff(self.indptr[start:end + 1]))
+        return np.bincount(rows, weights=products, minlength=end - start)
+
+
+def _current_path():
+    return os.path.join(settings.SIMILAR_INDEX_DIR, 'current')
+
+
+def current_index():
+    """Return the latest index, or None if none was built."""
+    global _loaded
+    for _ in range(2):
+        path = os.path.realpath(_current_path())
+        if not os.path.isdir(path):
+            return None
+        if _loaded is not None and _loaded.path == path:
+            return _loaded
+        try:
+            _loaded = SimilarIndex(path)
+            return _loaded
+        except FileNotFoundError:
+            # Removed by a publish since the symlink was resolved; the
+            # symlink already points to a newer build.
+            continue
+
+    raise SimilarIndexUnavailable()
+
+
+def similar_recipes(recipe, limit=DEFAULT_LIMIT):
+    """Return the (id, score) of the recipes of the owner most similar to
+    the recipe, best first."""
+    index = current_index()
+    if index is None:
+        raise SimilarIndexUnavailable()
+
+    changed = {
+        row['id']: row for row in Recipe.all_objects.filter(
+            user=recipe.user_id, updated_at__gt=index.built_at,
+        ).values('id', 'version', 'title', 'description', 'deleted_at')
+    }
+    start, end = index.user_rows(recipe.user_id)
+    ids = np.asarray(index.ids[start:end])
+    position = start + int(np.searchsorted(ids, recipe.id))
+    if (recipe.id not in changed and position < end
+            and index.ids[position] == recipe.id
+            and index.versions[position] == recipe.version):
+        vector = index.row(position)
+    else:
+        vector = vectorize(recipe.title, recipe.description, index.idf)
+
+    # Rows of the recipe and of the recipes written since the build are
+    # replaced by the current version of the latter.
+    dense = densify(vector)
+    scores = index.scores(dense, start, end)
+    keep = ~np.isin(ids, [recipe.id, *changed])
+    ids, scores = ids[keep], scores[keep]
+    fresh = [row for row in changed.values()
+             if row['deleted_at'] is None and row['id'] != recipe.id]
+    if fresh:
+        ids = np.concatenate([ids, [row['id'] for row in fresh]])
+        scores = np.concatenate([scores, [
+            float(np.dot(data, dense[indices])) for indices, data in (
+                vectorize(row['title'], row['description'], index.idf)
+                for row in fresh)
+        ]])
+
+    if len(ids) > limit:
+        best = np.argpartition(-scores, limit)[:limit]
+        ids, scores = ids[best], scores[best]
+    order = np.argsort(-scores, kind='stable')
+    return [(int(ids[i]), float(scores[i])) for i in order if scores[i] > 0]
+
+
+def build_index(full=False):
+    """
+    Write the vectors of every recipe to a new build and publish it.
+    Unless `full`, the word counts of the recipes unchanged since the
+    current build are reused. The document frequencies and weights are
+    recomputed from the counts of every recipe. Return the build path and
+    the number of recipes vectorized.
+    """
+    # Writes committing during the build are newer than built_at.
+    built_at = timezone.now() - SETTLE_TIME
+    previous = None if full else current_index()
+    if previous is not None and previous.counts is None:
+        previous = None
+    rows = list(Recipe.objects.order_by('user_id', 'id').values_list(
+        'id', 'user_id', 'version').iterator(chunk_size=CHUNK_SIZE))
+    count = len(rows)
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    users = np.array([row[1] for row in rows], dtype=np.int64)
+    versions = np.array([row[2] for row in rows], dtype=np.int64)
+    del rows
+
+    reused = np.zeros(count, dtype=bool)
+    positions = np.zeros(count, dtype=np.int64)
+    if previous is not None and len(previous.ids):
+        # Rows of the previous build with the same recipe version.
+        order = np.argsort(previous.ids)
+        found = np.searchsorted(np.asarray(previous.ids)[order], ids)
+        positions = order[np.minimum(found, len(order) - 1)]
+        reused = ((np.asarray(previous.ids)[positions] == ids)
+                  & (np.asarray(previous.users)[positions] == users)
+                  & (np.asarray(previous.versions)[positions] == versions))
+
+    changed = ids[~reused]
+    texts = {}
+    for start in range(0, len(changed), CHUNK_SIZE):
+        texts.update(
+            (recipe_id, (title, description))
+            for recipe_id, title, description in Recipe.all_objects.filter(
+                pk__in=changed[start:start + CHUNK_SIZE].tolist(),
+            ).values_list('id', 'title', 'description'))
+
+    counted = {recipe_id: features(*text)
+               for recipe_id, text in texts.items()}
+    indptr = np.zeros(count + 1, dtype=np.int64)
+    indices, counts = [], []
+    for position, recipe_id in enumerate(ids.tolist()):
+        if reused[position]:
+            row = positions[position]
+            low, high = previous.indptr[row], previous.indptr[row + 1]
+            words = previous.indices[low:high], previous.counts[low:high]
+        elif recipe_id in counted:
+            words = counted[recipe_id]
+        else:
+            # Deleted since its id was read.
+            words = (np.empty(0, dtype=np.int32),
+                     np.empty(0, dtype=np.float32))
+        indices.append(words[0])
+        counts.append(words[1])
+        indptr[position + 1] = indptr[position] + len(words[0])
+    indices = np.concatenate(indices or [np.empty(0, np.int32)])
+    counts = np.concatenate(counts or [np.empty(0, np.float32)])
+
+    # Every row has a feature at most once, so the document frequency of
+    # a feature is its number of entries.
+    frequencies = np.bincount(indices, minlength=N_FEATURES)
+    idf = (np.log((1 + count) / (1 + frequencies)) + 1).astype(np.float32)
+    data = (1 + np.log(counts)) * idf[indices]
+    rows = np.repeat(np.arange(count), np.diff(indptr))
+    norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=count))
+    data = (data / np.where(norms, norms, 1)[rows]).astype(np.float32)
+
+    path = os.path.join(settings.SIMILAR_INDEX_DIR, 'builds',
+                        f'{time.time_ns()}-{os.getpid()}')
+    os.makedirs(path)
+    arrays = {
+        'ids': ids, 'users': users, 'versions': versions, 'indptr': indptr,
+        'indices': indices, 'data': data, 'idf': idf, 'counts': counts,
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f'{name}.npy'), array)
+    with open(os.path.join(path, 'meta.json'), 'w') as meta:
+        json.dump({'built_at': built_at.isoformat(), 'recipes': count,
+                   'n_features': N_FEATURES}, meta)
+
+    _publish(path)
+    return path, len(counted)
+
+
+def _publish(path):
+    """Point the current symlink to the build and remove the builds
+    older than the one it replaces. Workers still mapping them keep their
+    data until they reload."""
+    replaced = os.path.realpath(_current_path())
+    link = f'{_current_path()}.{os.getpid()}'
+    os.symlink(path, link)
+    os.replace(link, _current_path())
+
+    builds = os.path.dirname(path)
+    for name in os.listdir(builds):
+        if os.path.join(builds, name) not in (path, replaced):
+            shutil.rmtree(os.path.join(builds, name), ignore_errors=True)
@@ -0,0 +1,84 @@
+"""
+Changes feed of the recipes, for offline sync clients.
+
+Every write of a recipe takes the next change number of its owner, and
+deletions only set deleted_at, so the recipes changed since a change are
+those with a greater number, read from the (user, change_number, id)
+index. The numbers come from a counter of the user locked until the
+write commits, so changes commit in the order of their numbers and none
+can appear behind a position already returned; no clock is involved.
+
+The sync token encodes the (change_number, id) position of the last
+change returned, and its updated_at to expire tokens older than the
+tombstone retention. It is opaque to clients and only ever moves
+forward.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from rest_framework.exceptions import ValidationError
+
+from core.models import Recipe
+from recipe.exceptions import SyncTokenExpired
+
+PAGE_SIZE = 500
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_token(recipe):
+    """Return the sync token of the position of a recipe change."""
+    return (f'{recipe.change_number}-{recipe.id}-'
+            f'{(recipe.updated_at - EPOCH) // MICROSECOND}')
+
+
+def decode_token(token):
+    """Return the (change_number, id, updated_at) position of a sync
+    token."""
+    try:
+        change_number, recipe_id, microseconds = (
+            int(part) for part in token.split('-'))
+        updated_at = EPOCH + microseconds * MICROSECOND
+    except (ValueError, OverflowError):
+        if token.count('-') == 1:
+            # Token of the former feed, ordered by updated_at.
+            raise SyncTokenExpired()
+        raise ValidationError({'since': 'Invalid sync token.'})
+
+    return change_number, recipe_id, updated_at
+
+
+def tombstone_cutoff():
+    """Return the time before which tombstones may have been purged."""
+    return timezone.now() - timedelta(
+        days=settings.RECIPE_TOMBSTONE_RETENTION_DAYS)
+
+
+def changes(user, token=None, limit=None):
+    """
+    Return the recipes of the user changed after the token, deleted ones
+    included, in (change_number, id) order, and the token following them.
+    A missing token starts from the beginning.
+    """
+    limit = limit or PAGE_SIZE
+    recipes = Recipe.all_objects.filter(user=user)
+    if token:
+        change_number, recipe_id, updated_at = decode_token(token)
+        if updated_at < tombstone_cutoff():
+            raise SyncTokenExpired()
+        recipes = recipes.filter(
+            Q(change_number__gt=change_number)
+            | Q(change_number=change_number, id__gt=recipe_id))
+
+    page = list(recipes.prefetch_related('tags', 'ingredients').order_by(
+        'change_number', 'id')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    if page:
+        token = encode_token(page[-1])
+
+    return page, token, has_more
@@ -0,0 +1,19 @@
+"""
+Background jobs of the recipe app.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from core.jobs import enqueue_once, job
+from recipe import analytics
+
+
+@job
+def refresh_global_analytics(every=None):
+    """Refresh the global analytics snapshot. With `every` (seconds),
+    schedule the next refresh after that delay, unless one is queued."""
+    analytics.refresh_global_analytics()
+    if every:
+        enqueue_once(refresh_global_analytics, every=every,
+                     run_at=timezone.now() + timedelta(seconds=every))
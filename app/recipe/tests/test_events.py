@@ -0,0 +1,184 @@
+"""
+Tests for the recipe change events.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest import skipIf
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from recipe import events
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+def payload(user, recipe_id, event='updated', version=1):
+    return json.dumps({'user': user, 'event': event, 'id': recipe_id,
+                       'version': version})
+
+
+async def collect(scope, messages, until):
+    """Run the events application until `until` returns True for the
+    messages sent, then disconnect the client."""
+    sent = []
+    disconnect = asyncio.Event()
+
+    async def receive():
+        await disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+        for value in messages(sent):
+            events.hub.dispatch(value)
+        if until(sent):
+            disconnect.set()
+
+    await asyncio.wait_for(
+        events.events_application(scope, receive, send), timeout=5)
+    return sent
+
+
+def http_scope(method='GET', token=b'Token abc'):
+    return {'type': 'http', 'method': method, 'path': events.EVENTS_PATH,
+            'headers': [(b'authorization', token)]}
+
+
+class ChangeHubTests(SimpleTestCase):
+    """Test the fan out of the notifications."""
+
+    def test_dispatch_to_subscribers_of_user(self):
+        """Test notifications only reach the subscribers of their user."""
+        hub = events.ChangeHub()
+
+        async def run():
+            async with hub.subscribe(1) as first, \
+                    hub.subscribe(1) as second, hub.subscribe(2) as other:
+                hub.dispatch(payload(1, 10))
+                return first.get_nowait(), second.get_nowait(), other.empty()
+
+        first, second, other_empty = asyncio.run(run())
+
+        expected = {'event': 'updated', 'id': 10, 'version': 1}
+        self.assertEqual(first, expected)
+        self.assertEqual(second, expected)
+        self.assertTrue(other_empty)
+        self.assertEqual(hub.subscribers, {})
+
+    @patch('recipe.events.QUEUE_SIZE', 2)
+    def test_slow_subscriber_resyncs(self):
+        """Test a full queue is replaced by a resync event."""
+        hub = events.ChangeHub()
+
+        async def run():
+            async with hub.subscribe(1) as queue:
+                for recipe_id in range(3):
+                    hub.dispatch(payload(1, recipe_id))
+                return [queue.get_nowait() for _ in range(queue.qsize())]
+
+        self.assertEqual(asyncio.run(run()), [{'event': 'resync'}])
+
+    def test_format_event(self):
+        """Test events are formatted as server-sent events."""
+        body = events.format_event({'event': 'deleted', 'id': 3,
+                                    'version': 2})
+
+        self.assertEqual(
+            body,
+            b'event: deleted\n'
+            b'data: {"event": "deleted", "id": 3, "version": 2}\n\n')
+
+
+class EventsApplicationTests(SimpleTestCase):
+    """Test the server-sent events endpoint."""
+
+    def test_rejects_other_methods(self):
+        """Test only GET is allowed."""
+        sent = asyncio.run(collect(http_scope('POST'), lambda sent: (),
+                                   lambda sent: True))
+
+        self.assertEqual(sent[0]['status'], 405)
+
+    @patch('recipe.events.authenticate', return_value=None)
+    def test_rejects_invalid_token(self, authenticate):
+        """Test a missing or invalid token is refused."""
+        sent = asyncio.run(collect(http_scope(token=b'Token bad'),
+                                   lambda sent: (), lambda sent: True))
+
+        self.assertEqual(sent[0]['status'], 401)
+        authenticate.assert_called_once_with(b'Token bad')
+
+    @patch('recipe.events.authenticate',
+           return_value=SimpleNamespace(pk=1))
+    def test_streams_events_of_user(self, authenticate):
+        """Test the events of the user are streamed."""
+        def messages(sent):
+            # Publish once the stream has started.
+            if len(sent) == 2:
+                return [payload(2, 20), payload(1, 10, 'created')]
+            return []
+
+        sent = asyncio.run(collect(http_scope(), messages,
+                                   lambda sent: len(sent) == 3))
+
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'),
+                      sent[0]['headers'])
+        self.assertEqual(sent[1]['body'], b'retry: 5000\n\n')
+        self.assertEqual(sent[2]['body'], events.format_event(
+            {'event': 'created', 'id': 10, 'version': 1}))
+        self.assertEqual(events.hub.subscribers, {})
+
+    @patch('recipe.events.HEARTBEAT_INTERVAL', 0.01)
+    @patch('recipe.events.authenticate',
+           return_value=SimpleNamespace(pk=1))
+    def test_heartbeat_while_idle(self, authenticate):
+        """Test idle streams receive heartbeats."""
+        sent = asyncio.run(collect(http_scope(), lambda sent: (),
+                                   lambda sent: len(sent) == 3))
+
+        self.assertEqual(sent[2]['body'], b': heartbeat\n\n')
+
+
+class PublishTests(TestCase):
+    """Test the recipe writes publish their changes."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @skipIf(connection.vendor == 'postgresql', 'Postgres uses NOTIFY.')
+    def test_write_publishes_on_commit(self):
+        """Test creating a recipe publishes an event once committed."""
+        with patch.object(events.hub, 'dispatch_threadsafe') as dispatch, \
+                self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(RECIPE_URL, {
+                'title': 'Soup', 'time_taken': 5, 'cost': '1.50'})
+
+        dispatch.assert_called_once_with(
+            payload(self.user.id, res.data['id'], 'created'))
+
+    @skipIf(connection.vendor == 'postgresql', 'Postgres uses NOTIFY.')
+    def test_update_without_changes_not_published(self):
+        """Test an update leaving the recipe unchanged publishes nothing."""
+        recipe = Recipe.objects.create(user=self.user, title='Soup',
+                                       time_taken=5, cost_cents=150)
+        url = reverse('recipe:recipe-detail', args=[recipe.id])
+
+        with patch.object(events.hub, 'dispatch_threadsafe') as dispatch, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {'title': 'Soup'})
+            self.client.patch(url, {'title': 'Stew'})
+
+        dispatch.assert_called_once_with(
+            payload(self.user.id, recipe.id, 'updated', version=2))
@@ -1,20 +1,34 @@
 """
 Tests for recipe app.
 """
+from datetime import timedelta
 from decimal import Decimal
-
-from django.test import TestCase
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
-from core.models import Recipe
+from core.models import Ingredient, Recipe, RecipeStats, Tag
 
-from rest_framework import status
+from rest_framework import serializers, status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
-from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe.exceptions import EditConflict
+from recipe.serializers import (CentsField, RecipeSerializer,
+                                RecipeDetailSerializer)
 
 RECIPE_URL = reverse('recipe:recipe-list')
+STATS_URL = reverse('recipe:stats')
+ANALYTICS_URL = reverse('recipe:analytics')
+CHANGES_URL = reverse('recipe:recipe-changes')
 
 
 def recipe_detail_url(recipe_id):
@@ -57,12 +71,20 @@ class PublicRecipeApiTests(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_stats_auth_required(self):
+        """Test authorization is required to fetch recipe statistics."""
+        response = self.client.get(STATS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
 
 class PrivateRecipeApiTests(TestCase):
     """Test Authorized Recipe APIs."""
 
     def setUp(self):
         """Setting up pre-requisites for test cases."""
+        # IDs are reused between tests, each starting with no fragment.
+        caches['recipe_fragments'].clear()
 
         self.client = APIClient()
         self.user = create_user(email='test@example.com',
@@ -148,6 +170,64 @@ class PrivateRecipeApiTests(TestCase):
         self.assertEqual(recipe.link, payload['link'])
         self.assertEqual(recipe.user, self.user)
 
+    def test_partial_update_writes_changed_fields_only(self):
+        """Test a patch updates only changed columns, once."""
+        recipe = create_recipe(self.user)
+        url = recipe_detail_url(recipe.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, {'title': 'New title'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], '"2"')
+        updates = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('UPDATE "core_recipe"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"title"', updates[0])
+        self.assertNotIn('"description"', updates[0])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'New title')
+        self.assertEqual(recipe.version, 2)
+
+    def test_update_without_changes_skips_write(self):
+        """Test an update with unchanged values does not write."""
+        recipe = create_recipe(self.user)
+        url = recipe_detail_url(recipe.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, {'title': recipe.title})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any(query['sql'].startswith('UPDATE "core_recipe"')
+                             for query in queries.captured_queries))
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.version, 1)
+
+    def test_update_with_stale_if_match_fails(self):
+        """Test updating an outdated version returns 412."""
+        recipe = create_recipe(self.user)
+        url = recipe_detail_url(recipe.id)
+        self.client.patch(url, {'title': 'First edit'}, HTTP_IF_MATCH='"1"')
+
+        response = self.client.patch(url, {'title': 'Second edit'},
+                                     HTTP_IF_MATCH='"1"')
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_412_PRECONDITION_FAILED)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'First edit')
+
+    def test_concurrent_update_conflicts(self):
+        """Test an update racing with another write returns 409."""
+        recipe = create_recipe(self.user)
+        serializer = RecipeDetailSerializer(recipe, data={'title': 'Mine'},
+                                            partial=True)
+        serializer.is_valid(raise_exception=True)
+        Recipe.objects.filter(pk=recipe.pk).update(version=2)
+
+        with self.assertRaises(EditConflict):
+            serializer.save()
+
     def test_update_user_returns_error(self):
         """Test Updating a new user to the recipe which is already
         connected to the user will give an error."""
@@ -191,6 +271,11 @@ class PrivateRecipeApiTests(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(Recipe.objects.filter(id=recipe.id).exists())
+        tombstone = Recipe.all_objects.get(id=recipe.id)
+        self.assertIsNotNone(tombstone.deleted_at)
+        self.assertEqual(tombstone.version, 2)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_delete_other_user_recipe(self):
         """Test deleting other users recipe should give error."""
@@ -203,3 +288,393 @@ class PrivateRecipeApiTests(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+    def test_stats_without_recipes(self):
+        """Test statistics of a user without recipes are empty."""
+        response = self.client.get(STATS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['recipe_count'], 0)
+        self.assertIsNone(response.data['average_cost'])
+        self.assertIsNone(response.data['median_time_taken'])
+
+    def test_stats_follow_recipe_writes(self):
+        """Test statistics are updated on create, update and delete."""
+        for time_taken, cost in [(10, '2.00'), (20, '4.00'), (60, '9.00')]:
+            payload = {'title': 'Recipe', 'time_taken': time_taken,
+                       'cost': cost}
+            response = self.client.post(RECIPE_URL, payload)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        recipe_id = response.data['id']
+
+        response = self.client.get(STATS_URL)
+        self.assertEqual(response.data['recipe_count'], 3)
+        self.assertEqual(response.data['average_cost'], '5.00')
+        self.assertEqual(response.data['total_time_taken'], 90)
+        self.assertEqual(response.data['median_time_taken'], 20)
+
+        self.client.patch(recipe_detail_url(recipe_id), {'time_taken': 30})
+        response = self.client.get(STATS_URL)
+        self.assertEqual(response.data['total_time_taken'], 60)
+        self.assertEqual(response.data['median_time_taken'], 20)
+
+        self.client.delete(recipe_detail_url(recipe_id))
+        response = self.client.get(STATS_URL)
+        self.assertEqual(response.data['recipe_count'], 2)
+        self.assertEqual(response.data['average_cost'], '3.00')
+        self.assertEqual(response.data['median_time_taken'], 15)
+
+
+class CentsFieldTests(SimpleTestCase):
+    """Test serializing costs stored in cents."""
+
+    def test_representation_matches_decimal_field(self):
+        """Test cents are formatted like the decimal amounts."""
+        field = CentsField()
+        decimal_field = serializers.DecimalField(max_digits=5,
+                                                 decimal_places=2)
+
+        for cents in [0, 5, 50, 525, 99999, -105]:
+            self.assertEqual(field.to_representation(cents),
+                             decimal_field.to_representation(
+                                 Decimal(cents) / 100))
+
+    def test_internal_value_in_cents(self):
+        """Test decimal amounts are validated and stored in cents."""
+        field = CentsField()
+
+        self.assertEqual(field.to_internal_value('10.2'), 1020)
+        self.assertEqual(field.to_internal_value(3), 300)
+        with self.assertRaises(serializers.ValidationError):
+            field.to_internal_value('1.234')
+        with self.assertRaises(serializers.ValidationError):
+            field.to_internal_value('1000.00')
+
+
+class RecipeTagsApiTests(TestCase):
+    """Test the tags and ingredients of recipes."""
+
+    def setUp(self):
+        # IDs are reused between tests, each starting with no fragment.
+        caches['recipe_fragments'].clear()
+        self.client = APIClient()
+        self.user = create_user(email='test@example.com',
+                                password='testPassword')
+        self.client.force_authenticate(self.user)
+
+    def test_create_recipe_with_tags_and_ingredients(self):
+        """Test creating a recipe creates the missing tags and reuses the
+        existing ones."""
+        breakfast = Tag.objects.create(user=self.user, name='Breakfast')
+        payload = {
+            'title': 'Pancakes', 'time_taken': 20, 'cost': '3.50',
+            'tags': [{'name': 'Breakfast'}, {'name': 'Sweet'},
+                     {'name': 'Sweet'}],
+            'ingredients': [{'name': 'Flour'}, {'name': 'Milk'}],
+        }
+
+        response = self.client.post(RECIPE_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertIn(breakfast, recipe.tags.all())
+        self.assertEqual({tag['name'] for tag in response.data['tags']},
+                         {'Breakfast', 'Sweet'})
+        self.assertEqual(
+            set(recipe.ingredients.values_list('name', flat=True)),
+            {'Flour', 'Milk'})
+
+    def test_list_query_count_independent_of_page_size(self):
+        """Test listing recipes with tags does not query per recipe."""
+        tags = [Tag.objects.create(user=self.user, name=name)
+                for name in ('Vegan', 'Quick')]
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+
+        def create_recipes(count):
+            for _ in range(count):
+                recipe = create_recipe(self.user)
+                recipe.tags.set(tags)
+                recipe.ingredients.add(salt)
+
+        create_recipes(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(RECIPE_URL)
+        create_recipes(20)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(RECIPE_URL)
+
+        self.assertEqual(len(response.data), 22)
+        self.assertEqual(len(response.data[0]['tags']), 2)
+        self.assertEqual(len(few.captured_queries),
+                         len(many.captured_queries))
+
+    def test_filter_by_tags(self):
+        """Test filtering recipes by tag IDs returns each match once."""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        quick = Tag.objects.create(user=self.user, name='Quick')
+        both = create_recipe(self.user, title='Salad')
+        both.tags.set([vegan, quick])
+        only_quick = create_recipe(self.user, title='Toast')
+        only_quick.tags.add(quick)
+        create_recipe(self.user, title='Roast')
+
+        response = self.client.get(RECIPE_URL,
+                                   {'tags': f'{vegan.id},{quick.id}'})
+
+        self.assertEqual([recipe['id'] for recipe in response.data],
+                         [only_quick.id, both.id])
+
+    def test_filter_by_invalid_tags(self):
+        """Test tag filters must be lists of IDs."""
+        response = self.client.get(RECIPE_URL, {'tags': 'vegan'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_update_tags_bumps_version(self):
+        """Test replacing the tags of a recipe is versioned, and sending
+        the same tags again does not write."""
+        recipe = create_recipe(self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Old'))
+        url = recipe_detail_url(recipe.id)
+
+        response = self.client.patch(url, {'tags': [{'name': 'New'}]},
+                                     format='json')
+        unchanged = self.client.patch(url, {'tags': [{'name': 'New'}]},
+                                      format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([tag['name'] for tag in response.data['tags']],
+                         ['New'])
+        self.assertEqual(unchanged.data['version'], 2)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.version, 2)
+        self.assertEqual(list(recipe.tags.values_list('name', flat=True)),
+                         ['New'])
+
+
+class RecipeFragmentsTests(TestCase):
+    """Test assembling the recipe list from cached fragments."""
+
+    def setUp(self):
+        caches['recipe_fragments'].clear()
+        self.client = APIClient()
+        self.user = create_user(email='test@example.com',
+                                password='testPassword')
+        self.client.force_authenticate(self.user)
+        self.recipes = [create_recipe(self.user, title=f'Recipe {i}')
+                        for i in range(3)]
+        self.recipes[0].tags.add(
+            Tag.objects.create(user=self.user, name='Vegan'))
+
+    def test_body_matches_rendered_list(self):
+        """Test the assembled body is the JSON of the whole list."""
+        self.client.get(RECIPE_URL)
+        res = self.client.get(RECIPE_URL)
+
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
+        expected = JSONRenderer().render(
+            RecipeSerializer(recipes, many=True).data)
+        self.assertEqual(res.content, expected)
+        self.assertEqual(res['Content-Type'], 'application/json')
+
+    def test_cached_list_reads_versions_only(self):
+        """Test a cached list only queries the IDs and versions."""
+        self.client.get(RECIPE_URL)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(len(res.data), 3)
+        self.assertEqual(len(queries.captured_queries), 1)
+
+    def test_write_renders_new_version(self):
+        """Test an updated recipe is rendered again, not the others."""
+        self.client.get(RECIPE_URL)
+        recipe = self.recipes[1]
+        self.client.patch(recipe_detail_url(recipe.id), {'title': 'New'})
+
+        with patch('recipe.fragments.JSONRenderer.render',
+                   autospec=True, side_effect=JSONRenderer.render) as render:
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual([item['title'] for item in res.data],
+                         ['Recipe 2', 'New', 'Recipe 0'])
+
+    def test_indented_json(self):
+        """Test other renderings decode the assembled body."""
+        res = self.client.get(RECIPE_URL,
+                              HTTP_ACCEPT='application/json; indent=2')
+
+        self.assertIn(b'\n  {', res.content)
+        self.assertEqual(len(res.json()), 3)
+
+
+class RecipeChangesApiTests(TestCase):
+    """Test the changes feed of sync clients."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='test@example.com',
+                                password='testPassword')
+        self.client.force_authenticate(self.user)
+
+    def test_first_sync_lists_every_recipe(self):
+        """Test syncing without a token returns every recipe."""
+        recipes = [create_recipe(self.user) for _ in range(3)]
+        create_recipe(create_user(email='other@example.com',
+                                  password='testPassword'))
+
+        response = self.client.get(CHANGES_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['changes']],
+            [recipe.id for recipe in recipes])
+        self.assertEqual(response.data['deleted'], [])
+        self.assertFalse(response.data['has_more'])
+        self.assertTrue(response.data['next_token'])
+
+    def test_changes_since_token(self):
+        """Test only the recipes changed since the token are returned,
+        with the deleted ones as tombstones."""
+        updated, deleted, unchanged = [create_recipe(self.user)
+                                       for _ in range(3)]
+        token = self.client.get(CHANGES_URL).data['next_token']
+
+        self.client.patch(recipe_detail_url(updated.id), {'title': 'New'})
+        self.client.delete(recipe_detail_url(deleted.id))
+        created = self.client.post(RECIPE_URL, {
+            'title': 'Created', 'time_taken': 5, 'cost': '1.00'})
+        response = self.client.get(CHANGES_URL, {'since': token})
+
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['changes']],
+            [updated.id, created.data['id']])
+        self.assertEqual(response.data['changes'][0]['title'], 'New')
+        self.assertEqual(response.data['deleted'], [deleted.id])
+        again = self.client.get(
+            CHANGES_URL, {'since': response.data['next_token']})
+        self.assertEqual(again.data['changes'], [])
+        self.assertEqual(again.data['next_token'],
+                         response.data['next_token'])
+
+    @patch('recipe.sync.PAGE_SIZE', 2)
+    def test_changes_paginated(self):
+        """Test the changes are returned in pages."""
+        recipes = [create_recipe(self.user) for _ in range(3)]
+
+        first = self.client.get(CHANGES_URL)
+        second = self.client.get(CHANGES_URL,
+                                 {'since': first.data['next_token']})
+
+        self.assertTrue(first.data['has_more'])
+        self.assertFalse(second.data['has_more'])
+        self.assertEqual(
+            [recipe['id'] for recipe in
+             first.data['changes'] + second.data['changes']],
+            [recipe.id for recipe in recipes])
+
+    def test_changes_in_write_order(self):
+        """Test the changes are ordered by the change number taken by
+        each write, not by recipe."""
+        first, second = create_recipe(self.user), create_recipe(self.user)
+        self.client.patch(recipe_detail_url(first.id), {'title': 'New'})
+
+        response = self.client.get(CHANGES_URL)
+
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['changes']],
+            [second.id, first.id])
+
+    def test_invalid_token(self):
+        """Test malformed tokens are rejected."""
+        response = self.client.get(CHANGES_URL, {'since': 'yesterday'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_token(self):
+        """Test tokens older than the tombstone retention expire."""
+        recipe = create_recipe(self.user)
+        Recipe.objects.filter(id=recipe.id).update(
+            updated_at=timezone.now() - timedelta(days=365))
+        token = self.client.get(CHANGES_URL).data['next_token']
+
+        response = self.client.get(CHANGES_URL, {'since': token})
+
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+    def test_former_token_expired(self):
+        """Test tokens of the feed ordered by updated_at expire."""
+        response = self.client.get(CHANGES_URL,
+                                   {'since': '1700000000000000-1'})
+
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+
+class RecipeAnalyticsApiTests(TestCase):
+    """Test the recipe analytics API."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = create_user(email='test@example.com',
+                                password='testPassword')
+        self.client.force_authenticate(self.user)
+
+    def test_user_analytics(self):
+        """Test summary statistics of the user's recipes."""
+        for time_taken in [10, 20, 30, 40]:
+            create_recipe(self.user, time_taken=time_taken,
+                          cost=Decimal('2.50'))
+        create_recipe(create_user(email='other@example.com',
+                                  password='otherPassword'), time_taken=500)
+
+        response = self.client.get(ANALYTICS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        time_taken = response.data['user']['time_taken']
+        self.assertEqual(time_taken['count'], 4)
+        self.assertEqual(time_taken['max'], 40)
+        self.assertEqual(time_taken['mean'], 25)
+        self.assertEqual(time_taken['quantiles']['p50'], 25)
+        self.assertEqual(sum(time_taken['histogram']['counts']), 4)
+        self.assertEqual(response.data['user']['cost']['mean'], 2.5)
+
+    def test_user_analytics_invalidated_on_write(self):
+        """Test cached analytics are dropped when a recipe is written."""
+        response = self.client.get(ANALYTICS_URL)
+        self.assertEqual(response.data['user']['cost']['count'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(RECIPE_URL, {'title': 'Recipe',
+                                          'time_taken': 5, 'cost': '1.00'})
+        response = self.client.get(ANALYTICS_URL)
+
+        self.assertEqual(response.data['user']['cost']['count'], 1)
+
+    def test_user_analytics_follow_stats_version(self):
+        """Test cached analytics are keyed by the statistics version, so
+        writes served by other processes are seen."""
+        self.client.get(ANALYTICS_URL)
+
+        recipe = create_recipe(self.user)
+        RecipeStats.objects.apply(self.user,
+                                  added=(recipe.cost_cents, recipe.time_taken))
+        response = self.client.get(ANALYTICS_URL)
+
+        self.assertEqual(response.data['user']['cost']['count'], 1)
+
+    def test_global_analytics_from_snapshot(self):
+        """Test global analytics are served from the refreshed snapshot."""
+        create_recipe(self.user)
+        response = self.client.get(ANALYTICS_URL)
+        self.assertIsNone(response.data['global'])
+
+        call_command('refresh_recipe_analytics', stdout=StringIO())
+        create_recipe(self.user)
+        response = self.client.get(ANALYTICS_URL)
+
+        self.assertEqual(response.data['global']['cost']['count'], 1)
+        self.assertIn('refreshed_at', response.data['global'])
@@ -0,0 +1,181 @@
+"""
+Tests for the similar recipes.
+"""
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from recipe import similar
+
+
+def similar_url(recipe_id):
+    """Create and return the similar recipes URL of a recipe."""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+def create_recipe(user, title, description=''):
+    return Recipe.objects.create(user=user, title=title,
+                                 description=description, time_taken=10,
+                                 cost=Decimal('2.50'))
+
+
+class VectorizeTests(SimpleTestCase):
+    """Test the TF-IDF vectors."""
+
+    def test_vector_is_normalized(self):
+        """Test vectors have a unit norm and sorted features."""
+        idf = np.ones(similar.N_FEATURES, dtype=np.float32)
+
+        indices, data = similar.vectorize('Tomato soup',
+                                          'Tomato, basil and a soup.', idf)
+
+        self.assertAlmostEqual(float(np.linalg.norm(data)), 1, places=5)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertEqual(len(indices), 4)
+
+
+@patch('recipe.similar.SETTLE_TIME', timedelta(0))
+class SimilarRecipesApiTests(TestCase):
+    """Test the similar recipes endpoint."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(SIMILAR_INDEX_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.directory = directory.name
+
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='testpass123')
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.soup = create_recipe(self.user, 'Tomato soup',
+                                  'A soup of tomato and basil.')
+        self.cream = create_recipe(self.user, 'Cream of tomato soup',
+                                   'Tomato soup with cream.')
+        self.cake = create_recipe(self.user, 'Chocolate cake',
+                                  'Dark chocolate sponge.')
+        create_recipe(other, 'Tomato soup', 'A soup of tomato and basil.')
+
+    def _similar(self, recipe, **params):
+        res = self.client.get(similar_url(recipe.id), params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item['title'] for item in res.data]
+
+    def test_unavailable_before_build(self):
+        """Test a 503 is returned until the index is built."""
+        res = self.client.get(similar_url(self.soup.id))
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_similar_recipes_of_user(self):
+        """Test only similar recipes of the user are returned."""
+        call_command('build_similar_index', stdout=StringIO())
+
+        res = self.client.get(similar_url(self.soup.id))
+
+        self.assertEqual([item['id'] for item in res.data], [self.cream.id])
+        self.assertGreater(res.data[0]['score'], 0)
+        self.assertLessEqual(res.data[0]['score'], 1)
+
+    def test_changes_since_build(self):
+        """Test recipes written since the build are compared as they are
+        now, and deleted ones are left out."""
+        call_command('build_similar_index', stdout=StringIO())
+
+        self.client.patch(reverse('recipe:recipe-detail',
+                                  args=[self.cake.id]),
+                          {'title': 'Tomato cake'})
+        self.client.delete(reverse('recipe:recipe-detail',
+                                   args=[self.cream.id]))
+
+        self.assertEqual(self._similar(self.soup), ['Tomato cake'])
+
+    def test_changed_recipe_is_vectorized(self):
+        """Test a recipe changed since the build is compared as it is."""
+        call_command('build_similar_index', stdout=StringIO())
+
+        self.client.patch(reverse('recipe:recipe-detail',
+                                  args=[self.cake.id]),
+                          {'title': 'Chocolate tomato soup'})
+
+        self.assertEqual(self._similar(self.cake),
+                         ['Tomato soup', 'Cream of tomato soup'])
+
+    def test_limit(self):
+        """Test the number of recipes returned is limited."""
+        call_command('build_similar_index', stdout=StringIO())
+        create_recipe(self.user, 'Quick tomato soup')
+        call_command('build_similar_index', stdout=StringIO())
+
+        self.assertEqual(len(self._similar(self.soup, limit=1)), 1)
+        res = self.client.get(similar_url(self.soup.id), {'limit': 'x'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_incremental_build(self):
+        """Test rebuilding only vectorizes the changed recipes and keeps
+        the results of a full build."""
+        call_command('build_similar_index', stdout=StringIO())
+        self.client.patch(reverse('recipe:recipe-detail',
+                                  args=[self.cake.id]),
+                          {'title': 'Tomato cake'})
+
+        out = StringIO()
+        call_command('build_similar_index', stdout=out)
+        incremental = self._similar(self.soup)
+        call_command('build_similar_index', full=True, stdout=StringIO())
+
+        self.assertIn('1 recipe(s) vectorized', out.getvalue())
+        self.assertEqual(incremental, self._similar(self.soup))
+        self.assertEqual(
+            len(os.listdir(os.path.join(self.directory, 'builds'))), 2)
+
+    def test_incremental_build_updates_frequencies(self):
+        """Test incremental builds recompute the document frequencies
+        and weights of the unchanged recipes."""
+        call_command('build_similar_index', stdout=StringIO())
+        before = similar.current_index().idf.copy()
+        create_recipe(self.user, 'Tomato salad')
+
+        call_command('build_similar_index', stdout=StringIO())
+        incremental = similar.current_index()
+        incremental_data = incremental.data.copy()
+        call_command('build_similar_index', full=True, stdout=StringIO())
+        full = similar.current_index()
+
+        self.assertFalse(np.array_equal(before, incremental.idf))
+        np.testing.assert_array_equal(incremental.idf, full.idf)
+        np.testing.assert_allclose(incremental_data, full.data)
+
+    def test_removed_build_reloaded(self):
+        """Test a build removed after the symlink was resolved is
+        replaced by the current one."""
+        call_command('build_similar_index', stdout=StringIO())
+        removed = similar.current_index().path
+        call_command('build_similar_index', full=True, stdout=StringIO())
+        current = similar.current_index().path
+        resolved = iter([removed, current])
+
+        with patch('recipe.similar.os.path.realpath',
+                   side_effect=lambda path: next(resolved)), \
+                patch('recipe.similar._loaded', None):
+            os.remove(os.path.join(removed, 'meta.json'))
+            self.assertEqual(similar.current_index().path, current)
@@ -13,5 +13,8 @@ router.register('recipes', views.RecipeViewSet)
 app_name = 'recipe'
 
 urlpatterns = [
+    path('stats/', views.RecipeStatsView.as_view(), name='stats'),
+    path('analytics/', views.RecipeAnalyticsView.as_view(),
+         name='analytics'),
     path('', include(router.urls))
 ]
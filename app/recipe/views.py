@@ -1,25 +1,120 @@
 """
 Views for Recipe APIs.
 """
-from rest_framework import viewsets
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from rest_framework import generics, viewsets
 from rest_framework.authentication import TokenAuthentication
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.models import Recipe, RecipeStats, next_recipe_change
+from recipe import (analytics, events, fragments, serializers, similar,
+                    sync)
+from recipe.exceptions import PreconditionFailed
+
+
+def stats_values(recipe):
+    """Return the recipe values tracked by the statistics."""
+    return recipe.cost_cents, recipe.time_taken
+
+
+def record_create(recipe):
+    """Add a new recipe to the statistics of its owner and publish it.
+    Must run in the transaction of the write."""
+    RecipeStats.objects.apply(recipe.user, added=stats_values(recipe))
+    events.publish(recipe, 'created')
+
+
+def record_update(recipe, removed, version):
+    """Fold an update of a recipe into the statistics of its owner and
+    publish it, unless the version stayed the same. `removed` are the
+    statistics values and `version` the version before the update."""
+    RecipeStats.objects.apply(recipe.user, added=stats_values(recipe),
+                              removed=removed)
+    if recipe.version != version:
+        events.publish(recipe, 'updated')
+
 
-from core.models import Recipe
-from recipe import serializers
+@transaction.atomic
+def delete_recipe(recipe):
+    """Mark a recipe deleted, keeping it as a tombstone for the sync
+    clients, remove it from the owner's statistics and publish it."""
+    now = timezone.now()
+    Recipe.objects.filter(pk=recipe.pk, user=recipe.user_id).update(
+        deleted_at=now, updated_at=now, version=F('version') + 1,
+        change_number=next_recipe_change(recipe.user_id))
+    recipe.version += 1
+    RecipeStats.objects.apply(recipe.user, removed=stats_values(recipe))
+    events.publish(recipe, 'deleted')
+
+
+def params_to_ints(name, value):
+    """Return the integers of a comma separated query parameter."""
+    try:
+        return [int(part) for part in value.split(',')]
+    except ValueError:
+        raise ValidationError(
+            {name: 'Expected a comma separated list of IDs.'})
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """View for managing recipe APIs."""
     serializer_class = serializers.RecipeDetailSerializer
-    queryset = Recipe.objects.all()
+    # Tags and ingredients of a page are fetched in one query each.
+    queryset = Recipe.objects.prefetch_related('tags', 'ingredients')
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         """Modifying default queryset to retrieve recipe information
-        only for authenticated users."""
-        return self.queryset.filter(user=self.request.user).order_by('-id')
+        only for authenticated users, with the tags and ingredients
+        given in the query parameters."""
+        queryset = self.queryset.filter(user=self.request.user)
+        tags = self.request.query_params.get('tags')
+        ingredients = self.request.query_params.get('ingredients')
+        if tags:
+            queryset = queryset.filter(
+                tags__id__in=params_to_ints('tags', tags))
+        if ingredients:
+            queryset = queryset.filter(
+                ingredients__id__in=params_to_ints('ingredients',
+                                                   ingredients))
+        if tags or ingredients:
+            # A recipe matching several IDs is joined once per match.
+            queryset = queryset.distinct()
+
+        return queryset.order_by('-id')
+
+    def get_serializer_context(self):
+        """Pass the recipe version of the If-Match header, if any."""
+        context = super().get_serializer_context()
+        if_match = self.request.headers.get('If-Match', '*').strip()
+        if self.action in ('update', 'partial_update') and if_match != '*':
+            # Accept both strong ("3") and weak (W/"3") entity tags.
+            version = if_match.removeprefix('W/').strip('"')
+            if not version.isdigit():
+                raise PreconditionFailed()
+            context['if_match'] = int(version)
+
+        return context
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Expose the recipe version as the ETag of single recipes."""
+        response = super().finalize_response(request, response, *args,
+                                             **kwargs)
+        # The list body is rendered already, without decoding its data.
+        data = (getattr(response, 'data', None)
+                if self.action != 'list' else None)
+        if isinstance(data, dict) and 'version' in data:
+            response['ETag'] = f'"{data["version"]}"'
+
+        return response
 
     def get_serializer_class(self):
         """Return the serializer class depending on user request type."""
@@ -28,6 +123,94 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return self.serializer_class
 
+    def list(self, request, *args, **kwargs):
+        """List the recipes, assembled from their cached JSON."""
+        queryset = self.filter_queryset(self.get_queryset())
+        return fragments.RenderedJSONResponse(fragments.render_list(
+            queryset, self.get_serializer_class(),
+            self.get_serializer_context()))
+
+    @transaction.atomic
     def perform_create(self, serializer):
         """Create a new recipe."""
-        serializer.save(user=self.request.user)
+        record_create(serializer.save(user=self.request.user))
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        """Update a recipe and the statistics of its owner, publishing
+        the change unless nothing changed."""
+        removed = stats_values(serializer.instance)
+        version = serializer.instance.version
+        record_update(serializer.save(), removed, version)
+
+    def perform_destroy(self, instance):
+        """Mark a recipe deleted, keeping it as a tombstone for the sync
+        clients, and remove it from the owner's statistics."""
+        delete_recipe(instance)
+
+    @action(detail=False, url_path='changes',
+            serializer_class=serializers.RecipeChangesSerializer)
+    def changes(self, request):
+        """Return the recipes created, updated or deleted since the sync
+        token, and the token to pass next time."""
+        recipes, token, has_more = sync.changes(
+            request.user, request.query_params.get('since'))
+        serializer = self.get_serializer({
+            'changes': [recipe for recipe in recipes
+                        if recipe.deleted_at is None],
+            'deleted': [recipe.id for recipe in recipes
+                        if recipe.deleted_at is not None],
+            'next_token': token,
+            'has_more': has_more,
+        })
+        return Response(serializer.data)
+
+    @action(detail=True, serializer_class=serializers.SimilarRecipeSerializer)
+    def similar(self, request, pk=None):
+        """Return the recipes of the user most similar to the recipe,
+        by title and description, best first."""
+        limit = request.query_params.get('limit', similar.DEFAULT_LIMIT)
+        try:
+            limit = min(int(limit), similar.MAX_LIMIT)
+        except ValueError:
+            raise ValidationError({'limit': 'Expected an integer.'})
+        if limit < 1:
+            raise ValidationError({'limit': 'Expected a positive integer.'})
+
+        matches = similar.similar_recipes(self.get_object(), limit)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in matches])
+        results = []
+        for recipe_id, score in matches:
+            if recipe_id in recipes:
+                recipes[recipe_id].score = score
+                results.append(recipes[recipe_id])
+
+        return Response(self.get_serializer(results, many=True).data)
+
+
+class RecipeStatsView(generics.RetrieveAPIView):
+    """Return the recipe statistics of the authenticated user."""
+    serializer_class = serializers.RecipeStatsSerializer
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_object(self):
+        """Retrieve the statistics row of the authenticated user."""
+        return RecipeStats.objects.for_user(self.request.user)
+
+
+class RecipeAnalyticsView(APIView):
+    """Return cost and time analytics for the user and all recipes."""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    serializer_class = serializers.RecipeAnalyticsSerializer
+
+    def get(self, request):
+        """Return the cached user analytics and the global snapshot."""
+        serializer = self.serializer_class({
+            'user': analytics.user_analytics(request.user),
+            'global': analytics.global_analytics(),
+        })
+        return Response(serializer.data)
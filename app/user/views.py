@@ -1,25 +1,32 @@
 """
 Views for the user API.
 """
+from django.contrib.auth import get_user_model
+
 from rest_framework import generics, authentication, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from core import concurrency
+from core.deletion import request_deletion
+
 from .serializers import UserSerializer, AuthTokenSerializer
 
 
 class CreateUserView(generics.CreateAPIView):
     """Create a new user in the system."""
     serializer_class = UserSerializer
+    load_priority = concurrency.LOW
 
 
 class CreateTokenView(ObtainAuthToken):
     """Create a new auth token for the user."""
     serializer_class = AuthTokenSerializer
+    load_priority = concurrency.LOW
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     """Manage the authenticated user data."""
     serializer_class = UserSerializer
     authentication_classes = [authentication.TokenAuthentication]
@@ -28,3 +35,8 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         """Retrieve and return the authenticated user."""
         return self.request.user
+
+    def perform_destroy(self, instance):
+        """Deactivate the account now; its data is deleted in batches
+        by a background job."""
+        request_deletion(get_user_model().objects.filter(pk=instance.pk))